@@ -0,0 +1,32 @@
+import hashlib
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+PAYMENT_AUTHORIZATION_KEY_PREFIX = 'payment_authorization'
+
+
+def payment_authorization_key(user_id, payer: dict) -> str:
+    # the payer's details are hashed so they aren't kept in the key in plain text
+    payer_digest = hashlib.sha256(f'{payer["name"]}\n{payer["email"].lower()}'.encode('utf-8')).hexdigest()
+
+    return f'{PAYMENT_AUTHORIZATION_KEY_PREFIX}:{user_id}:{payer_digest}'
+
+
+def get_cached_payment_authorization(user_id, payer: dict) -> Optional[dict]:
+    """
+    Returns the authorization URL last issued to the user for the payer, as long as its PKCE state is still cached.
+    The state is dropped once it's exchanged for the user's token, so an authorization that has been completed is
+    never handed out again.
+    """
+    authorization = cache.get(payment_authorization_key(user_id, payer))
+
+    if authorization is None or cache.get(authorization['state']) is None:
+        return None
+
+    return authorization
+
+
+def cache_payment_authorization(user_id, payer: dict, authorization: dict) -> None:
+    cache.set(payment_authorization_key(user_id, payer), authorization, settings.PAYMENT_AUTHORIZATION_REUSE_TTL)
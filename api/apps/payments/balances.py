@@ -0,0 +1,81 @@
+from typing import Optional
+
+import structlog
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from api.utils.redis import get_redis_connection
+
+log = structlog.get_logger('api_requests')
+
+WALLET_BALANCE_KEY_PREFIX = 'wallet_balance'
+
+# the cached balance is only ever replaced by a later version of it, so a write that loses a race to a later ledger
+# posting (or a read-through that loaded the wallet before that posting) can't bring back the older balance
+CACHE_WALLET_BALANCE_SCRIPT = """
+local version = tonumber(redis.call('HGET', KEYS[1], 'version'))
+
+if version and version >= tonumber(ARGV[1]) then
+    return 0
+end
+
+redis.call(
+    'HSET', KEYS[1], 'version', ARGV[1], 'balance', ARGV[2], 'available', ARGV[3], 'currency', ARGV[4],
+    'last_activity', ARGV[5]
+)
+redis.call('EXPIRE', KEYS[1], ARGV[6])
+
+return 1
+"""
+
+
+def wallet_balance_key(user_id) -> str:
+    return f'{WALLET_BALANCE_KEY_PREFIX}:{user_id}'
+
+
+def serialize_wallet_balance(wallet) -> dict:
+    return {
+        'version': wallet.version,
+        'balance': f'{wallet.amount.amount:.2f}',
+        'available': f'{wallet.available.amount:.2f}',
+        'currency': f'{wallet.amount.currency}',
+        'last_activity': f'{wallet.modified}',
+    }
+
+
+def cache_wallet_balance(user_id, wallet_balance: dict) -> bool:
+    """
+    Stores a wallet's balance for ``WALLET_BALANCE_CACHE_TTL`` seconds, unless a later version of it has already been
+    cached.
+
+    Returns whether the cached balance was replaced.
+    """
+    connection = get_redis_connection()
+
+    return bool(connection.register_script(CACHE_WALLET_BALANCE_SCRIPT)(
+        keys=[wallet_balance_key(user_id)],
+        args=[
+            wallet_balance['version'],
+            wallet_balance['balance'],
+            wallet_balance['available'],
+            wallet_balance['currency'],
+            wallet_balance['last_activity'],
+            settings.WALLET_BALANCE_CACHE_TTL,
+        ]
+    ))
+
+
+def get_cached_wallet_balance(user_id) -> Optional[dict]:
+    try:
+        cached_balance = get_redis_connection().hgetall(wallet_balance_key(user_id))
+    except RedisError as e:
+        log.error(event='get_cached_wallet_balance', message=f'Could not read cached wallet balance: {e}')
+        return None
+
+    if not cached_balance:
+        return None
+
+    wallet_balance = {key.decode('utf-8'): value.decode('utf-8') for key, value in cached_balance.items()}
+    wallet_balance['version'] = int(wallet_balance['version'])
+
+    return wallet_balance
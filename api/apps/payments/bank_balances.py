@@ -0,0 +1,181 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional
+
+import structlog
+from django.conf import settings
+from django.utils import timezone
+from redis.exceptions import LockError, RedisError
+
+from api.apps.payments.deposits import apply_user_token
+from api.apps.payments.linked_accounts import client_linked_account
+from api.apps.payments.models import BankAccount, BankAccountToken
+from api.utils.libs.stitch.base import BaseAPI
+from api.utils.libs.stitch.linkpay.linkpay import LinkPay
+from api.utils.redis import get_redis_connection
+
+log = structlog.get_logger('api_requests')
+
+BANK_BALANCE_KEY_PREFIX = 'bank_balance'
+
+
+def bank_balance_key(account_pk) -> str:
+    return f'{BANK_BALANCE_KEY_PREFIX}:{account_pk}'
+
+
+def bank_balances_lock_key(user_id) -> str:
+    return f'{BANK_BALANCE_KEY_PREFIX}:user:{user_id}:lock'
+
+
+class BalanceLookup(NamedTuple):
+    user_token: Optional[dict]
+    balance: Optional[dict]
+    error: Optional[Exception]
+
+
+def request_account_balance(refresh_token: str) -> BalanceLookup:
+    """
+    Refreshes the linked account's user token and fetches the account's balance from LinkPay without touching the
+    database, so that several of these can safely run concurrently.
+
+    Like :func:`api.apps.payments.deposits.request_payment_initiation`, errors are returned rather than raised along
+    with the refreshed user token, which still needs to be saved.
+    """
+    user_token = None
+
+    try:
+        user_token = BaseAPI().refresh_user_credentials(refresh_token)
+        bank_account = LinkPay(token=user_token['access_token']).get_linked_account_balance()
+
+        return BalanceLookup(user_token, serialize_bank_balance(bank_account), None)
+    except Exception as e:
+        return BalanceLookup(user_token, None, e)
+
+
+def serialize_bank_balance(bank_account: dict) -> dict:
+    return {
+        'current_balance': bank_account['currentBalance']['quantity'],
+        'available_balance': bank_account['availableBalance']['quantity'],
+        'currency': bank_account['availableBalance']['currency'],
+        'fetched_at': timezone.now().isoformat(),
+    }
+
+
+def get_cached_bank_balances(account_pks: List[int]) -> Dict[int, dict]:
+    """
+    Returns the cached balances of the given accounts with a single ``MGET``, leaving out the accounts whose balance
+    isn't cached.
+    """
+    try:
+        cached_balances = get_redis_connection().mget([bank_balance_key(account_pk) for account_pk in account_pks])
+    except RedisError as e:
+        log.error(event='get_cached_bank_balances', message=f'Could not read cached bank balances: {e}')
+        return {}
+
+    return {
+        account_pk: json.loads(cached_balance)
+        for account_pk, cached_balance in zip(account_pks, cached_balances) if cached_balance is not None
+    }
+
+
+def cache_bank_balances(bank_balances: Dict[int, dict]) -> None:
+    try:
+        with get_redis_connection().pipeline(transaction=False) as pipeline:
+            for account_pk, bank_balance in bank_balances.items():
+                pipeline.set(
+                    bank_balance_key(account_pk), json.dumps(bank_balance), ex=settings.BANK_BALANCE_CACHE_TTL
+                )
+            pipeline.execute()
+    except RedisError as e:
+        log.error(event='cache_bank_balances', message=f'Could not cache bank balances: {e}')
+
+
+def fetch_bank_balances(account_pks: List[int]) -> Dict[int, dict]:
+    """
+    Fetches the balances of the given accounts from Stitch and caches them, running the Stitch round-trips concurrently
+    in a pool of at most ``BANK_BALANCE_CONCURRENCY`` threads. Each linked account has its own user token, so each of
+    them takes its own GraphQL request.
+
+    The refreshed user tokens are saved with a single ``bulk_update``. Accounts whose balance couldn't be fetched are
+    left out.
+    """
+    account_tokens = list(BankAccountToken.objects.filter(account_id__in=account_pks).order_by('account_id'))
+
+    if not account_tokens:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=min(len(account_tokens), settings.BANK_BALANCE_CONCURRENCY)) as executor:
+        balance_lookups = list(executor.map(
+            request_account_balance, [account_token.refresh_token for account_token in account_tokens]
+        ))
+
+    refreshed_tokens = []
+    bank_balances = {}
+    now = timezone.now()
+
+    for account_token, balance_lookup in zip(account_tokens, balance_lookups):
+        if balance_lookup.user_token is not None:
+            apply_user_token(account_token, balance_lookup.user_token)
+            account_token.modified = now
+            refreshed_tokens.append(account_token)
+
+        if balance_lookup.error is not None:
+            log.error(
+                event='fetch_bank_balances', account=account_token.account_id,
+                message=f'Could not fetch the account balance: {balance_lookup.error}'
+            )
+            continue
+
+        bank_balances[account_token.account_id] = balance_lookup.balance
+
+    BankAccountToken.objects.bulk_update(refreshed_tokens, ['token_id', 'refresh_token', 'modified'])
+    cache_bank_balances(bank_balances)
+
+    return bank_balances
+
+
+def get_bank_balances(user_id) -> List[dict]:
+    """
+    Returns the balance of each of the user's linked accounts, from the Redis cache where possible.
+
+    The balances that aren't cached are fetched under a per-user lock, so concurrent requests for the same user
+    coalesce into a single fetch: the requests that had to wait on the lock pick up the balances it cached. Accounts
+    whose balance couldn't be fetched are returned with a ``None`` balance.
+    """
+    linked_accounts = BankAccount.objects.get_linked_accounts(user_id)
+    account_pks = [linked_account['id'] for linked_account in linked_accounts]
+    bank_balances = get_cached_bank_balances(account_pks)
+    missing_pks = [account_pk for account_pk in account_pks if account_pk not in bank_balances]
+
+    if missing_pks:
+        lock = get_redis_connection().lock(
+            bank_balances_lock_key(user_id),
+            timeout=settings.BANK_BALANCE_LOCK_TIMEOUT,
+            blocking_timeout=settings.BANK_BALANCE_LOCK_TIMEOUT
+        )
+
+        try:
+            acquired = lock.acquire()
+        except RedisError as e:
+            log.error(event='get_bank_balances', message=f'Could not lock the bank balances fetch: {e}')
+            acquired = False
+
+        try:
+            # a concurrent request might have fetched them while we were waiting on the lock
+            bank_balances.update(get_cached_bank_balances(missing_pks))
+            missing_pks = [account_pk for account_pk in missing_pks if account_pk not in bank_balances]
+
+            if missing_pks:
+                bank_balances.update(fetch_bank_balances(missing_pks))
+        finally:
+            if acquired:
+                try:
+                    lock.release()
+                except (LockError, RedisError):
+                    # the lock expired while the balances were being fetched, so there is nothing left to release
+                    pass
+
+    return [
+        {**client_linked_account(linked_account), 'balance': bank_balances.get(linked_account['id'])}
+        for linked_account in linked_accounts
+    ]
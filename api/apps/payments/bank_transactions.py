@@ -0,0 +1,167 @@
+from typing import List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from redis.exceptions import LockError
+
+from api.apps.payments.deposits import apply_user_token
+from api.apps.payments.models import BankAccount, BankAccountToken, BankTransaction, BankTransactionSync
+from api.utils.libs.stitch.base import BaseAPI
+from api.utils.libs.stitch.linkpay.linkpay import LinkPay
+from api.utils.redis import get_redis_connection
+
+BANK_TRANSACTION_SYNC_KEY_PREFIX = 'bank_transaction_sync'
+
+# the fields refreshed when a transaction that has already been synced comes through again
+BANK_TRANSACTION_UPDATE_FIELDS = (
+    'amount', 'amount_currency', 'running_balance', 'running_balance_currency', 'description', 'reference', 'date',
+    'modified',
+)
+
+
+def bank_transaction_sync_lock_key(account_pk) -> str:
+    return f'{BANK_TRANSACTION_SYNC_KEY_PREFIX}:{account_pk}:lock'
+
+
+def build_bank_transaction(account_pk, node: dict) -> BankTransaction:
+    running_balance = node.get('runningBalance') or {}
+
+    return BankTransaction(
+        account_id=account_pk,
+        bank_transaction_id=node['id'],
+        amount=node['amount']['quantity'],
+        amount_currency=node['amount']['currency'],
+        running_balance=running_balance.get('quantity'),
+        running_balance_currency=running_balance.get('currency'),
+        description=node.get('description') or '',
+        reference=node.get('reference') or '',
+        date=node['date'],
+    )
+
+
+def get_bank_transaction_sync_capacity() -> int:
+    """
+    Returns how many syncs fit in the waves of one scheduling interval, so that every sync one run queues has started
+    by the time the next run comes along.
+    """
+    schedule_interval = settings.CELERY_BEAT_SCHEDULE['schedule-bank-transaction-syncs']['schedule']
+    waves = max(int(schedule_interval.total_seconds() // settings.BANK_TRANSACTION_SYNC_WAVE_SECONDS), 1)
+
+    return waves * settings.BANK_TRANSACTION_SYNC_CONCURRENCY
+
+
+def get_due_bank_transaction_syncs() -> List[int]:
+    """
+    Returns the linked accounts that haven't been synced in the last ``BANK_TRANSACTION_SYNC_INTERVAL``, the ones that
+    have never been synced first, up to as many as fit in one scheduling interval.
+
+    Accounts that have been queued and not synced since are left out until a whole ``BANK_TRANSACTION_SYNC_INTERVAL``
+    has gone by, in case their sync was lost, so that the same account is never queued again while it's waiting.
+    """
+    synced_before = timezone.now() - settings.BANK_TRANSACTION_SYNC_INTERVAL
+    never_synced = Q(banktransactionsync__isnull=True) | Q(banktransactionsync__synced_at__isnull=True)
+    not_queued = Q(banktransactionsync__queued_at__isnull=True) | Q(banktransactionsync__queued_at__lt=synced_before)
+
+    return list(
+        BankAccount.objects
+        .filter(never_synced | Q(banktransactionsync__synced_at__lt=synced_before))
+        .filter(not_queued)
+        .order_by(F('banktransactionsync__synced_at').asc(nulls_first=True), 'id')
+        .values_list('id', flat=True)[:get_bank_transaction_sync_capacity()]
+    )
+
+
+def mark_bank_transaction_syncs_queued(account_pks: List[int]) -> None:
+    # accounts that have never been synced don't have a sync state to mark yet
+    BankTransactionSync.objects.bulk_create(
+        [BankTransactionSync(account_id=account_pk) for account_pk in account_pks], ignore_conflicts=True
+    )
+
+    now = timezone.now()
+    BankTransactionSync.objects.filter(account_id__in=account_pks).update(queued_at=now, modified=now)
+
+
+def sync_account_transactions(account_pk) -> Optional[int]:
+    """
+    Fetches the linked account's transactions from Stitch, starting from the cursor the last sync stopped at, and
+    upserts them on their bank transaction ID.
+
+    Each page is saved along with the cursor after it in one transaction, so a sync that fails part of the way through
+    is picked up from the last page it saved rather than starting over. At most ``BANK_TRANSACTION_SYNC_MAX_PAGES``
+    pages are fetched per sync, the rest are left for the next one.
+
+    Returns the number of transactions synced, or ``None`` if the account is already being synced.
+    """
+    lock = get_redis_connection().lock(
+        bank_transaction_sync_lock_key(account_pk), timeout=settings.BANK_TRANSACTION_SYNC_LOCK_TIMEOUT
+    )
+
+    if not lock.acquire(blocking=False):
+        return None
+
+    sync_state, _ = BankTransactionSync.objects.get_or_create(account_id=account_pk)
+    synced = 0
+
+    try:
+        account_token = BankAccountToken.objects.get(account_id=account_pk)
+        user_token = BaseAPI().refresh_user_credentials(account_token.refresh_token)
+        # the previous refresh token can't be used again, so the new one is saved before anything else can fail
+        apply_user_token(account_token, user_token)
+        account_token.save()
+
+        linkpay = LinkPay(token=user_token['access_token'])
+
+        for _ in range(settings.BANK_TRANSACTION_SYNC_MAX_PAGES):
+            page = linkpay.get_linked_account_transactions(
+                first=settings.BANK_TRANSACTION_SYNC_PAGE_SIZE, after=sync_state.cursor or None
+            )
+            bank_transactions = [build_bank_transaction(account_pk, edge['node']) for edge in page['edges']]
+
+            with transaction.atomic():
+                BankTransaction.objects.bulk_create(
+                    bank_transactions,
+                    update_conflicts=True,
+                    unique_fields=['account_id', 'bank_transaction_id'],
+                    update_fields=BANK_TRANSACTION_UPDATE_FIELDS
+                )
+
+                sync_state.cursor = page['pageInfo']['endCursor'] or sync_state.cursor
+                sync_state.save(update_fields=['cursor', 'modified'])
+
+            synced += len(bank_transactions)
+
+            if not page['pageInfo']['hasNextPage']:
+                break
+
+        sync_state.synced_at = timezone.now()
+        sync_state.last_error = ''
+        sync_state.save(update_fields=['synced_at', 'last_error', 'modified'])
+    except Exception as e:
+        # recorded as synced all the same, so an account that keeps failing waits for the next interval like the rest
+        sync_state.synced_at = timezone.now()
+        sync_state.last_error = f'{e}'
+        sync_state.save(update_fields=['synced_at', 'last_error', 'modified'])
+
+        raise
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            # the lock expired while the account was being synced, so there is nothing left to release
+            pass
+
+    return synced
+
+
+def get_bank_transaction_sync_countdowns(account_pks: List[int]) -> List[int]:
+    """
+    Spreads the syncs of the given accounts out in waves of ``BANK_TRANSACTION_SYNC_CONCURRENCY`` accounts, each
+    starting ``BANK_TRANSACTION_SYNC_WAVE_SECONDS`` after the last, so that a large number of accounts falling due at
+    once doesn't fill every worker or burst through Stitch's rate limits.
+    """
+    return [
+        (index // settings.BANK_TRANSACTION_SYNC_CONCURRENCY) * settings.BANK_TRANSACTION_SYNC_WAVE_SECONDS
+        for index in range(len(account_pks))
+    ]
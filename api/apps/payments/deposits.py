@@ -0,0 +1,275 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Optional, Tuple
+
+import structlog
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from djmoney.money import Money
+
+from api.apps.payments.events import publish_payment_event
+from api.apps.payments.limits import release_deposit
+from api.apps.payments.models import PaymentRequest, BankAccountToken, PaymentRequestEvent
+from api.apps.users.models import User
+from api.utils.code_generator import generate_code
+from api.utils.enums import PaymentRequestEventType, PaymentRequestStatus
+from api.utils.libs.stitch.base import BaseAPI
+from api.utils.libs.stitch.errors import LinkPayError
+from api.utils.libs.stitch.linkpay.linkpay import LinkPay
+from api.utils.response_cache import bump_data_version
+
+log = structlog.get_logger('api_requests')
+
+
+def build_payment_request_data(amount: Money) -> dict:
+    existing_payer_refs = PaymentRequest.objects.values_list('payer_reference', flat=True)
+    existing_ben_refs = PaymentRequest.objects.values_list('beneficiary_reference', flat=True)
+
+    # max for payerReference is 12, so remove 2 xters for the default "PW" prefix
+    payer_ref = generate_code(existing=existing_payer_refs, size=10)
+    # max for beneficiaryReference is 20, so remove 2 xters for the default "PW" prefix
+    beneficiary_ref = generate_code(existing=existing_ben_refs, size=18)
+
+    external_reference = uuid.uuid4()
+    expiry = datetime.utcnow() + timedelta(minutes=15)
+
+    return {
+        'input': {
+            'amount': {
+                'quantity': f'{amount.amount}',
+                'currency': f'{amount.currency}'
+            },
+            'payerReference': payer_ref,
+            'beneficiaryReference': beneficiary_ref,
+            'externalReference': f'{external_reference}',
+            'expireAt': expiry.isoformat(sep='T', timespec='seconds')
+        }
+    }
+
+
+def build_payment_request(payment_request: dict, stitch_ref: str, user: User) -> PaymentRequest:
+    return PaymentRequest(
+        user=user,
+        transaction_ref=payment_request.get('input').get('externalReference'),
+        payer_reference=payment_request.get('input').get('payerReference'),
+        beneficiary_reference=payment_request.get('input').get('beneficiaryReference'),
+        stitch_ref=stitch_ref,
+        amount=payment_request.get('input').get('amount').get('quantity'),
+        amount_currency=payment_request.get('input').get('amount').get('currency')
+    )
+
+
+def create_payment_request(payment_request: dict, stitch_ref: str, user: User) -> PaymentRequest:
+    payment_request = build_payment_request(payment_request, stitch_ref, user)
+    payment_request.save()
+
+    payment_request.paymentrequestevent_set.create(
+        event_type=PaymentRequestEventType.INITIATED.name
+    )
+
+    return payment_request
+
+
+class PaymentInitiation(NamedTuple):
+    user_token: Optional[dict]
+    response: Optional[dict]
+    error: Optional[Exception]
+
+
+def request_payment_initiation(refresh_token: str, payment_request_data: dict) -> PaymentInitiation:
+    """
+    Refreshes the linked account's user token and initiates the payment on LinkPay without touching the database, so
+    that several of these can safely run concurrently.
+
+    Errors are returned rather than raised, along with the refreshed user token which still needs to be saved as the
+    previous refresh token can't be used again.
+    """
+    user_token = None
+
+    try:
+        user_token = BaseAPI().refresh_user_credentials(refresh_token)
+        log.debug(event='initiate_payment', message='Token refreshed successfully')
+
+        response = LinkPay(token=user_token['access_token']).initiate_user_payment(payment_request_data)
+
+        return PaymentInitiation(user_token, response, None)
+    except Exception as e:
+        return PaymentInitiation(user_token, None, e)
+
+
+def apply_user_token(account_token: BankAccountToken, user_token: dict) -> None:
+    account_token.token_id = user_token['id_token']
+    account_token.refresh_token = user_token['refresh_token']
+
+
+def apply_payment_initiation(payment_request: PaymentRequest,
+                             payment_initiation: PaymentInitiation) -> List[PaymentRequestEvent]:
+    """
+    Records the outcome of a payment initiation on the payment request, which is left for the caller to save along
+    with the returned events.
+
+    If Stitch requires the user to interact with their bank first, the URL they should be sent to is set in
+    ``user_interaction_url``. Any other failure marks the payment request as failed.
+    """
+    logger = log.bind(event='initiate_payment', transaction_ref=f'{payment_request.transaction_ref}')
+    error = payment_initiation.error
+
+    if error is None:
+        payment_request.stitch_ref = payment_initiation.response.get('userInitiatePayment', {}) \
+            .get('paymentInitiation', {}) \
+            .get('id', 'error-getting-ref')
+
+        return []
+
+    events = []
+
+    if isinstance(error, LinkPayError):
+        error_context = error.extras
+
+        payment_request.stitch_ref = error_context.get('id', '')
+
+        if (error.get_codes()) == 'USER_INTERACTION_REQUIRED':
+            events.append(PaymentRequestEvent(
+                payment_request=payment_request,
+                event_type=PaymentRequestEventType.USER_INTERACTION.name,
+                event_description=error.detail
+            ))
+
+            if error_context:
+                redirect_uri = settings.LINKPAY_USER_INTERACTION_URI
+                user_interaction_uri = error_context.get('userInteractionUrl')
+
+                payment_request.user_interaction_url = f'{user_interaction_uri}?redirect_uri={redirect_uri}'
+
+                return events
+
+            logger.error(message='Could not find error message context to extract user interaction URI')
+
+        failure_reason = error.get_full_details()
+    else:
+        failure_reason = error
+
+    payment_request.failed()
+    events.append(PaymentRequestEvent(
+        payment_request=payment_request,
+        event_type=PaymentRequestEventType.FAILED.name,
+        event_description=f'{failure_reason}'
+    ))
+
+    return events
+
+
+def initiate_payment(payment_request: PaymentRequest, payment_request_data: dict,
+                     account_token: BankAccountToken) -> PaymentRequest:
+    """
+    Refreshes the linked account's user token and initiates the payment request on LinkPay, recording the outcome
+    on the payment request.
+
+    Failures are re-raised once the payment request has been marked as failed.
+    """
+    payment_initiation = request_payment_initiation(account_token.refresh_token, payment_request_data)
+
+    if payment_initiation.user_token is not None:
+        apply_user_token(account_token, payment_initiation.user_token)
+        account_token.save()
+
+    events = apply_payment_initiation(payment_request, payment_initiation)
+
+    with transaction.atomic():
+        payment_request.save()
+        PaymentRequestEvent.objects.bulk_create(events)
+
+        if events:
+            publish_payment_event(payment_request, events[-1].event_type)
+
+    if payment_request.status == PaymentRequestStatus.FAILED.name:
+        release_deposit(payment_request)
+        raise payment_initiation.error
+
+    return payment_request
+
+
+def initiate_bulk_payments(user: User, deposits: List[Tuple[BankAccountToken, Money]]) \
+        -> List[Tuple[PaymentRequest, Optional[Exception]]]:
+    """
+    Initiates a deposit from each of the given linked accounts, running the Stitch round-trips concurrently in a
+    pool of at most ``BULK_DEPOSIT_CONCURRENCY`` threads so that the whole batch takes about as long as its slowest
+    deposit.
+
+    As with single deposits, the payment requests are created (with a single ``bulk_create``) before Stitch is
+    called, so that a webhook arriving straight away finds them. The refreshed tokens are saved as soon as the calls
+    return, and the outcomes are then recorded with a ``bulk_update``. Failed deposits don't affect the rest of the
+    batch, and are returned along with the error they failed with.
+    """
+    payment_requests_data = [build_payment_request_data(amount) for _, amount in deposits]
+    payment_requests = [
+        build_payment_request(payment_request_data, '', user) for payment_request_data in payment_requests_data
+    ]
+
+    with transaction.atomic():
+        PaymentRequest.objects.bulk_create(payment_requests)
+        PaymentRequestEvent.objects.bulk_create([
+            PaymentRequestEvent(payment_request=payment_request, event_type=PaymentRequestEventType.INITIATED.name)
+            for payment_request in payment_requests
+        ])
+        # bulk_create doesn't send post_save
+        bump_data_version(user.id)
+
+    with ThreadPoolExecutor(max_workers=min(len(deposits), settings.BULK_DEPOSIT_CONCURRENCY)) as executor:
+        payment_initiations = list(executor.map(
+            request_payment_initiation,
+            [account_token.refresh_token for account_token, _ in deposits],
+            payment_requests_data
+        ))
+
+    refreshed_tokens = []
+    now = timezone.now()
+
+    for (account_token, _), payment_initiation in zip(deposits, payment_initiations):
+        if payment_initiation.user_token is not None:
+            apply_user_token(account_token, payment_initiation.user_token)
+            account_token.modified = now
+            refreshed_tokens.append(account_token)
+
+    # the previous refresh tokens can't be used again, so the new ones are saved before anything else can fail
+    BankAccountToken.objects.bulk_update(refreshed_tokens, ['token_id', 'refresh_token', 'modified'])
+
+    events = []
+    outcomes = []
+
+    for payment_request, payment_initiation in zip(payment_requests, payment_initiations):
+        payment_request.modified = now
+        outcome_events = apply_payment_initiation(payment_request, payment_initiation)
+        events.extend(outcome_events)
+
+        if outcome_events:
+            outcomes.append((payment_request, outcome_events[-1].event_type))
+
+    failed_refs = [
+        payment_request.transaction_ref for payment_request in payment_requests
+        if payment_request.status == PaymentRequestStatus.FAILED.name
+    ]
+
+    with transaction.atomic():
+        # the status is only moved on for the failed ones, so a webhook that has already settled a payment request
+        # isn't overwritten
+        PaymentRequest.objects.bulk_update(payment_requests, ['stitch_ref', 'user_interaction_url', 'modified'])
+        PaymentRequest.objects \
+            .filter(transaction_ref__in=failed_refs, status=PaymentRequestStatus.NEW.name) \
+            .update(status=PaymentRequestStatus.FAILED.name, modified=now)
+        PaymentRequestEvent.objects.bulk_create(events)
+        bump_data_version(user.id)
+
+        for payment_request, event_type in outcomes:
+            publish_payment_event(payment_request, event_type)
+
+            if payment_request.status == PaymentRequestStatus.FAILED.name:
+                release_deposit(payment_request)
+
+    return [
+        (payment_request, payment_initiation.error if payment_request.status == PaymentRequestStatus.FAILED.name
+         else None)
+        for payment_request, payment_initiation in zip(payment_requests, payment_initiations)
+    ]
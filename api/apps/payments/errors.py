@@ -6,4 +6,22 @@ class InsufficientBalance(IntegrityError):
     Raised when a wallet has insufficient balance
 
     Subclasses :mod:`django.db.IntegrityError` so that it is automatically rolled-back during the transaction lifecycle
-    """
\ No newline at end of file
+    """
+
+
+class InvalidTransfer(IntegrityError):
+    """
+    Raised when a transfer doesn't have both a sender and a different recipient wallet
+    """
+
+
+class HoldNotActive(IntegrityError):
+    """
+    Raised when capturing or releasing a balance hold that has already been captured or released
+    """
+
+
+class CurrencyMismatch(IntegrityError):
+    """
+    Raised when an amount isn't in the currency of the wallet it's applied to
+    """
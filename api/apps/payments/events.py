@@ -0,0 +1,43 @@
+import json
+
+import structlog
+from django.db import transaction
+from redis.exceptions import RedisError
+
+from api.apps.payments.models import PaymentRequest
+from api.utils.redis import get_redis_connection
+
+log = structlog.get_logger('api_requests')
+
+PAYMENT_EVENTS_CHANNEL_PREFIX = 'payment_events'
+
+
+def payment_events_channel(user_id) -> str:
+    return f'{PAYMENT_EVENTS_CHANNEL_PREFIX}:{user_id}'
+
+
+def serialize_payment_event(payment_request: PaymentRequest, event_type: str) -> dict:
+    return {
+        'transaction_ref': f'{payment_request.transaction_ref}',
+        'status': payment_request.status,
+        'event': event_type,
+        'user_interaction_url': payment_request.user_interaction_url or None,
+    }
+
+
+def publish_payment_event(payment_request: PaymentRequest, event_type: str) -> None:
+    """
+    Publishes a payment request's status change to its user's Redis channel once the current transaction commits, so
+    that clients listening on the payment events stream never hear about changes that were rolled back.
+    """
+    channel = payment_events_channel(payment_request.user_id)
+    message = json.dumps(serialize_payment_event(payment_request, event_type))
+
+    def publish():
+        try:
+            get_redis_connection().publish(channel, message)
+        except RedisError as e:
+            # clients fall back to the deposit status endpoint, so a lost notification shouldn't fail the payment
+            log.error(event='publish_payment_event', message=f'Could not publish payment event: {e}')
+
+    transaction.on_commit(publish)
@@ -0,0 +1,122 @@
+from typing import List, Optional
+
+from django.db import connection, transaction
+from django.utils import timezone
+from djmoney.money import Money
+
+from api.apps.payments.errors import CurrencyMismatch, HoldNotActive, InsufficientBalance
+from api.apps.payments.models import BalanceHold, Transaction, Wallet
+from api.apps.payments.models.wallet import write_through_wallet_balance
+from api.utils.enums import BalanceHoldStatus
+
+WALLET_BALANCE_COLUMNS = ('amount', 'amount_currency', 'reserved', 'reserved_currency', 'version', 'modified')
+
+
+def update_wallet_balance(
+    user_id, assignments: str, assignment_params: List, condition: str = '', condition_params: List = ()
+) -> Optional[Wallet]:
+    """
+    Applies ``assignments`` to the wallet's balance with a single UPDATE, as long as the wallet meets ``condition``.
+    Unlike locking the wallet with ``select_for_update`` and saving it back, the row is only locked from this statement
+    until the calling transaction commits, with no round-trips in between. The updated balance is written through to
+    the wallet balance cache on commit.
+
+    Returns the wallet's updated balance, or ``None`` if it didn't meet the condition.
+    """
+    table = connection.ops.quote_name(Wallet._meta.db_table)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET {assignments}, version = version + 1, modified = %s '
+            f'WHERE user_id = %s {condition} '
+            f'RETURNING {", ".join(WALLET_BALANCE_COLUMNS)}',
+            [*assignment_params, timezone.now(), user_id, *condition_params]
+        )
+        row = cursor.fetchone()
+
+    if row is None:
+        return None
+
+    balance = dict(zip(WALLET_BALANCE_COLUMNS, row))
+    wallet = Wallet(
+        user_id=user_id,
+        amount=Money(balance['amount'], balance['amount_currency']),
+        reserved=Money(balance['reserved'], balance['reserved_currency']),
+        version=balance['version'],
+        modified=balance['modified'],
+    )
+    write_through_wallet_balance(Wallet, wallet)
+
+    return wallet
+
+
+def authorize_hold(user_id, amount: Money, reference: str = '') -> BalanceHold:
+    """
+    Reserves the amount on the user's wallet, so that it can't be spent until the hold is captured or released. The
+    available balance is checked and reserved in the same UPDATE, so concurrent holds can't overdraw the wallet.
+
+    Raises :mod:`InsufficientBalance` if the amount is greater than the wallet's available balance, and
+    :mod:`CurrencyMismatch` if it isn't in the wallet's currency.
+    """
+    if amount.amount <= 0:
+        raise InsufficientBalance('Hold amount should be greater than 0')
+
+    with transaction.atomic():
+        wallet = update_wallet_balance(
+            user_id, 'reserved = reserved + %s', [amount.amount],
+            'AND amount_currency = %s AND amount - reserved >= %s', [f'{amount.currency}', amount.amount]
+        )
+
+        if wallet is None:
+            currency = Wallet.objects.get_currency(user_id)
+
+            if currency is not None and currency != f'{amount.currency}':
+                raise CurrencyMismatch(f'This wallet can only hold amounts in {currency}, not {amount.currency}.')
+
+            raise InsufficientBalance(f'This wallet has insufficient balance to hold {amount}.')
+
+        return BalanceHold.objects.create(wallet_id=user_id, amount=amount, reference=reference)
+
+
+def settle_hold(hold_id, status: BalanceHoldStatus) -> BalanceHold:
+    """
+    Moves an active hold to its final status, which only ever succeeds once per hold.
+
+    Raises :mod:`HoldNotActive` if the hold has already been captured or released.
+    """
+    updated = BalanceHold.objects \
+        .filter(id=hold_id, status=BalanceHoldStatus.ACTIVE.name) \
+        .update(status=status.name, modified=timezone.now())
+
+    if not updated:
+        raise HoldNotActive(f'Balance hold {hold_id} has already been captured or released.')
+
+    return BalanceHold.objects.get(id=hold_id)
+
+
+def capture_hold(hold_id) -> Transaction:
+    """
+    Withdraws a held amount from its wallet and posts it to the wallet's transactions.
+
+    Raises :mod:`HoldNotActive` if the hold has already been captured or released.
+    """
+    with transaction.atomic():
+        hold = settle_hold(hold_id, BalanceHoldStatus.CAPTURED)
+        wallet = update_wallet_balance(
+            hold.wallet_id, 'amount = amount - %s, reserved = reserved - %s', [hold.amount.amount, hold.amount.amount]
+        )
+
+        return Transaction.objects.create(wallet_id=hold.wallet_id, amount=-hold.amount, running_balance=wallet.amount)
+
+
+def release_hold(hold_id) -> BalanceHold:
+    """
+    Releases a held amount back to its wallet's available balance.
+
+    Raises :mod:`HoldNotActive` if the hold has already been captured or released.
+    """
+    with transaction.atomic():
+        hold = settle_hold(hold_id, BalanceHoldStatus.RELEASED)
+        update_wallet_balance(hold.wallet_id, 'reserved = reserved - %s', [hold.amount.amount])
+
+        return hold
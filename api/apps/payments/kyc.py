@@ -0,0 +1,224 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import List, NamedTuple, Optional, Tuple
+
+import structlog
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from api.apps.payments.deposits import apply_user_token
+from api.apps.payments.linking import identity_matches_user
+from api.apps.payments.models import BankAccount, BankAccountToken, KycVerification, KycVerificationRun
+from api.utils.enums import KycVerificationStatus
+from api.utils.libs.stitch.base import BaseAPI
+from api.utils.libs.stitch.linkpay.linkpay import LinkPay
+
+log = structlog.get_logger('api_requests')
+
+
+class IdentityLookup(NamedTuple):
+    user_token: Optional[dict]
+    account_holder: Optional[dict]
+    error: Optional[Exception]
+
+
+def request_account_identity(refresh_token: str) -> IdentityLookup:
+    """
+    Refreshes the linked account's user token and fetches the account holder's identity from LinkPay without touching
+    the database, so that several of these can safely run concurrently.
+
+    Errors are returned rather than raised, along with the refreshed user token which still needs to be saved.
+    """
+    user_token = None
+
+    try:
+        user_token = BaseAPI().refresh_user_credentials(refresh_token)
+        account_details = LinkPay(token=user_token['access_token']).get_linked_account_identity()
+
+        return IdentityLookup(
+            user_token, account_details['user']['paymentAuthorization']['bankAccount']['accountHolder'], None
+        )
+    except Exception as e:
+        return IdentityLookup(user_token, None, e)
+
+
+def get_run_accounts(run: KycVerificationRun):
+    # accounts linked after the run was started were verified when they were linked
+    return BankAccount.objects.filter(created__lte=run.created)
+
+
+def get_pending_accounts(run: KycVerificationRun):
+    # accounts that couldn't be looked up are retried until they've used up KYC_REVERIFICATION_MAX_ATTEMPTS
+    settled = KycVerification.objects \
+        .filter(run=run) \
+        .exclude(status=KycVerificationStatus.FAILED.name, attempts__lt=settings.KYC_REVERIFICATION_MAX_ATTEMPTS) \
+        .values('account_id')
+
+    return get_run_accounts(run).exclude(id__in=settled)
+
+
+def get_current_period_start():
+    # runs are monthly, so a run started in an earlier month is never resumed in place of this month's
+    return timezone.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def is_stalled(run: KycVerificationRun) -> bool:
+    last_progress = KycVerification.objects.filter(run=run).aggregate(Max('verified_at'))['verified_at__max']
+    stalled_after = timedelta(seconds=settings.KYC_REVERIFICATION_STALLED_AFTER_SECONDS)
+
+    return (last_progress or run.created) <= timezone.now() - stalled_after
+
+
+def plan_kyc_reverification(
+    resume_only: bool = False
+) -> Tuple[Optional[KycVerificationRun], List[Tuple[int, int]]]:
+    """
+    Picks up this month's run if it hasn't finished, or starts a new one, and splits the accounts it has yet to verify
+    (including those that couldn't be looked up and have attempts left) into shards of
+    ``KYC_REVERIFICATION_SHARD_SIZE`` accounts.
+
+    With ``resume_only``, a new run is never started, and the unfinished run is only picked up once it's stalled, so
+    that the shards still in flight aren't queued twice.
+
+    Returns the run along with the first and last primary key of each shard.
+    """
+    run = KycVerificationRun.objects \
+        .filter(finished_at__isnull=True, created__gte=get_current_period_start()) \
+        .order_by('-created') \
+        .first()
+
+    if resume_only and (run is None or not is_stalled(run)):
+        return run, []
+
+    if run is None:
+        run = KycVerificationRun.objects.create()
+        run.total_accounts = get_run_accounts(run).count()
+        run.save(update_fields=['total_accounts', 'modified'])
+
+    pending_pks = list(get_pending_accounts(run).order_by('id').values_list('id', flat=True))
+    shard_size = settings.KYC_REVERIFICATION_SHARD_SIZE
+    shards = [(shard[0], shard[-1]) for shard in (
+        pending_pks[i:i + shard_size] for i in range(0, len(pending_pks), shard_size)
+    )]
+
+    return run, shards
+
+
+def verify_kyc_shard(run: KycVerificationRun, first_pk: int, last_pk: int) -> int:
+    """
+    Re-verifies the accounts in the shard that the run has yet to verify, fetching their identities
+    concurrently in a pool of at most ``KYC_REVERIFICATION_CONCURRENCY`` threads. The accounts are loaded along with
+    their tokens and users in a single query, and the refreshed tokens and the outcomes are saved with a
+    ``bulk_update`` and a ``bulk_create``.
+
+    Returns the number of accounts verified.
+    """
+    logger = log.bind(event='kyc_reverification', run=f'{run.id}', first_pk=first_pk, last_pk=last_pk)
+    started = time.perf_counter()
+
+    accounts = list(
+        get_pending_accounts(run)
+        .filter(id__range=(first_pk, last_pk))
+        .select_related('user', 'bankaccounttoken')
+        .order_by('id')
+    )
+    previous_attempts = dict(
+        KycVerification.objects
+        .filter(run=run, account__id__range=(first_pk, last_pk), status=KycVerificationStatus.FAILED.name)
+        .values_list('account_id', 'attempts')
+    )
+    # accounts without a token can't be looked up, so they're recorded as failed
+    account_tokens = {
+        account.id: account.bankaccounttoken for account in accounts if hasattr(account, 'bankaccounttoken')
+    }
+    identity_lookups = {}
+
+    if account_tokens:
+        max_workers = min(len(account_tokens), settings.KYC_REVERIFICATION_CONCURRENCY)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            identity_lookups = dict(zip(account_tokens, executor.map(
+                request_account_identity, [account_token.refresh_token for account_token in account_tokens.values()]
+            )))
+
+    refreshed_tokens = []
+    verifications = []
+    now = timezone.now()
+
+    for account in accounts:
+        identity_lookup = identity_lookups.get(account.id)
+
+        if identity_lookup is not None and identity_lookup.user_token is not None:
+            account_token = account_tokens[account.id]
+            apply_user_token(account_token, identity_lookup.user_token)
+            account_token.modified = now
+            refreshed_tokens.append(account_token)
+
+        if identity_lookup is None or identity_lookup.error is not None:
+            status = KycVerificationStatus.FAILED
+        elif identity_matches_user(account.user, identity_lookup.account_holder):
+            status = KycVerificationStatus.MATCHED
+        else:
+            status = KycVerificationStatus.MISMATCH
+            logger.warning(account=account.id, user=f'{account.user_id}', message='Linked account KYC mismatch')
+
+        verifications.append(KycVerification(
+            run=run, account=account, status=status.name, verified_at=now,
+            attempts=previous_attempts.get(account.id, 0) + 1
+        ))
+
+    with transaction.atomic():
+        BankAccountToken.objects.bulk_update(refreshed_tokens, ['token_id', 'refresh_token', 'modified'])
+        # accounts that are being retried already have a failed verification in the run, which is replaced (the
+        # unique fields are given by column, as Django 4.1 doesn't resolve foreign keys in them)
+        KycVerification.objects.bulk_create(
+            verifications, update_conflicts=True, unique_fields=['run_id', 'account_id'],
+            update_fields=['status', 'verified_at', 'attempts']
+        )
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        message=f'Verified {len(verifications)} accounts ({len(verifications) / elapsed:.1f} accounts/s)',
+        verified=len(verifications)
+    )
+
+    return len(verifications)
+
+
+def finish_kyc_reverification(run: KycVerificationRun) -> Optional[dict]:
+    """
+    Marks the run as finished once every one of its accounts has been verified or has used up its attempts, and
+    reports how many accounts matched, mismatched or couldn't be verified along with the run's throughput.
+
+    Returns the report, or ``None`` if the run isn't finished yet or another shard has already finished it.
+    """
+    if get_pending_accounts(run).exists():
+        return None
+
+    now = timezone.now()
+
+    finished = KycVerificationRun.objects \
+        .filter(id=run.id, finished_at__isnull=True) \
+        .update(finished_at=now, modified=now)
+
+    if not finished:
+        return None
+
+    counts = dict(
+        KycVerification.objects.filter(run=run).values_list('status').annotate(count=Count('id')).order_by()
+    )
+    verified = sum(counts.values())
+    elapsed = (now - run.created).total_seconds()
+    report = {
+        **{status.name: counts.get(status.name, 0) for status in KycVerificationStatus},
+        'verified': verified,
+        'seconds': round(elapsed, 1),
+        'accounts_per_second': round(verified / elapsed, 1) if elapsed else None,
+    }
+
+    log.info(event='kyc_reverification', run=f'{run.id}', message='KYC re-verification finished', **report)
+
+    return report
@@ -0,0 +1,228 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+import structlog
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from api.apps.payments.models import PaymentRequest
+from api.utils.enums import PaymentRequestStatus
+from api.utils.redis import get_redis_connection
+
+log = structlog.get_logger('api_requests')
+
+DEPOSIT_COUNTERS_KEY_PREFIX = 'deposit_counters'
+
+# the counters of each period are kept in one hash per user and bucket, holding the total amount (in cents) of the
+# deposits that haven't failed and the number of deposits attempted, and expire once the bucket can't be checked again
+DEPOSIT_COUNTER_PERIODS = {
+    'hour': ('%Y%m%d%H', timedelta(hours=2)),
+    'day': ('%Y%m%d', timedelta(days=2)),
+    'month': ('%Y%m', timedelta(days=32)),
+}
+
+DEPOSIT_LIMIT_ERRORS = {
+    'daily': 'This deposit would take you over your daily deposit limit.',
+    'monthly': 'This deposit would take you over your monthly deposit limit.',
+    'velocity': 'Too many deposits have been made in the last hour, please try again later.',
+}
+
+# checks the deposits against the limits and reserves them in the counters in one step, so that concurrent deposits
+# can't both get through on the same headroom
+RESERVE_DEPOSITS_SCRIPT = """
+local amount = tonumber(ARGV[1])
+local count = tonumber(ARGV[2])
+
+if tonumber(redis.call('HGET', KEYS[2], 'amount') or '0') + amount > tonumber(ARGV[3]) then
+    return 'daily'
+end
+
+if tonumber(redis.call('HGET', KEYS[3], 'amount') or '0') + amount > tonumber(ARGV[4]) then
+    return 'monthly'
+end
+
+if tonumber(redis.call('HGET', KEYS[1], 'count') or '0') + count > tonumber(ARGV[5]) then
+    return 'velocity'
+end
+
+for i, key in ipairs(KEYS) do
+    redis.call('HINCRBY', key, 'amount', amount)
+    redis.call('HINCRBY', key, 'count', count)
+    redis.call('EXPIRE', key, ARGV[5 + i])
+end
+
+return false
+"""
+
+# counters that have already expired are left alone rather than brought back with a negative amount
+RELEASE_DEPOSIT_SCRIPT = """
+for _, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then
+        redis.call('HINCRBY', key, 'amount', -tonumber(ARGV[1]))
+    end
+end
+
+return true
+"""
+
+
+def to_cents(amount: Decimal) -> int:
+    return int(amount * 100)
+
+
+def period_start(period: str, at: datetime) -> datetime:
+    start = timezone.localtime(at).replace(minute=0, second=0, microsecond=0)
+
+    if period in ('day', 'month'):
+        start = start.replace(hour=0)
+
+    if period == 'month':
+        start = start.replace(day=1)
+
+    return start
+
+
+def deposit_counters_key(user_id, period: str, at: datetime) -> str:
+    bucket = period_start(period, at).strftime(DEPOSIT_COUNTER_PERIODS[period][0])
+
+    return f'{DEPOSIT_COUNTERS_KEY_PREFIX}:{user_id}:{period}:{bucket}'
+
+
+def get_deposit_totals(at: datetime, **filters) -> Dict[str, Dict[str, Tuple[int, int]]]:
+    """
+    Totals up the deposits of each user in the periods of the counters ending at ``at``, as ``(amount in cents,
+    count)`` pairs keyed by period, and by user ID (as a string) on top of that.
+    """
+    starts = {period: period_start(period, at) for period in DEPOSIT_COUNTER_PERIODS}
+    counted = ~Q(status=PaymentRequestStatus.FAILED.name)
+    aggregates = {}
+
+    for period, start in starts.items():
+        aggregates[f'{period}_amount'] = Sum('amount', filter=counted & Q(created__gte=start), default=Decimal(0))
+        aggregates[f'{period}_count'] = Count('pk', filter=Q(created__gte=start))
+
+    totals = PaymentRequest.objects \
+        .filter(created__gte=starts['month'], **filters) \
+        .order_by() \
+        .values('user_id') \
+        .annotate(**aggregates)
+
+    return {
+        f'{row["user_id"]}': {
+            period: (to_cents(row[f'{period}_amount']), row[f'{period}_count']) for period in DEPOSIT_COUNTER_PERIODS
+        }
+        for row in totals
+    }
+
+
+def check_deposit_totals(totals: Dict[str, Tuple[int, int]], amount: int, count: int) -> Optional[str]:
+    if totals['day'][0] + amount > to_cents(settings.DEPOSIT_DAILY_LIMIT):
+        return 'daily'
+
+    if totals['month'][0] + amount > to_cents(settings.DEPOSIT_MONTHLY_LIMIT):
+        return 'monthly'
+
+    if totals['hour'][1] + count > settings.DEPOSIT_HOURLY_VELOCITY_LIMIT:
+        return 'velocity'
+
+    return None
+
+
+def reserve_deposits(user_id, amounts: List[Decimal]) -> Optional[str]:
+    """
+    Checks deposits of the given amounts against the user's daily and monthly deposit limits and hourly velocity
+    limit, counting them towards the limits if they're all within them.
+
+    Returns the limit that would be exceeded (``daily``, ``monthly`` or ``velocity``), or ``None`` if the deposits can
+    go ahead. If Redis is unavailable the limits are checked against the payment requests instead, without counting
+    the deposits.
+    """
+    now = timezone.now()
+    amount = sum(to_cents(deposit_amount) for deposit_amount in amounts)
+
+    try:
+        exceeded_limit = get_redis_connection().register_script(RESERVE_DEPOSITS_SCRIPT)(
+            keys=[deposit_counters_key(user_id, period, now) for period in DEPOSIT_COUNTER_PERIODS],
+            args=[
+                amount,
+                len(amounts),
+                to_cents(settings.DEPOSIT_DAILY_LIMIT),
+                to_cents(settings.DEPOSIT_MONTHLY_LIMIT),
+                settings.DEPOSIT_HOURLY_VELOCITY_LIMIT,
+                *[int(ttl.total_seconds()) for _, ttl in DEPOSIT_COUNTER_PERIODS.values()],
+            ]
+        )
+    except RedisError as e:
+        log.error(event='reserve_deposits', message=f'Could not check deposit counters, summing deposits instead: {e}')
+
+        totals = get_deposit_totals(now, user_id=user_id).get(f'{user_id}', {
+            period: (0, 0) for period in DEPOSIT_COUNTER_PERIODS
+        })
+
+        return check_deposit_totals(totals, amount, len(amounts))
+
+    return exceeded_limit.decode('utf-8') if exceeded_limit else None
+
+
+def release_deposit(payment_request: PaymentRequest) -> None:
+    """
+    Takes a failed deposit's amount off the counters it was reserved in once the failure is committed. The deposit
+    still counts towards the velocity limit.
+    """
+    def release():
+        try:
+            get_redis_connection().register_script(RELEASE_DEPOSIT_SCRIPT)(
+                keys=[
+                    deposit_counters_key(payment_request.user_id, period, payment_request.created)
+                    for period in DEPOSIT_COUNTER_PERIODS
+                ],
+                args=[to_cents(payment_request.amount.amount)]
+            )
+        except RedisError as e:
+            log.error(
+                event='release_deposit', transaction_ref=f'{payment_request.transaction_ref}',
+                message=f'Could not release the deposit from the deposit counters: {e}'
+            )
+
+    transaction.on_commit(release)
+
+
+def reconcile_deposit_counters() -> int:
+    """
+    Rewrites the current deposit counters of every user from their payment requests, correcting the drift left by
+    counter updates that were lost, and clears the counters of users without any deposits in the period.
+
+    Deposits reserved while this runs may be left out of the counters, so it's best run when deposits are quiet.
+
+    Returns the number of users whose counters were rewritten.
+    """
+    now = timezone.now()
+    connection = get_redis_connection()
+    totals = get_deposit_totals(now)
+
+    with connection.pipeline(transaction=False) as pipeline:
+        for period, (_, ttl) in DEPOSIT_COUNTER_PERIODS.items():
+            stale_keys = set(connection.scan_iter(match=deposit_counters_key('*', period, now), count=1000))
+
+            for user_id, user_totals in totals.items():
+                key = deposit_counters_key(user_id, period, now)
+                amount, count = user_totals[period]
+
+                stale_keys.discard(key.encode('utf-8'))
+
+                if count:
+                    pipeline.hset(key, mapping={'amount': amount, 'count': count})
+                    pipeline.expire(key, ttl)
+                else:
+                    pipeline.delete(key)
+
+            if stale_keys:
+                pipeline.delete(*stale_keys)
+
+        pipeline.execute()
+
+    return len(totals)
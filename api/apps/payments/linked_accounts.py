@@ -0,0 +1,114 @@
+import json
+from typing import List, Optional
+
+import structlog
+from django.conf import settings
+from django.db import transaction
+from encrypted_fields import fields
+from redis.exceptions import RedisError
+from rest_framework.fields import DateTimeField
+
+from api.utils.redis import get_redis_connection
+
+log = structlog.get_logger('api_requests')
+
+LINKED_ACCOUNTS_KEY_PREFIX = 'linked_accounts'
+
+# the fields returned to clients, the cached accounts also keep their primary key so that an account_id can be
+# resolved without going through the hashed SearchField
+LINKED_ACCOUNT_FIELDS = (
+    'bank_id', 'name', '_account_id_data', 'account_name', 'account_type', 'account_number', 'created'
+)
+
+# cached accounts are encrypted with FIELD_ENCRYPTION_KEYS, like the columns they're loaded from
+linked_accounts_cipher = fields.EncryptedTextField()
+
+
+def linked_accounts_key(user_id) -> str:
+    return f'{LINKED_ACCOUNTS_KEY_PREFIX}:{user_id}'
+
+
+def mask_account_number(account_number: str) -> str:
+    return f'{"*" * max(len(account_number) - 4, 0)}{account_number[-4:]}'
+
+
+def serialize_linked_account(account) -> dict:
+    return {
+        'id': account.id,
+        'bank_id': account.bank_id,
+        'name': account.name,
+        '_account_id_data': account._account_id_data,
+        'account_name': account.account_name,
+        'account_type': account.account_type,
+        'account_number': mask_account_number(account.account_number),
+        'created': DateTimeField().to_representation(account.created),
+    }
+
+
+def cache_linked_accounts(user_id, linked_accounts: List[dict]) -> None:
+    get_redis_connection().set(
+        linked_accounts_key(user_id),
+        linked_accounts_cipher.encrypt(json.dumps(linked_accounts)),
+        ex=settings.LINKED_ACCOUNT_CACHE_TTL
+    )
+
+
+def get_cached_linked_accounts(user_id) -> Optional[List[dict]]:
+    try:
+        cached_accounts = get_redis_connection().get(linked_accounts_key(user_id))
+    except RedisError as e:
+        log.error(event='get_cached_linked_accounts', message=f'Could not read cached linked accounts: {e}')
+        return None
+
+    if cached_accounts is None:
+        return None
+
+    try:
+        return json.loads(linked_accounts_cipher.decrypt(cached_accounts))
+    except ValueError as e:
+        # the accounts were cached under a key that has since been dropped from FIELD_ENCRYPTION_KEYS
+        log.warning(event='get_cached_linked_accounts', message=f'Could not decrypt cached linked accounts: {e}')
+        try:
+            get_redis_connection().delete(linked_accounts_key(user_id))
+        except RedisError as e:
+            log.error(event='get_cached_linked_accounts', message=f'Could not drop cached linked accounts: {e}')
+        return None
+
+
+def invalidate_linked_accounts(user_id) -> None:
+    """
+    Drops the user's cached linked accounts straight away, and again once the current transaction commits so that a
+    request reading the accounts before then can't leave its stale copy behind.
+    """
+    def invalidate():
+        try:
+            get_redis_connection().delete(linked_accounts_key(user_id))
+        except RedisError as e:
+            # the stale accounts are served until they expire, so keep LINKED_ACCOUNT_CACHE_TTL short
+            log.error(event='invalidate_linked_accounts', message=f'Could not invalidate cached linked accounts: {e}')
+
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
+def clear_linked_accounts_cache() -> int:
+    """
+    Drops every user's cached linked accounts, so that none are left encrypted with a key that's about to be retired.
+
+    Returns the number of listings dropped.
+    """
+    connection = get_redis_connection()
+    cleared = 0
+
+    with connection.pipeline(transaction=False) as pipeline:
+        for key in connection.scan_iter(match=linked_accounts_key('*'), count=1000):
+            pipeline.delete(key)
+            cleared += 1
+
+        pipeline.execute()
+
+    return cleared
+
+
+def client_linked_account(linked_account: dict) -> dict:
+    return {field: linked_account[field] for field in LINKED_ACCOUNT_FIELDS}
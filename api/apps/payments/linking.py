@@ -0,0 +1,108 @@
+import json
+import uuid
+
+import structlog
+from django.db import transaction
+
+from api.apps.payments.models import AccountLink, BankAccount, BankAccountToken
+from api.apps.users.models import User
+from api.utils.enums import AccountLinkStatus
+from api.utils.libs.stitch.errors import LinkPayError
+from api.utils.libs.stitch.linkpay.linkpay import LinkPay
+
+log = structlog.get_logger('api_requests')
+
+
+def fetch_linked_account_details(access_token: str) -> dict:
+    logger = log.bind(event='get_account_details', request_id=str(uuid.uuid4()))
+
+    try:
+        account_details = LinkPay(token=access_token).get_linked_account_identity()
+
+        return account_details['user']['paymentAuthorization']['bankAccount']
+    except LinkPayError as e:
+        logger.error(f'could not fetch linked account identity: {str(e)}')
+
+        return {}
+    except Exception as e:
+        logger.error(f'an unexpected error happened trying to fetch linked account identity: {str(e)}')
+
+        return {}
+
+
+def identity_matches_user(user: User, account_holder: dict) -> bool:
+    """
+    Returns whether the holder of a linked account, as reported by Stitch, is the user that linked it going by their
+    full name and identifying document number.
+    """
+    return user.get_full_name() == account_holder['fullName'] and \
+        user.identification_number == account_holder['identifyingDocument']['number']
+
+
+def save_linked_account_details(user: User, account_details: dict, user_token: dict) -> BankAccount:
+    account_holder = account_details['accountHolder']
+
+    account = BankAccount.objects.create(
+        user_id=user.id,
+        bank_id=account_details['bankId'],
+        account_id=account_details['id'],
+        name=account_details['name'],
+        account_name=account_holder['fullName'],
+        account_type=account_details['accountType'],
+        account_number=account_details['accountNumber'],
+    )
+    BankAccountToken.objects.create(
+        account=account,
+        token_id=user_token['id_token'],
+        refresh_token=user_token['refresh_token']
+    )
+
+    return account
+
+
+def create_account_link(user: User, user_token: dict) -> AccountLink:
+    return AccountLink.objects.create(user=user, user_token=json.dumps(user_token))
+
+
+def process_account_link(link_id) -> AccountLink:
+    """
+    Fetches the identity of the account being linked from Stitch and, if it matches the user's KYC details, saves the
+    account along with its token.
+
+    The account is saved in the same transaction that completes the link, with the user locked so that the same account
+    can't be linked twice by concurrent links. Links that have already been processed are left as they are.
+    """
+    account_link = AccountLink.objects.select_related('user').get(id=link_id)
+
+    if account_link.status != AccountLinkStatus.PENDING.name:
+        return account_link
+
+    user_token = json.loads(account_link.user_token)
+    account_details = fetch_linked_account_details(user_token['access_token'])
+
+    with transaction.atomic():
+        user = User.objects.select_for_update().get(id=account_link.user_id)
+        account_link = AccountLink.objects.select_for_update().get(id=link_id)
+
+        if account_link.status != AccountLinkStatus.PENDING.name:
+            return account_link
+
+        if not account_details:
+            account_link.failed('Could not fetch the linked account\'s details from Stitch')
+        elif not identity_matches_user(user, account_details['accountHolder']):
+            account_link.kyc_mismatch()
+        else:
+            # an indexed lookup on the account_id hash, rather than decrypting every linked account to compare them
+            existing_account = BankAccount.objects \
+                .filter(user_id=user.id, account_id=account_details['id']) \
+                .only('id') \
+                .first()
+
+            if existing_account is not None:
+                account_link.already_linked(existing_account)
+            else:
+                account_link.linked(save_linked_account_details(user, account_details, user_token))
+
+        account_link.save()
+
+    return account_link
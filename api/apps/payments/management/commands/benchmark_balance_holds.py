@@ -0,0 +1,98 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from djmoney.money import Money
+
+from api.apps.payments.holds import authorize_hold, capture_hold
+from api.apps.payments.models import BalanceHold, Transaction, Wallet
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares the throughput of withdrawals from a single hot wallet when the wallet is locked across a simulated '
+        'external call, and when a balance hold is placed before the call and captured after it'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--operations', type=int, default=1000, help='Number of withdrawals per strategy')
+        parser.add_argument('--concurrency', type=int, default=8, help='Number of withdrawals run at a time')
+        parser.add_argument(
+            '--io-ms', type=int, default=20, help='Milliseconds the simulated external call takes per withdrawal'
+        )
+
+    def handle(self, *args, **options):
+        io_seconds = options['io_ms'] / 1000
+        amount = Money(Decimal('0.01'), 'ZAR')
+
+        def locked_withdrawal():
+            with transaction.atomic():
+                wallet = Wallet.objects.select_for_update().get(user_id=user.pk)
+                # the wallet stays locked for as long as the external call takes
+                time.sleep(io_seconds)
+                wallet.withdraw(amount)
+
+        def held_withdrawal():
+            hold = authorize_hold(user.pk, amount)
+            time.sleep(io_seconds)
+            capture_hold(hold.id)
+
+        strategies = {
+            'locked': locked_withdrawal,
+            'holds': held_withdrawal,
+        }
+
+        # a throwaway user, so that the benchmark's transactions don't end up in a real wallet
+        user = get_user_model().objects.create_user(
+            email=f'benchmark-{uuid.uuid4()}@example.com', full_name='Balance Hold Benchmark', short_name='Benchmark',
+            password=f'{uuid.uuid4()}'
+        )
+        wallet = Wallet.objects.create(user=user)
+        wallet.deposit(amount.amount * options['operations'] * len(strategies))
+
+        try:
+            for name, withdraw in strategies.items():
+                self.stdout.write(f'{name}: {self.run(withdraw, options["operations"], options["concurrency"])}')
+
+            wallet.refresh_from_db()
+            self.stdout.write(
+                f'balance: {wallet.amount.amount}, reserved: {wallet.reserved.amount}, '
+                f'transactions: {Transaction.objects.filter(wallet=wallet).count()}'
+            )
+        finally:
+            Transaction.objects.filter(wallet=wallet).delete()
+            BalanceHold.objects.filter(wallet=wallet).delete()
+            wallet.delete()
+            user.delete()
+
+    def run(self, withdraw, operations: int, concurrency: int) -> str:
+        def worker(worker_operations: int):
+            latencies = []
+
+            try:
+                for _ in range(worker_operations):
+                    started = time.perf_counter()
+                    withdraw()
+                    latencies.append(time.perf_counter() - started)
+            finally:
+                # each thread has its own connection, which would otherwise be left open
+                connection.close()
+
+            return latencies
+
+        shares = [operations // concurrency + (1 if i < operations % concurrency else 0) for i in range(concurrency)]
+        started = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = sorted(
+                latency for worker_latencies in executor.map(worker, shares) for latency in worker_latencies
+            )
+
+        elapsed = time.perf_counter() - started
+        p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)] if latencies else 0
+
+        return f'{operations / elapsed:.1f} withdrawals/s, p95 {p95 * 1000:.1f}ms'
@@ -0,0 +1,58 @@
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from encrypted_fields.fields import EncryptedFieldMixin
+
+from api.apps.payments.linked_accounts import LINKED_ACCOUNT_FIELDS, invalidate_linked_accounts
+from api.apps.payments.models import BankAccount
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares the decryptions, queries and time taken to list a user\'s linked accounts from the database and '
+        'from the linked accounts cache'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help='Email address of the user whose linked accounts are listed')
+        parser.add_argument('--listings', type=int, default=1000, help='Number of times to list the linked accounts')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(email=options['email'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'Could not find a user with the email address {options["email"]}')
+
+        invalidate_linked_accounts(user.pk)
+        accounts = BankAccount.objects.filter(user_id=user.pk).count()
+        self.stdout.write(f'{user.email} has {accounts} linked accounts')
+
+        listings = {
+            'database': lambda: list(BankAccount.objects.filter(user_id=user.pk).values(*LINKED_ACCOUNT_FIELDS)),
+            'cache': lambda: BankAccount.objects.get_linked_accounts(user.pk),
+        }
+
+        for name, list_accounts in listings.items():
+            # warms up the cache, so that only cache hits are measured
+            list_accounts()
+
+            with mock.patch.object(
+                EncryptedFieldMixin, 'decrypt', autospec=True, side_effect=EncryptedFieldMixin.decrypt
+            ) as decrypt, CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+
+                for _ in range(options['listings']):
+                    list_accounts()
+
+                elapsed = time.perf_counter() - started
+
+            self.stdout.write(
+                f'{name}: '
+                f'{decrypt.call_count / options["listings"]:.3f} decryptions/listing, '
+                f'{len(queries) / options["listings"]:.3f} queries/listing, '
+                f'{elapsed / options["listings"] * 1000:.3f}ms/listing'
+            )
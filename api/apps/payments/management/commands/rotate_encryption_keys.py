@@ -0,0 +1,217 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from Crypto.Cipher import AES
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from encrypted_fields import fields
+
+from api.apps.payments.linked_accounts import clear_linked_accounts_cache
+from api.apps.payments.models import BankAccount, BankAccountToken
+from api.apps.users.models import User
+
+# the encrypted fields of each model, which are all re-encrypted together
+ROTATED_FIELDS = {
+    BankAccount: ('_account_id_data', 'account_name', 'account_number'),
+    BankAccountToken: ('refresh_token',),
+    User: ('identification_number',),
+}
+
+
+def is_current(value: bytes) -> bool:
+    """
+    Returns whether the value was encrypted with the current key, which is the first of ``FIELD_ENCRYPTION_KEYS``.
+    """
+    try:
+        AES.new(bytes.fromhex(settings.FIELD_ENCRYPTION_KEYS[0]), AES.MODE_GCM, nonce=value[:16]) \
+            .decrypt_and_verify(value[32:], value[16:32])
+    except ValueError:
+        return False
+
+    return True
+
+
+def decrypt_stale_rows(rows: List[tuple]) -> List[Tuple[object, List[Optional[str]]]]:
+    """
+    Decrypts the rows that have a value which wasn't encrypted with the current key, returning their primary keys
+    along with all of their values in plain text so they can be saved again.
+
+    Runs in the worker processes, so it only takes and returns picklable values.
+    """
+    cipher = fields.EncryptedTextField()
+    stale_rows = []
+
+    for pk, *values in rows:
+        if all(value is None or is_current(value) for value in values):
+            continue
+
+        stale_rows.append((pk, [None if value is None else cipher.decrypt(value) for value in values]))
+
+    return stale_rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-encrypts the encrypted fields of every row that wasn\'t encrypted with the current (first) key of '
+        'FIELD_ENCRYPTION_KEYS, so the previous keys can be retired. Rows are read in primary key ranges and written '
+        'back in short transactions while the API is serving, and progress is checkpointed after every batch so the '
+        'rotation can be re-run to resume after a failure.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows re-encrypted per transaction')
+        parser.add_argument(
+            '--range-size', type=int, default=20000, help='Rows read through each server-side cursor'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Processes decrypting rows, 1 decrypts them in this process'
+        )
+        parser.add_argument(
+            '--max-db-load', type=float, default=0.5,
+            help='Fraction of the time spent in the database, the command sleeps between batches to stay under it'
+        )
+        parser.add_argument(
+            '--checkpoint', type=Path, default=Path('rotate_encryption_keys.progress'),
+            help='File tracking the last primary key rotated for each model'
+        )
+
+    def handle(self, *args, **options):
+        if not 0 < options['max_db_load'] <= 1:
+            raise CommandError('--max-db-load should be more than 0 and at most 1')
+
+        checkpoint: Path = options['checkpoint']
+        progress = json.loads(checkpoint.read_text()) if checkpoint.exists() else {}
+
+        if progress:
+            self.stdout.write(f'Resuming from {checkpoint}')
+
+        with ExitStack() as stack:
+            if options['workers'] > 1:
+                # forked workers must not inherit the database connection, closing it there would close it here too
+                connections.close_all()
+                executor = stack.enter_context(ProcessPoolExecutor(max_workers=options['workers']))
+                decrypt_batches = lambda batches: executor.map(decrypt_stale_rows, batches)
+            else:
+                decrypt_batches = lambda batches: map(decrypt_stale_rows, batches)
+
+            for model, field_names in ROTATED_FIELDS.items():
+                label = model._meta.label
+
+                if progress.get(label, {}).get('done'):
+                    continue
+
+                scanned = rotated = 0
+                started = time.perf_counter()
+                last_pk = progress.get(label, {}).get('last_pk')
+
+                for batches in self.read_ranges(model, field_names, last_pk, options):
+                    for batch, stale_rows in zip(batches, decrypt_batches(batches)):
+                        db_started = time.perf_counter()
+                        rotated += self.write_batch(model, field_names, batch, stale_rows)
+                        db_time = time.perf_counter() - db_started
+
+                        scanned += len(batch)
+                        progress[label] = {'last_pk': f'{batch[-1][0]}'}
+                        self.save_checkpoint(checkpoint, progress)
+
+                        elapsed = time.perf_counter() - started
+                        self.stdout.write(
+                            f'{label}: {scanned} rows scanned, {rotated} re-encrypted ({scanned / elapsed:.1f} rows/s)'
+                        )
+
+                        # sleeps long enough for the time spent writing to make up at most max_db_load of the total
+                        time.sleep(db_time * (1 / options['max_db_load'] - 1))
+
+                progress[label] = {'done': True}
+                self.save_checkpoint(checkpoint, progress)
+                self.stdout.write(self.style.SUCCESS(f'{label}: re-encrypted {rotated} of {scanned} rows'))
+
+        # the cached linked accounts are encrypted too, and would only expire after LINKED_ACCOUNT_CACHE_TTL
+        cleared = clear_linked_accounts_cache()
+        self.stdout.write(self.style.SUCCESS(f'Cleared {cleared} cached linked account listings'))
+
+        checkpoint.unlink(missing_ok=True)
+
+    @staticmethod
+    def read_ranges(model, field_names, last_pk, options) -> Iterator[List[List[tuple]]]:
+        """
+        Reads the raw encrypted values of the rows after ``last_pk`` in ranges of ``--range-size`` rows, each through
+        its own server-side cursor so that no snapshot is held for the whole rotation, and yields each range split into
+        batches of ``--batch-size`` rows.
+        """
+        table = connection.ops.quote_name(model._meta.db_table)
+        pk_column = connection.ops.quote_name(model._meta.pk.column)
+        columns = ', '.join(connection.ops.quote_name(model._meta.get_field(name).column) for name in field_names)
+
+        while True:
+            where, params = (f'WHERE {pk_column} > %s', [last_pk]) if last_pk is not None else ('', [])
+            batches = []
+
+            with connection.chunked_cursor() as cursor:
+                cursor.execute(
+                    f'SELECT {pk_column}, {columns} FROM {table} {where} ORDER BY {pk_column} LIMIT %s',
+                    params + [options['range_size']]
+                )
+
+                while rows := cursor.fetchmany(options['batch_size']):
+                    # memoryviews can't be sent to the worker processes
+                    batches.append([
+                        (pk, *[None if value is None else bytes(value) for value in values]) for pk, *values in rows
+                    ])
+
+            if not batches:
+                return
+
+            yield batches
+
+            last_pk = batches[-1][-1][0]
+
+    @staticmethod
+    def write_batch(model, field_names, batch: List[tuple], stale_rows: List[Tuple[object, List[Optional[str]]]]) \
+            -> int:
+        """
+        Saves the decrypted rows back with ``bulk_update``, which encrypts them with the current key.
+
+        The rows are locked and compared against the values they were decrypted from first, and rows that were saved
+        by the API in the meantime are left alone, as they have been encrypted with the current key already and
+        overwriting them would lose the change.
+        """
+        if not stale_rows:
+            return 0
+
+        read_values: Dict[object, tuple] = {pk: tuple(values) for pk, *values in batch}
+        table = connection.ops.quote_name(model._meta.db_table)
+        pk_column = connection.ops.quote_name(model._meta.pk.column)
+        columns = ', '.join(connection.ops.quote_name(model._meta.get_field(name).column) for name in field_names)
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'SELECT {pk_column}, {columns} FROM {table} WHERE {pk_column} = ANY(%s) FOR UPDATE',
+                    [[pk for pk, _ in stale_rows]]
+                )
+                unchanged_pks = {
+                    pk for pk, *values in cursor.fetchall()
+                    if tuple(None if value is None else bytes(value) for value in values) == read_values[pk]
+                }
+
+            instances = [
+                model(**{model._meta.pk.attname: pk}, **dict(zip(field_names, values)))
+                for pk, values in stale_rows if pk in unchanged_pks
+            ]
+            model.objects.bulk_update(instances, field_names)
+
+        return len(instances)
+
+    @staticmethod
+    def save_checkpoint(checkpoint: Path, progress: dict) -> None:
+        temporary = checkpoint.with_name(f'{checkpoint.name}.tmp')
+        temporary.write_text(json.dumps(progress))
+        temporary.replace(checkpoint)
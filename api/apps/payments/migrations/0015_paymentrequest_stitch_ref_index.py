@@ -0,0 +1,27 @@
+# Generated by Django 4.1.3 on 2026-10-19 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0014_alter_bankaccounttoken_account'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='paymentrequest',
+            name='stitch_ref',
+            field=models.CharField(db_index=True, default='', max_length=100, null=True),
+        ),
+        migrations.AlterField(
+            model_name='paymentrequestevent',
+            name='event_type',
+            field=models.CharField(choices=[('INITIATED', 'Payment Initiated'), ('COMPLETED', 'Payment Completed'), ('FAILED', 'Payment Failed'), ('EXPIRED', 'Payment Expired'), ('USER_INTERACTION', 'User Interaction Required'), ('CONFIRMED', 'Payment Confirmed'), ('WEBHOOK_PROCESSING', 'Webhook Processing'), ('RECONCILED', 'Payment Reconciled')], max_length=25),
+        ),
+        migrations.AddIndex(
+            model_name='paymentrequest',
+            index=models.Index(fields=['status', 'created'], name='payments_pa_status_b76004_idx'),
+        ),
+    ]
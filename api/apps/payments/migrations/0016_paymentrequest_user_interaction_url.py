@@ -0,0 +1,18 @@
+# Generated by Django 4.1.3 on 2026-10-19 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0015_paymentrequest_stitch_ref_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentrequest',
+            name='user_interaction_url',
+            field=models.URLField(blank=True, default='', max_length=500),
+        ),
+    ]
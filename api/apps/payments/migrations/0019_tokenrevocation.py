@@ -0,0 +1,33 @@
+# Generated by Django 4.1.3 on 2026-10-19 09:00
+
+from django.db import migrations, models
+import django.utils.timezone
+import encrypted_fields.fields
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0018_accountlink'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenRevocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+                ('token', encrypted_fields.fields.EncryptedCharField(max_length=100)),
+                ('token_type', models.CharField(default='refresh_token', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(default='')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='tokenrevocation',
+            index=models.Index(fields=['next_attempt_at'], name='payments_to_next_at_6c85ac_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.1.3 on 2026-10-19 09:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import model_utils.fields
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0020_banktransaction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KycVerificationRun',
+            fields=[
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+                ('id', model_utils.fields.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('total_accounts', models.PositiveIntegerField(default=0)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='KycVerification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('MATCHED', 'matched'), ('MISMATCH', 'mismatch'), ('FAILED', 'failed')], max_length=10)),
+                ('verified_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='payments.bankaccount')),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='payments.kycverificationrun')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='kycverification',
+            index=models.Index(fields=['run', 'status'], name='payments_ky_run_id_c1c07e_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='kycverification',
+            constraint=models.UniqueConstraint(fields=('run', 'account'), name='unique_kyc_verification_per_run'),
+        ),
+    ]
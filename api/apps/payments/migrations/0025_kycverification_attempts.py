@@ -0,0 +1,18 @@
+# Generated by Django 4.1.3 on 2026-10-19 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0024_transfer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='kycverification',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+    ]
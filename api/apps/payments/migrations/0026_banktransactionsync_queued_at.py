@@ -0,0 +1,18 @@
+# Generated by Django 4.1.3 on 2026-10-19 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0025_kycverification_attempts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='banktransactionsync',
+            name='queued_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
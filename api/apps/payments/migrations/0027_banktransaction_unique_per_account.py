@@ -0,0 +1,22 @@
+# Generated by Django 4.1.3 on 2026-10-19 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0026_banktransactionsync_queued_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='banktransaction',
+            name='bank_transaction_id',
+            field=models.CharField(max_length=200),
+        ),
+        migrations.AddConstraint(
+            model_name='banktransaction',
+            constraint=models.UniqueConstraint(fields=('account', 'bank_transaction_id'), name='unique_bank_transaction_per_account'),
+        ),
+    ]
@@ -1,3 +1,4 @@
 from .bank_account import *
 from .payment_request import *
 from .wallet import *
+from .payout import *
@@ -1,13 +1,25 @@
 import os
+from typing import List, Optional
 
+import structlog
 from django.conf import settings
 from django.db import models
-from django.db.models.signals import post_delete
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.utils import timezone
+from django_fsm import FSMField, transition
+from djmoney.models.fields import MoneyField
 
 from encrypted_fields import fields
 from model_utils.models import TimeStampedModel, UUIDModel
+from redis.exceptions import RedisError
+
+from api.apps.payments.linked_accounts import LINKED_ACCOUNT_FIELDS, cache_linked_accounts, \
+    get_cached_linked_accounts, invalidate_linked_accounts, serialize_linked_account
+from api.utils.enums import AccountLinkStatus, KycVerificationStatus, enum_choices
+from api.utils.response_cache import bump_data_version
+
+log = structlog.get_logger('api_requests')
 
 
 def default_token_expiry():
@@ -15,7 +27,42 @@ def default_token_expiry():
 
 
 def get_hash_key():
-    return os.getenv('FIELD_ENCRYPTION_KEY')
+    # kept apart from the encryption keys, so rotating those doesn't change the hashes SearchFields are looked up by
+    return os.getenv('FIELD_HASH_KEY', os.getenv('FIELD_ENCRYPTION_KEY'))
+
+
+class BankAccountManager(models.Manager):
+    def get_linked_accounts(self, user_id) -> List[dict]:
+        """
+        Returns the user's linked accounts with their account numbers masked from the Redis cache, loading and caching
+        them on a miss.
+
+        Cached accounts only need a single decryption between them, where loading them decrypts three columns of every
+        account.
+        """
+        linked_accounts = get_cached_linked_accounts(user_id)
+
+        if linked_accounts is not None:
+            return linked_accounts
+
+        accounts = self.filter(user_id=user_id).only('id', *LINKED_ACCOUNT_FIELDS).order_by('created')
+        linked_accounts = [serialize_linked_account(account) for account in accounts]
+
+        try:
+            cache_linked_accounts(user_id, linked_accounts)
+        except RedisError as e:
+            log.error(event='get_linked_accounts', message=f'Could not cache linked accounts: {e}')
+
+        return linked_accounts
+
+    def find_linked_account(self, user_id, account_id: str) -> Optional[dict]:
+        """
+        Looks up one of the user's linked accounts by its Stitch account ID in the linked accounts cache.
+        """
+        return next(
+            (account for account in self.get_linked_accounts(user_id) if account['_account_id_data'] == account_id),
+            None
+        )
 
 
 class BankAccount(TimeStampedModel, models.Model):
@@ -28,6 +75,8 @@ class BankAccount(TimeStampedModel, models.Model):
     account_type = models.CharField(max_length=100)
     account_number = fields.EncryptedCharField(max_length=100)
 
+    objects = BankAccountManager()
+
 
 class BankAccountToken(TimeStampedModel, UUIDModel, models.Model):
     account = models.OneToOneField(BankAccount, on_delete=models.CASCADE)
@@ -36,6 +85,134 @@ class BankAccountToken(TimeStampedModel, UUIDModel, models.Model):
     refresh_token_expiry = models.DateTimeField(default=default_token_expiry)
 
 
+class BankTransactionSync(TimeStampedModel, models.Model):
+    """
+    Where the last sync of a linked account's bank transactions got to, so that each sync only fetches the transactions
+    after its cursor.
+    """
+    account = models.OneToOneField(BankAccount, on_delete=models.CASCADE)
+    cursor = models.TextField(default='')
+    synced_at = models.DateTimeField(null=True, blank=True)
+    queued_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(default='')
+
+
+class BankTransaction(TimeStampedModel, models.Model):
+    """
+    A transaction on a linked account's bank statement, as synced from Stitch.
+    """
+    account = models.ForeignKey(BankAccount, on_delete=models.CASCADE)
+    bank_transaction_id = models.CharField(max_length=200)
+    amount = MoneyField(max_digits=19, decimal_places=2, default_currency='ZAR')
+    running_balance = MoneyField(max_digits=19, decimal_places=2, default_currency='ZAR', null=True, blank=True)
+    description = models.TextField(default='')
+    reference = models.TextField(default='')
+    date = models.DateField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', '-date']),
+        ]
+        constraints = [
+            # the same bank account can be linked by more than one user, each with their own copy of its transactions
+            models.UniqueConstraint(
+                fields=['account', 'bank_transaction_id'], name='unique_bank_transaction_per_account'
+            ),
+        ]
+
+
+class TokenRevocation(TimeStampedModel, models.Model):
+    """
+    Outbox of the Stitch tokens of unlinked accounts, which is written in the same transaction that deletes the account
+    and relayed to Stitch in the background.
+    """
+    token = fields.EncryptedCharField(max_length=100)
+    token_type = models.CharField(max_length=20, default='refresh_token')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(default='')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_attempt_at']),
+        ]
+
+
+class AccountLink(TimeStampedModel, UUIDModel, models.Model):
+    """
+    Tracks an account being linked in the background, from the authorization code exchange until the account has been
+    verified against the user's KYC details and saved.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT)
+    status = FSMField(default=AccountLinkStatus.PENDING.name)
+    # the user token from the authorization code exchange, only kept until the link has been processed
+    user_token = fields.EncryptedTextField(default='')
+    account = models.ForeignKey(BankAccount, null=True, blank=True, on_delete=models.SET_NULL)
+    failure_reason = models.TextField(default='')
+
+    def __repr__(self):
+        return f'<AccountLink {self.id} by {self.user_id}: {self.status}>'
+
+    @transition(field=status, source=AccountLinkStatus.PENDING.name, target=AccountLinkStatus.LINKED.name)
+    def linked(self, account: BankAccount):
+        self.account = account
+        self.user_token = ''
+
+    @transition(field=status, source=AccountLinkStatus.PENDING.name, target=AccountLinkStatus.ALREADY_LINKED.name)
+    def already_linked(self, account: BankAccount):
+        self.account = account
+        self.user_token = ''
+
+    @transition(field=status, source=AccountLinkStatus.PENDING.name, target=AccountLinkStatus.KYC_MISMATCH.name)
+    def kyc_mismatch(self):
+        self.failure_reason = 'Mismatch between linked account KYC details and user\'s KYC details'
+        self.user_token = ''
+
+    @transition(field=status, source=AccountLinkStatus.PENDING.name, target=AccountLinkStatus.FAILED.name)
+    def failed(self, failure_reason: str):
+        self.failure_reason = failure_reason
+        self.user_token = ''
+
+
+class KycVerificationRun(TimeStampedModel, UUIDModel, models.Model):
+    """
+    A re-verification of the identity of every account linked before the run was started against its user's KYC
+    details, which is complete once each of them has a :class:`KycVerification`.
+    """
+    total_accounts = models.PositiveIntegerField(default=0)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __repr__(self):
+        return f'<KycVerificationRun {self.id}: {self.total_accounts} accounts>'
+
+
+class KycVerification(models.Model):
+    """
+    The outcome of re-verifying one linked account in a :class:`KycVerificationRun`, kept compact as there's one for
+    every linked account every run.
+    """
+    run = models.ForeignKey(KycVerificationRun, on_delete=models.CASCADE)
+    account = models.ForeignKey(BankAccount, on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=enum_choices(KycVerificationStatus))
+    verified_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['run', 'account'], name='unique_kyc_verification_per_run'),
+        ]
+        indexes = [
+            models.Index(fields=['run', 'status']),
+        ]
+
+
+@receiver(post_save, sender=BankAccount)
+@receiver(post_delete, sender=BankAccount)
+def bump_bank_account_data_version(sender, instance, **kwargs):
+    bump_data_version(instance.user_id)
+
+
+@receiver(post_save, sender=BankAccount)
 @receiver(post_delete, sender=BankAccount)
-def auto_delete_account_with_token(sender, instance, **kwargs):
-    instance.bankaccounttoken.delete()
+def invalidate_linked_accounts_cache(sender, instance, **kwargs):
+    invalidate_linked_accounts(instance.user_id)
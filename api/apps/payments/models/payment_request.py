@@ -2,24 +2,31 @@ import uuid
 
 from django.conf import settings
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django_fsm import FSMField, transition
 
 from model_utils.models import TimeStampedModel
 
 from api.utils.enums import PaymentRequestStatus, enum_choices, PaymentRequestEventType
 from api.utils.mixins.models import MoneyMixin
+from api.utils.response_cache import bump_data_version
 
 
 class PaymentRequest(TimeStampedModel, MoneyMixin, models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, db_index=True)
     transaction_ref = models.UUIDField(default=uuid.uuid4, db_index=True, null=False, editable=False, primary_key=True)
-    stitch_ref = models.CharField(max_length=100, null=True, default='')
+    stitch_ref = models.CharField(max_length=100, null=True, default='', db_index=True)
     payer_reference = models.CharField(max_length=12)
     beneficiary_reference = models.CharField(max_length=20)
     status = FSMField(default=PaymentRequestStatus.NEW.name)
+    user_interaction_url = models.URLField(max_length=500, blank=True, default='')
 
     class Meta:
         ordering = ['-created', ]
+        indexes = [
+            models.Index(fields=['status', 'created']),
+        ]
 
     def __repr__(self):
         return f'<PaymentRequest {self.transaction_ref} by {self.user.email}: {self.status}>'
@@ -50,3 +57,14 @@ class PaymentRequestEvent(TimeStampedModel, models.Model):
 
     class Meta:
         ordering = ['created', ]
+
+
+@receiver(post_save, sender=PaymentRequest)
+@receiver(post_delete, sender=PaymentRequest)
+def bump_payment_request_data_version(sender, instance, **kwargs):
+    bump_data_version(instance.user_id)
+
+
+@receiver(post_save, sender=PaymentRequestEvent)
+def bump_payment_request_event_data_version(sender, instance, **kwargs):
+    bump_data_version(instance.payment_request.user_id)
@@ -0,0 +1,77 @@
+import uuid
+
+from django.conf import settings
+from django.db import models
+from django_fsm import FSMField, transition
+
+from encrypted_fields import fields
+from model_utils.models import TimeStampedModel, UUIDModel
+
+from api.apps.payments.models.bank_account import BankAccount
+from api.apps.payments.models.wallet import BalanceHold
+from api.utils.enums import WithdrawalStatus
+from api.utils.mixins.models import MoneyMixin
+
+
+class DisbursementBatch(TimeStampedModel, UUIDModel, models.Model):
+    """
+    A batch of withdrawals submitted for disbursement in a single call.
+    """
+    size = models.PositiveIntegerField(default=0)
+    submitted_at = models.DateTimeField(null=True, blank=True)
+
+    def __repr__(self):
+        return f'<DisbursementBatch {self.id}: {self.size} withdrawals>'
+
+
+class Withdrawal(TimeStampedModel, MoneyMixin, models.Model):
+    """
+    A payout from the user's wallet to one of their linked accounts. The amount is held on the wallet with a
+    :class:`BalanceHold` from the moment the withdrawal is requested, and captured or released once the disbursement
+    settles.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT)
+    withdrawal_ref = models.UUIDField(default=uuid.uuid4, db_index=True, null=False, editable=False, primary_key=True)
+    account = models.ForeignKey(BankAccount, null=True, blank=True, on_delete=models.SET_NULL)
+    # the beneficiary is kept with the withdrawal, so the account can be unlinked while the payout is in flight
+    bank_id = models.CharField(max_length=30)
+    account_type = models.CharField(max_length=100)
+    account_name = fields.EncryptedCharField(max_length=100)
+    account_number = fields.EncryptedCharField(max_length=100)
+    # the amount held on the user's wallet until the disbursement settles
+    hold = models.OneToOneField(BalanceHold, null=True, blank=True, on_delete=models.PROTECT)
+    status = FSMField(default=WithdrawalStatus.PENDING.name)
+    batch = models.ForeignKey(DisbursementBatch, null=True, blank=True, on_delete=models.SET_NULL)
+    stitch_ref = models.CharField(max_length=100, default='', db_index=True)
+    failure_reason = models.TextField(default='')
+
+    class Meta:
+        ordering = ['-created', ]
+        indexes = [
+            models.Index(fields=['status', 'created']),
+        ]
+
+    def __repr__(self):
+        return f'<Withdrawal {self.withdrawal_ref} by {self.user_id}: {self.status}>'
+
+    @transition(field=status, source=WithdrawalStatus.PENDING.name, target=WithdrawalStatus.SUBMITTED.name)
+    def submitted(self, batch: DisbursementBatch):
+        self.batch = batch
+
+    # a batch that's put back after its submission timed out can still have been disbursed, so withdrawals can be
+    # settled while they're pending
+    @transition(
+        field=status,
+        source=[WithdrawalStatus.PENDING.name, WithdrawalStatus.SUBMITTED.name],
+        target=WithdrawalStatus.COMPLETED.name
+    )
+    def completed(self):
+        pass
+
+    @transition(
+        field=status,
+        source=[WithdrawalStatus.PENDING.name, WithdrawalStatus.SUBMITTED.name],
+        target=WithdrawalStatus.FAILED.name
+    )
+    def failed(self, failure_reason: str):
+        self.failure_reason = failure_reason
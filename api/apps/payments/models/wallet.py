@@ -1,20 +1,132 @@
+import uuid
 from decimal import Decimal
+from typing import List, Optional, Tuple
 
+import structlog
 from django.db import models, transaction
 from django.conf import settings
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from djmoney.models.fields import MoneyField
 from djmoney.models.validators import MinMoneyValidator
 from djmoney.money import Money
 
-from model_utils.models import TimeStampedModel
+from model_utils.models import TimeStampedModel, UUIDModel
+from redis.exceptions import RedisError
 
-from api.apps.payments.errors import InsufficientBalance
+from api.apps.payments.balances import cache_wallet_balance, get_cached_wallet_balance, serialize_wallet_balance
+from api.apps.payments.errors import InsufficientBalance, InvalidTransfer
+from api.utils.enums import BalanceHoldStatus, enum_choices
 from api.utils.mixins.models import MoneyMixin
+from api.utils.response_cache import bump_data_version
+
+log = structlog.get_logger('api_requests')
+
+
+class WalletManager(models.Manager):
+    def get_balance(self, user_id) -> dict:
+        """
+        Returns the user's wallet balance from the Redis cache, loading it from the database and caching it on a miss.
+        """
+        wallet_balance = get_cached_wallet_balance(user_id)
+
+        if wallet_balance is not None:
+            return wallet_balance
+
+        wallet = self.only(
+            'user_id', 'amount', 'amount_currency', 'reserved', 'reserved_currency', 'modified', 'version'
+        ).get(user_id=user_id)
+        wallet_balance = serialize_wallet_balance(wallet)
+
+        try:
+            cache_wallet_balance(user_id, wallet_balance)
+        except RedisError as e:
+            log.error(event='get_wallet_balance', message=f'Could not cache wallet balance: {e}')
+
+        return wallet_balance
+
+    def get_currency(self, user_id) -> Optional[str]:
+        """
+        Returns the currency of the user's wallet, or ``None`` if they don't have one.
+        """
+        return self.filter(user_id=user_id).values_list('amount_currency', flat=True).first()
+
+    def apply_transfers(
+        self, transfers: List[Tuple[object, object, Decimal, str]]
+    ) -> List[Tuple[Optional['Transfer'], Optional[Exception]]]:
+        """
+        Applies the ``(sender_id, recipient_id, amount, reference)`` transfers in order in a single transaction,
+        locking every wallet involved in one pass in primary key order, so that batches sharing wallets can't deadlock
+        however their transfers are ordered. Each wallet is saved once, and the transfers and both of their ledger legs
+        are written with one ``bulk_create`` each.
+
+        A transfer that can't be applied, e.g. because it's greater than the sender's available balance at that point
+        in the batch, is skipped without failing the rest. Returns the outcome of each transfer in the order they were
+        given, as the transfer or the error it was skipped with.
+        """
+        wallet_ids = {wallet_id for transfer in transfers for wallet_id in transfer[:2]}
+        outcomes = []
+        ledger = []
+        touched = set()
+
+        with transaction.atomic():
+            wallets = {
+                wallet.user_id: wallet
+                for wallet in self.select_for_update().filter(user_id__in=wallet_ids).order_by('user_id')
+            }
+
+            for sender_id, recipient_id, amount, reference in transfers:
+                sender, recipient = wallets.get(sender_id), wallets.get(recipient_id)
+
+                if sender is None or recipient is None or sender_id == recipient_id:
+                    outcomes.append((None, InvalidTransfer('Transfers need a sender and a different recipient.')))
+                    continue
+
+                if amount <= 0 or amount > sender.available.amount:
+                    outcomes.append(
+                        (None, InsufficientBalance(f'This wallet has insufficient balance to transfer {amount}.'))
+                    )
+                    continue
+
+                sender.amount.amount -= amount
+                recipient.amount.amount += amount
+
+                for wallet, posting in ((sender, -amount), (recipient, amount)):
+                    wallet.version += 1
+                    ledger.append(Transaction(
+                        wallet=wallet, amount=Money(posting, wallet.amount.currency),
+                        running_balance=Money(wallet.amount.amount, wallet.amount.currency)
+                    ))
+                    touched.add(wallet.user_id)
+
+                outcomes.append((
+                    Transfer(
+                        transfer_ref=uuid.uuid4(), sender_id=sender_id, recipient_id=recipient_id, amount=amount,
+                        amount_currency=sender.amount.currency, reference=reference
+                    ),
+                    None
+                ))
+
+            Transfer.objects.bulk_create([transfer for transfer, _ in outcomes if transfer is not None])
+            Transaction.objects.bulk_create(ledger)
+
+            for wallet_id in sorted(touched):
+                wallets[wallet_id].save()
+                # the transactions were bulk created, which skips the post_save that bumps it for each of them
+                bump_data_version(wallet_id)
+
+        return outcomes
 
 
 class Wallet(TimeStampedModel, models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, primary_key=True)
     amount = MoneyField(max_digits=19, decimal_places=2, default_currency='ZAR', default=0)
+    # the total of the wallet's active balance holds, which can't be spent until they're captured or released
+    reserved = MoneyField(max_digits=19, decimal_places=2, default_currency='ZAR', default=0)
+    # incremented by every ledger posting, so cached balances can tell which of two writes is the latest
+    version = models.PositiveBigIntegerField(default=0)
+
+    objects = WalletManager()
 
     def deposit(self, amount: Decimal):
         """
@@ -29,31 +141,85 @@ class Wallet(TimeStampedModel, models.Model):
                 running_balance=self.amount.amount + amount
             )
             self.amount.amount += amount
+            self.version += 1
             self.save()
 
     def withdraw(self, amount: Money):
         """
         Withdraws from the wallet and creates a new transaction with the withdrawal amount.
 
-        If the withdrawal amount is greater than the current wallet balance, raises a :mod:`InsufficientBalance` error.
+        If the withdrawal amount is greater than the wallet's available balance, raises a :mod:`InsufficientBalance`
+        error.
         """
-        if amount > self.amount:
+        # the amounts held for withdrawals in flight can't be spent twice
+        if amount > self.available:
             raise InsufficientBalance(f'This wallet has insufficient balance to withdraw {amount}.')
 
         with transaction.atomic():
             self.transaction_set.create(
                 amount=-amount,
-                running_balance=self.amount.amount - amount
+                running_balance=self.amount - amount
             )
-            self.amount.amount -= amount
+            self.amount -= amount
+            self.version += 1
             self.save()
 
-    def transfer(self, wallet, amount: Decimal):
+    @property
+    def available(self) -> Money:
+        return self.amount - self.reserved
+
+    def capture(self, amount: Decimal) -> 'Transaction':
         """
-        Uses `deposit` and `withdraw` internally to transfer the specified amount to another wallet.
+        Withdraws the amount of a captured hold from the wallet, for settling holds in bulk on a wallet that's been
+        locked with ``select_for_update``. The wallet and the transaction it returns are left for the caller to save.
+
+        Single holds are placed, captured and released with :mod:`api.apps.payments.holds` instead.
+        """
+        self.amount.amount -= amount
+        self.reserved.amount -= amount
+        self.version += 1
+
+        return Transaction(wallet=self, amount=-amount, running_balance=self.amount.amount)
+
+    def release(self, amount: Decimal):
         """
-        self.withdraw(amount)
-        wallet.deposit(amount)
+        Releases the amount of a hold, making it available to spend again. Like :meth:`capture`, the wallet is left for
+        the caller to save.
+        """
+        self.reserved.amount -= amount
+        self.version += 1
+
+    def transfer(self, wallet, amount: Decimal, reference: str = '') -> 'Transfer':
+        """
+        Transfers the specified amount to another wallet, moving it out of this wallet and into the other one in the
+        same transaction with both wallets locked.
+
+        If the amount is greater than the available balance, raises a :mod:`InsufficientBalance` error, and if the
+        other wallet is this one, a :mod:`InvalidTransfer` error.
+        """
+        transfer, error = Wallet.objects.apply_transfers([(self.user_id, wallet.user_id, amount, reference)])[0]
+
+        if error is not None:
+            raise error
+
+        self.refresh_from_db()
+        wallet.refresh_from_db()
+
+        return transfer
+
+
+@receiver(post_save, sender=Wallet)
+def write_through_wallet_balance(sender, instance, **kwargs):
+    wallet_balance = serialize_wallet_balance(instance)
+
+    def cache_balance():
+        try:
+            cache_wallet_balance(instance.user_id, wallet_balance)
+        except RedisError as e:
+            # the stale balance is served until it expires, so keep WALLET_BALANCE_CACHE_TTL short
+            log.error(event='write_through_wallet_balance', message=f'Could not cache wallet balance: {e}')
+
+    transaction.on_commit(cache_balance)
 
 
 class Transaction(TimeStampedModel, MoneyMixin, models.Model):
@@ -62,3 +228,48 @@ class Transaction(TimeStampedModel, MoneyMixin, models.Model):
         max_digits=19, decimal_places=2,
         default_currency='ZAR', validators=[MinMoneyValidator(1)]
     )
+
+
+class Transfer(TimeStampedModel, MoneyMixin, models.Model):
+    """
+    A transfer between two wallets, posted to each of them as a :class:`Transaction`.
+    """
+    transfer_ref = models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True)
+    sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, related_name='sent_transfers')
+    recipient = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.PROTECT, related_name='received_transfers'
+    )
+    reference = models.CharField(max_length=100, default='')
+
+    class Meta:
+        ordering = ['-created', ]
+
+    def __repr__(self):
+        return f'<Transfer {self.transfer_ref} from {self.sender_id} to {self.recipient_id}: {self.amount}>'
+
+
+class BalanceHold(TimeStampedModel, UUIDModel, MoneyMixin, models.Model):
+    """
+    An amount reserved on a wallet, e.g. while a withdrawal waits on an external call, which is later either captured
+    from the wallet or released back to it.
+    """
+    wallet = models.ForeignKey(Wallet, on_delete=models.PROTECT)
+    status = models.CharField(
+        max_length=10, choices=enum_choices(BalanceHoldStatus), default=BalanceHoldStatus.ACTIVE.name
+    )
+    # what the amount is held for, e.g. a withdrawal ref
+    reference = models.CharField(max_length=100, default='')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['wallet', 'status']),
+        ]
+
+    def __repr__(self):
+        return f'<BalanceHold {self.id} on {self.wallet_id}: {self.amount} {self.status}>'
+
+
+@receiver(post_save, sender=Transaction)
+def bump_transaction_data_version(sender, instance, **kwargs):
+    # the wallet's primary key is its user's
+    bump_data_version(instance.wallet_id)
@@ -0,0 +1,330 @@
+import json
+import uuid
+from datetime import timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import structlog
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from djmoney.money import Money
+
+from api.apps.payments.holds import authorize_hold
+from api.apps.payments.models import BalanceHold, BankAccount, DisbursementBatch, Transaction, Wallet, Withdrawal
+from api.utils.enums import BalanceHoldStatus, StitchDisbursementStatus, WithdrawalStatus
+from api.utils.libs.stitch.linkpay.linkpay import LinkPay
+from api.utils.redis import get_redis_connection
+from api.utils.response_cache import bump_data_version
+
+log = structlog.get_logger('api_requests')
+
+DISBURSEMENT_OUTCOMES_KEY = 'disbursement_outcomes'
+DISBURSEMENT_OUTCOMES_SETTLING_KEY = f'{DISBURSEMENT_OUTCOMES_KEY}:settling'
+
+FINAL_DISBURSEMENT_STATUSES = (
+    StitchDisbursementStatus.COMPLETED.value,
+    StitchDisbursementStatus.ERROR.value,
+    StitchDisbursementStatus.CANCELLED.value,
+)
+
+# moves the buffered outcomes aside for settling, unless a previous settlement died before finishing, in which case
+# its outcomes are settled first and the ones buffered since then wait for the next settlement
+TAKE_DISBURSEMENT_OUTCOMES_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 and redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('RENAME', KEYS[1], KEYS[2])
+end
+
+return redis.call('HGETALL', KEYS[2])
+"""
+
+
+class Disbursement(NamedTuple):
+    stitch_ref: str
+    status: str
+    error: Optional[Exception]
+
+
+def request_withdrawal(user, account: BankAccount, amount: Money) -> Withdrawal:
+    """
+    Holds the amount on the user's wallet and queues the withdrawal for the next disbursement batch. The wallet is only
+    locked for as long as it takes to place the hold.
+
+    Raises :mod:`InsufficientBalance` if the amount is greater than the wallet's available balance.
+    """
+    withdrawal_ref = uuid.uuid4()
+
+    with transaction.atomic():
+        hold = authorize_hold(user.id, amount, reference=f'{withdrawal_ref}')
+
+        return Withdrawal.objects.create(
+            withdrawal_ref=withdrawal_ref,
+            user=user,
+            account=account,
+            hold=hold,
+            amount=amount,
+            bank_id=account.bank_id,
+            account_type=account.account_type,
+            account_name=account.account_name,
+            account_number=account.account_number,
+        )
+
+
+def has_full_batch() -> bool:
+    return Withdrawal.objects \
+        .filter(status=WithdrawalStatus.PENDING.name) \
+        .order_by('created')[settings.PAYOUT_BATCH_SIZE - 1:] \
+        .exists()
+
+
+def claim_pending_withdrawals(batch_size: int) -> Tuple[Optional[DisbursementBatch], List[Withdrawal]]:
+    """
+    Moves the oldest ``batch_size`` pending withdrawals into a new disbursement batch, skipping any that a concurrent
+    submission has already claimed.
+    """
+    now = timezone.now()
+
+    with transaction.atomic():
+        withdrawals = list(
+            Withdrawal.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=WithdrawalStatus.PENDING.name)
+            .order_by('created')[:batch_size]
+        )
+
+        if not withdrawals:
+            return None, []
+
+        batch = DisbursementBatch.objects.create(size=len(withdrawals), submitted_at=now)
+
+        for withdrawal in withdrawals:
+            withdrawal.submitted(batch)
+            withdrawal.modified = now
+
+        Withdrawal.objects.bulk_update(withdrawals, ['status', 'batch', 'modified'])
+
+    return batch, withdrawals
+
+
+def build_disbursement(withdrawal: Withdrawal) -> dict:
+    return {
+        'amount': {
+            'quantity': f'{withdrawal.amount.amount}',
+            'currency': f'{withdrawal.amount.currency}'
+        },
+        # makes resubmitting a disbursement a no-op on Stitch
+        'nonce': f'{withdrawal.withdrawal_ref}',
+        'externalReference': f'{withdrawal.withdrawal_ref}',
+        # max for beneficiaryReference is 20, so 18 xters after the default "PW" prefix
+        'beneficiaryReference': f'PW{withdrawal.withdrawal_ref.hex[:18].upper()}',
+        'destination': {
+            'bankAccount': {
+                'name': withdrawal.account_name,
+                'bankId': withdrawal.bank_id,
+                'accountNumber': withdrawal.account_number,
+                'accountType': withdrawal.account_type,
+                'beneficiaryType': 'private',
+            }
+        },
+    }
+
+
+def disburse_with_stitch(withdrawals: List[Withdrawal]) -> List[Disbursement]:
+    created = LinkPay(scope='client_disbursement').create_disbursements(
+        [build_disbursement(withdrawal) for withdrawal in withdrawals]
+    )
+
+    return [
+        Disbursement('', '', disbursement) if isinstance(disbursement, Exception)
+        else Disbursement(disbursement['id'], disbursement['status']['__typename'], None)
+        for disbursement in created
+    ]
+
+
+def disburse_locally(withdrawals: List[Withdrawal]) -> List[Disbursement]:
+    # a stand-in for Stitch in development and load tests, which completes every disbursement straight away
+    return [
+        Disbursement(f'local-{withdrawal.withdrawal_ref}', StitchDisbursementStatus.COMPLETED.value, None)
+        for withdrawal in withdrawals
+    ]
+
+
+DISBURSEMENT_BACKENDS = {
+    'stitch': disburse_with_stitch,
+    'local': disburse_locally,
+}
+
+
+def submit_withdrawal_batch() -> int:
+    """
+    Submits a batch of up to ``PAYOUT_BATCH_SIZE`` pending withdrawals to the ``PAYOUT_DISBURSEMENT_BACKEND`` in a
+    single call, made outside of any transaction so that no rows are locked while it's in flight.
+
+    Disbursements that are rejected are failed and their holds released, and any that have already reached a final
+    status are settled straight away. If the call itself fails, the withdrawals are put back for the next batch.
+
+    Returns the number of withdrawals submitted.
+    """
+    batch, withdrawals = claim_pending_withdrawals(settings.PAYOUT_BATCH_SIZE)
+
+    if batch is None:
+        return 0
+
+    logger = log.bind(event='submit_withdrawal_batch', batch=f'{batch.id}', size=batch.size)
+
+    try:
+        disbursements = DISBURSEMENT_BACKENDS[settings.PAYOUT_DISBURSEMENT_BACKEND](withdrawals)
+    except Exception as e:
+        logger.error(message=f'Could not submit the disbursement batch: {e}')
+        Withdrawal.objects \
+            .filter(batch=batch, status=WithdrawalStatus.SUBMITTED.name) \
+            .update(status=WithdrawalStatus.PENDING.name, batch=None, modified=timezone.now())
+
+        raise
+
+    outcomes = {}
+
+    for withdrawal, disbursement in zip(withdrawals, disbursements):
+        withdrawal_ref = f'{withdrawal.withdrawal_ref}'
+
+        if disbursement.error is not None:
+            outcomes[withdrawal_ref] = (StitchDisbursementStatus.ERROR.value, f'{disbursement.error}')
+            continue
+
+        withdrawal.stitch_ref = disbursement.stitch_ref
+
+        if disbursement.status in FINAL_DISBURSEMENT_STATUSES:
+            outcomes[withdrawal_ref] = (disbursement.status, '')
+
+    Withdrawal.objects.bulk_update(withdrawals, ['stitch_ref'])
+    settled = settle_withdrawals(outcomes)
+
+    logger.info(message=f'Submitted {len(withdrawals)} withdrawals, {settled} settled on submission')
+
+    return len(withdrawals)
+
+
+def release_stalled_withdrawals() -> int:
+    """
+    Puts withdrawals that were claimed for a batch over ``PAYOUT_SUBMISSION_TIMEOUT_SECONDS`` ago, but never got a
+    ``stitch_ref``, back for the next batch. They're left behind when a worker dies mid-submission, and would otherwise
+    keep their holds reserved indefinitely. Each disbursement is created with the withdrawal's ref as its nonce, so
+    resubmitting one that did reach Stitch doesn't pay it out twice.
+
+    Returns the number of withdrawals put back.
+    """
+    now = timezone.now()
+
+    return Withdrawal.objects \
+        .filter(
+            status=WithdrawalStatus.SUBMITTED.name,
+            stitch_ref='',
+            modified__lt=now - timedelta(seconds=settings.PAYOUT_SUBMISSION_TIMEOUT_SECONDS)
+        ) \
+        .update(status=WithdrawalStatus.PENDING.name, batch=None, modified=now)
+
+
+def settle_withdrawals(outcomes: Dict[str, Tuple[str, str]]) -> int:
+    """
+    Applies the final disbursement statuses in ``outcomes``, keyed by withdrawal ref along with the failure reason, in
+    a single transaction. Completed withdrawals capture their holds and are posted to the ledger with one
+    ``bulk_create``, the rest release them. Each wallet is locked once for the whole batch, rather than once per hold
+    as :func:`api.apps.payments.holds.capture_hold` would.
+
+    The withdrawals and then their wallets are locked in primary key order, so that concurrent settlements can't
+    deadlock. Withdrawals that have already been settled are skipped, which makes settling the same outcomes again
+    safe.
+
+    Returns the number of withdrawals settled.
+    """
+    final_outcomes = {
+        withdrawal_ref: outcome for withdrawal_ref, outcome in outcomes.items()
+        if outcome[0] in FINAL_DISBURSEMENT_STATUSES
+    }
+
+    if not final_outcomes:
+        return 0
+
+    now = timezone.now()
+
+    with transaction.atomic():
+        withdrawals = list(
+            Withdrawal.objects
+            .select_for_update()
+            .filter(
+                withdrawal_ref__in=final_outcomes,
+                status__in=[WithdrawalStatus.PENDING.name, WithdrawalStatus.SUBMITTED.name]
+            )
+            .order_by('withdrawal_ref')
+        )
+        wallets = {
+            wallet.user_id: wallet for wallet in Wallet.objects
+            .select_for_update()
+            .filter(user_id__in={withdrawal.user_id for withdrawal in withdrawals})
+            .order_by('user_id')
+        }
+        ledger = []
+        settled_holds = {BalanceHoldStatus.CAPTURED: [], BalanceHoldStatus.RELEASED: []}
+
+        for withdrawal in withdrawals:
+            wallet = wallets[withdrawal.user_id]
+            payout_status, failure_reason = final_outcomes[f'{withdrawal.withdrawal_ref}']
+
+            if payout_status == StitchDisbursementStatus.COMPLETED.value:
+                withdrawal.completed()
+                ledger.append(wallet.capture(withdrawal.amount.amount))
+                settled_holds[BalanceHoldStatus.CAPTURED].append(withdrawal.hold_id)
+            else:
+                withdrawal.failed(failure_reason or payout_status)
+                wallet.release(withdrawal.amount.amount)
+                settled_holds[BalanceHoldStatus.RELEASED].append(withdrawal.hold_id)
+
+            withdrawal.modified = now
+
+        Transaction.objects.bulk_create(ledger)
+        Withdrawal.objects.bulk_update(withdrawals, ['status', 'failure_reason', 'modified'])
+
+        for hold_status, hold_ids in settled_holds.items():
+            BalanceHold.objects.filter(id__in=hold_ids).update(status=hold_status.name, modified=now)
+
+        for wallet in wallets.values():
+            wallet.save()
+            # the transactions were bulk created, which skips the post_save that bumps it for each of them
+            bump_data_version(wallet.user_id)
+
+    return len(withdrawals)
+
+
+def buffer_disbursement_outcome(withdrawal_ref: str, payout_status: str, failure_reason: str = '') -> None:
+    """
+    Buffers a final disbursement status from a webhook in Redis for :func:`settle_buffered_disbursement_outcomes`, so
+    that the wallets touched by a burst of webhooks are each locked once per settlement rather than once per webhook.
+    """
+    get_redis_connection().hset(
+        DISBURSEMENT_OUTCOMES_KEY, withdrawal_ref, json.dumps([payout_status, failure_reason])
+    )
+
+
+def settle_buffered_disbursement_outcomes() -> int:
+    """
+    Settles the buffered disbursement outcomes in batches of ``PAYOUT_SETTLEMENT_BATCH_SIZE``.
+
+    Returns the number of withdrawals settled.
+    """
+    redis_connection = get_redis_connection()
+    buffered_outcomes: List[bytes] = redis_connection.register_script(TAKE_DISBURSEMENT_OUTCOMES_SCRIPT)(
+        keys=[DISBURSEMENT_OUTCOMES_KEY, DISBURSEMENT_OUTCOMES_SETTLING_KEY]
+    )
+    outcomes = [
+        (withdrawal_ref.decode('utf-8'), tuple(json.loads(outcome)))
+        for withdrawal_ref, outcome in zip(buffered_outcomes[::2], buffered_outcomes[1::2])
+    ]
+    batch_size = settings.PAYOUT_SETTLEMENT_BATCH_SIZE
+    settled = 0
+
+    # settling is safe to re-run, so if a batch fails the outcomes are left aside for the next settlement to retry
+    for start in range(0, len(outcomes), batch_size):
+        settled += settle_withdrawals(dict(outcomes[start:start + batch_size]))
+
+    redis_connection.delete(DISBURSEMENT_OUTCOMES_SETTLING_KEY)
+
+    return settled
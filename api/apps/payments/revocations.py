@@ -0,0 +1,109 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import List, Tuple
+
+import requests
+import structlog
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from api.apps.payments.models import TokenRevocation
+from api.utils.libs.stitch.authentication import Authentication
+
+log = structlog.get_logger('api_requests')
+
+
+def claim_token_revocations(batch_size: int) -> List[TokenRevocation]:
+    """
+    Claims a batch of the token revocations that are due by pushing their next attempt back by
+    ``TOKEN_REVOCATION_LEASE_SECONDS``, so that relays running concurrently don't claim the same ones and a relay that
+    dies mid-batch leaves them to be retried once the lease runs out.
+    """
+    now = timezone.now()
+
+    with transaction.atomic():
+        claimed_ids = list(
+            TokenRevocation.objects
+            .select_for_update(skip_locked=True)
+            .filter(next_attempt_at__lte=now, attempts__lt=settings.TOKEN_REVOCATION_MAX_ATTEMPTS)
+            .order_by('next_attempt_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        TokenRevocation.objects.filter(id__in=claimed_ids).update(
+            attempts=F('attempts') + 1,
+            next_attempt_at=now + timedelta(seconds=settings.TOKEN_REVOCATION_LEASE_SECONDS),
+        )
+
+    return list(TokenRevocation.objects.filter(id__in=claimed_ids))
+
+
+def create_revocation_session() -> requests.Session:
+    """
+    Returns a session pooling a connection per concurrent revocation, which retries connection errors and server
+    errors with backoff before the revocation is left for the next relay.
+    """
+    retries = Retry(
+        total=settings.TOKEN_REVOCATION_HTTP_RETRIES,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        # revoking a token is idempotent, so the POSTs are safe to retry
+        allowed_methods=None,
+    )
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_maxsize=settings.TOKEN_REVOCATION_CONCURRENCY, max_retries=retries))
+
+    return session
+
+
+def relay_token_revocations() -> Tuple[int, int]:
+    """
+    Revokes the tokens in the outbox on Stitch, ``TOKEN_REVOCATION_BATCH_SIZE`` at a time with up to
+    ``TOKEN_REVOCATION_CONCURRENCY`` in flight. Revoked tokens are deleted from the outbox, the rest are retried with
+    exponential backoff until they've been attempted ``TOKEN_REVOCATION_MAX_ATTEMPTS`` times.
+
+    Returns the number of tokens revoked and the number that failed.
+    """
+    logger = log.bind(event='relay_token_revocations')
+    authentication = Authentication()
+    revoked = failed = 0
+
+    with create_revocation_session() as session, \
+            ThreadPoolExecutor(max_workers=settings.TOKEN_REVOCATION_CONCURRENCY) as executor:
+        while token_revocations := claim_token_revocations(settings.TOKEN_REVOCATION_BATCH_SIZE):
+            outcomes = list(executor.map(
+                lambda token_revocation: authentication.revoke_token(
+                    token=token_revocation.token, token_type=token_revocation.token_type, session=session
+                ),
+                token_revocations
+            ))
+
+            revoked_ids = [
+                token_revocation.id for token_revocation, outcome in zip(token_revocations, outcomes) if outcome
+            ]
+            TokenRevocation.objects.filter(id__in=revoked_ids).delete()
+
+            now = timezone.now()
+            failed_revocations = [
+                token_revocation for token_revocation, outcome in zip(token_revocations, outcomes) if not outcome
+            ]
+
+            for token_revocation in failed_revocations:
+                token_revocation.next_attempt_at = now + timedelta(
+                    seconds=settings.TOKEN_REVOCATION_RETRY_DELAY * 2 ** (token_revocation.attempts - 1)
+                )
+                token_revocation.last_error = 'Stitch did not revoke the token'
+                token_revocation.modified = now
+
+            TokenRevocation.objects.bulk_update(failed_revocations, ['next_attempt_at', 'last_error', 'modified'])
+
+            revoked += len(revoked_ids)
+            failed += len(failed_revocations)
+
+    if failed:
+        logger.error(message=f'Could not revoke {failed} tokens, they will be retried')
+
+    return revoked, failed
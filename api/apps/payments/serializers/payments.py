@@ -1,7 +1,62 @@
+from django.conf import settings
 from djmoney.contrib.django_rest_framework import MoneyField
 from rest_framework import serializers
 
 
+def validate_wallet_currency(amount, currency, description: str):
+    # the amount is moved in the user's wallet currency, so any other currency would be silently replaced
+    if currency is not None and f'{amount.currency}' != f'{currency}':
+        raise serializers.ValidationError(f'{description} amount should be in your wallet currency ({currency})')
+
+
 class InitiateWalletDepositSerializer(serializers.Serializer):
     amount = MoneyField(max_digits=19, decimal_places=2, default_currency="ZAR")
     account_id = serializers.CharField(max_length=50)
+
+
+class InitiateBulkWalletDepositSerializer(serializers.Serializer):
+    deposits = InitiateWalletDepositSerializer(
+        many=True, allow_empty=False, max_length=settings.BULK_DEPOSIT_MAX_ITEMS
+    )
+
+    def validate_deposits(self, deposits):
+        account_ids = [deposit['account_id'] for deposit in deposits]
+
+        # each deposit refreshes its account's token, and a refresh token can only be used once
+        if len(set(account_ids)) != len(account_ids):
+            raise serializers.ValidationError('Each linked account can only be used once per bulk deposit')
+
+        return deposits
+
+
+class InitiateWithdrawalSerializer(serializers.Serializer):
+    amount = MoneyField(max_digits=19, decimal_places=2, default_currency="ZAR")
+    account_id = serializers.CharField(max_length=50)
+
+    def validate_amount(self, amount):
+        if amount.amount <= 0:
+            raise serializers.ValidationError('Withdrawal amount should be greater than 0')
+
+        validate_wallet_currency(amount, self.context.get('currency'), 'Withdrawal')
+
+        return amount
+
+
+class InitiateTransferSerializer(serializers.Serializer):
+    amount = MoneyField(max_digits=19, decimal_places=2, default_currency="ZAR")
+    recipient = serializers.EmailField()
+    reference = serializers.CharField(max_length=100, required=False, default='', allow_blank=True)
+
+    def validate_amount(self, amount):
+        if amount.amount <= 0:
+            raise serializers.ValidationError('Transfer amount should be greater than 0')
+
+        validate_wallet_currency(amount, self.context.get('currency'), 'Transfer')
+
+        return amount
+
+
+class InitiateBulkTransferSerializer(serializers.Serializer):
+    transfers = InitiateTransferSerializer(
+        many=True, allow_empty=False, max_length=settings.BULK_TRANSFER_MAX_ITEMS
+    )
@@ -0,0 +1,83 @@
+from typing import Optional
+
+from django.db import transaction
+
+from api.apps.payments.events import publish_payment_event
+from api.apps.payments.limits import release_deposit
+from api.apps.payments.models import PaymentRequest, Wallet
+from api.utils.enums import PaymentRequestEventType, StitchLinkPayStatus
+
+FINAL_PAYMENT_STATUSES = (
+    StitchLinkPayStatus.COMPLETED.value,
+    StitchLinkPayStatus.FAILED.value,
+    StitchLinkPayStatus.EXPIRED.value,
+)
+
+
+def settle_payment_request(
+    transaction_ref, payment_status: str, failure_reason: str = '', event_type: Optional[str] = None,
+    event_description: str = ''
+) -> bool:
+    """
+    Applies a final Stitch payment initiation status to a payment request, crediting the user's wallet on completion.
+
+    This is the settlement path shared by the LinkPay webhook and the reconciliation poller, so the payment request
+    row is locked for the duration of the transition to make sure a payment is only ever settled once.
+
+    If ``event_type`` is given, an event of that type is recorded along with the settlement, in the same transaction,
+    e.g. to note which path settled the payment request.
+
+    Returns ``False`` without touching the payment request if the status is not a final one.
+    Raises :mod:`PaymentRequest.DoesNotExist` for unknown payment requests and :mod:`django_fsm.TransitionNotAllowed`
+    if the payment request has already been settled.
+    """
+    if payment_status not in FINAL_PAYMENT_STATUSES:
+        return False
+
+    with transaction.atomic():
+        payment_request: PaymentRequest = PaymentRequest.objects \
+            .select_for_update() \
+            .get(transaction_ref=transaction_ref)
+
+        match payment_status:
+            case StitchLinkPayStatus.COMPLETED.value:
+                payment_request.completed()
+                payment_request.save()
+
+                payment_request.paymentrequestevent_set.create(
+                    event_type=PaymentRequestEventType.COMPLETED.name
+                )
+
+                user_wallet: Wallet = Wallet.objects.select_for_update().get(user_id=payment_request.user_id)
+                user_wallet.deposit(payment_request.amount.amount)
+
+                publish_payment_event(payment_request, PaymentRequestEventType.COMPLETED.name)
+            case StitchLinkPayStatus.FAILED.value:
+                payment_request.failed()
+                payment_request.save()
+
+                payment_request.paymentrequestevent_set.create(
+                    event_type=PaymentRequestEventType.FAILED.name,
+                    event_description=failure_reason
+                )
+
+                publish_payment_event(payment_request, PaymentRequestEventType.FAILED.name)
+                release_deposit(payment_request)
+            case StitchLinkPayStatus.EXPIRED.value:
+                payment_request.expired()
+                payment_request.save()
+
+                payment_request.paymentrequestevent_set.create(
+                    event_type=PaymentRequestEventType.EXPIRED.name
+                )
+
+                publish_payment_event(payment_request, PaymentRequestEventType.EXPIRED.name)
+                release_deposit(payment_request)
+
+        if event_type is not None:
+            payment_request.paymentrequestevent_set.create(
+                event_type=event_type,
+                event_description=event_description
+            )
+
+    return True
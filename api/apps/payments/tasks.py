@@ -1,14 +1,30 @@
 import json
 import uuid
+from typing import List, Optional, Tuple
 
 import structlog
 from celery import shared_task
 from django.conf import settings
+from django.utils import timezone
 from django_fsm import TransitionNotAllowed
+from redis.exceptions import RedisError
 from svix.webhooks import Webhook, WebhookVerificationError
 
-from api.apps.payments.models import PaymentRequest, Wallet, PaymentRequestEvent
-from api.utils.enums import PaymentRequestEventType, StitchLinkPayStatus
+from api.apps.payments.bank_transactions import get_bank_transaction_sync_countdowns, \
+    get_due_bank_transaction_syncs, mark_bank_transaction_syncs_queued, sync_account_transactions
+from api.apps.payments.deposits import initiate_payment
+from api.apps.payments.kyc import finish_kyc_reverification, plan_kyc_reverification, verify_kyc_shard
+from api.apps.payments.limits import reconcile_deposit_counters
+from api.apps.payments.linking import process_account_link
+from api.apps.payments.models import PaymentRequest, BankAccountToken, AccountLink, \
+    KycVerificationRun
+from api.apps.payments.payouts import FINAL_DISBURSEMENT_STATUSES, buffer_disbursement_outcome, \
+    release_stalled_withdrawals, settle_buffered_disbursement_outcomes, settle_withdrawals, submit_withdrawal_batch
+from api.apps.payments.revocations import relay_token_revocations
+from api.apps.payments.settlement import settle_payment_request
+from api.utils.enums import PaymentRequestEventType, PaymentRequestStatus, AccountLinkStatus
+from api.utils.libs.stitch.errors import LinkPayError, StitchClientAuthenticationError
+from api.utils.libs.stitch.linkpay.linkpay import LinkPay
 
 log = structlog.get_logger('api_requests')
 
@@ -42,41 +58,15 @@ def process_linkpay_webhook_event(payload, headers):
         )
 
         try:
-            match payment_status:
-                case StitchLinkPayStatus.COMPLETED.value:
-                    payment_request.completed()
-                    payment_request.save()
-
-                    payment_request.paymentrequestevent_set.create(
-                        event_type=PaymentRequestEventType.COMPLETED.name
-                    )
-
-                    user_wallet: Wallet = Wallet.objects.get(user=payment_request.user)
-                    user_wallet.deposit(payment_request.amount.amount)
-                case StitchLinkPayStatus.FAILED.value:
-                    failure_reason = webhook_data['status']['reason']
-
-                    payment_request.failed()
-                    payment_request.save()
-
-                    payment_request.paymentrequestevent_set.create(
-                        event_type=PaymentRequestEventType.FAILED.name,
-                        event_description=failure_reason
-                    )
-                case StitchLinkPayStatus.EXPIRED.value:
-                    payment_request.expired()
-                    payment_request.save()
-
-                    payment_request.paymentrequestevent_set.create(
-                        event_type=PaymentRequestEventType.EXPIRED.name
-                    )
-                case default:
-                    msg = 'Received unknown status in payment request'
-                    logger.error(message=msg)
-                    payment_request.paymentrequestevent_set.create(
-                        event_type=PaymentRequestEventType.WEBHOOK_PROCESSING.name,
-                        event_description=msg
-                    )
+            failure_reason = webhook_data['status'].get('reason', '')
+
+            if not settle_payment_request(payment_request.transaction_ref, payment_status, failure_reason):
+                msg = 'Received unknown status in payment request'
+                logger.error(message=msg)
+                payment_request.paymentrequestevent_set.create(
+                    event_type=PaymentRequestEventType.WEBHOOK_PROCESSING.name,
+                    event_description=msg
+                )
         except TransitionNotAllowed as e:
             msg = f'Error processing payment request: {e}'
             logger.error(message=msg)
@@ -90,3 +80,327 @@ def process_linkpay_webhook_event(payload, headers):
     except WebhookVerificationError as e:
         logger.error(message=f'Could not verify webhook: {e}')
         return
+
+
+@shared_task()
+def reconcile_pending_payment_requests():
+    """
+    Catches up on missed webhooks by looking up the status of recently pending payment requests on Stitch in batches,
+    and settling any that have reached a final status through the same path as the LinkPay webhook.
+
+    Returns the number of payment requests that were corrected.
+    """
+    logger = log.bind(event='payment_reconciliation', request_id=str(uuid.uuid4()))
+    now = timezone.now()
+    batch_size = settings.STITCH_RECONCILIATION_BATCH_SIZE
+
+    pending_refs = list(
+        PaymentRequest.objects
+        .filter(
+            status=PaymentRequestStatus.NEW.name,
+            created__gte=now - settings.STITCH_RECONCILIATION_WINDOW,
+            created__lte=now - settings.STITCH_RECONCILIATION_GRACE_PERIOD,
+        )
+        .exclude(stitch_ref__in=['', 'error-getting-ref'])
+        .exclude(stitch_ref__isnull=True)
+        .order_by('created')
+        .values_list('stitch_ref', 'transaction_ref')
+    )
+    transaction_refs = dict(pending_refs)
+    corrected = 0
+
+    if not pending_refs:
+        logger.info(message='No pending payment requests to reconcile', corrected=corrected)
+        return corrected
+
+    try:
+        linkpay = LinkPay()
+    except (StitchClientAuthenticationError, LinkPayError) as e:
+        logger.error(message=f'Could not authenticate with Stitch: {e}')
+        return corrected
+
+    for i in range(0, len(pending_refs), batch_size):
+        stitch_refs = [stitch_ref for stitch_ref, _ in pending_refs[i:i + batch_size]]
+
+        try:
+            payment_initiations = linkpay.get_payment_initiation_statuses(stitch_refs)
+        except (StitchClientAuthenticationError, LinkPayError) as e:
+            logger.error(message=f'Could not fetch payment initiation statuses: {e}')
+            continue
+
+        for stitch_ref, payment_initiation in payment_initiations.items():
+            payment_status = payment_initiation['status']['__typename']
+            transaction_ref = transaction_refs.get(stitch_ref)
+
+            if transaction_ref is None:
+                continue
+
+            try:
+                settled = settle_payment_request(
+                    transaction_ref, payment_status, payment_initiation['status'].get('reason', ''),
+                    event_type=PaymentRequestEventType.RECONCILED.name,
+                    event_description=f'Settled as {payment_status} by the reconciliation poller'
+                )
+            except TransitionNotAllowed:
+                # settled by a webhook that arrived while the batch was in flight
+                continue
+
+            if settled:
+                corrected += 1
+
+    logger.info(message=f'Reconciled {corrected} of {len(pending_refs)} pending payment requests', corrected=corrected)
+
+    return corrected
+
+
+@shared_task()
+def initiate_deposit(transaction_ref, payment_request_data, account_token_id):
+    """
+    Initiates a deposit accepted by the ``deposit/initiate`` endpoint in async mode on LinkPay.
+
+    The outcome is recorded on the payment request for the deposit status endpoint to report back.
+    """
+    logger = log.bind(event='wallet_deposit_init', request_id=str(uuid.uuid4()), transaction_ref=transaction_ref)
+
+    payment_request = PaymentRequest.objects.get(transaction_ref=transaction_ref)
+    account_token = BankAccountToken.objects.get(id=account_token_id)
+
+    try:
+        initiate_payment(payment_request, payment_request_data, account_token)
+    except LinkPayError as e:
+        logger.error(message=e.get_full_details())
+        return
+    except Exception as e:
+        logger.error(message=f'An unexpected error happened trying to initiate payment request: {str(e)}')
+        return
+
+    logger.info(stitch_ref=payment_request.stitch_ref, message='Deposit initiated successfully')
+
+
+@shared_task()
+def reconcile_deposit_limit_counters():
+    """
+    Corrects any drift in the deposit limit counters kept in Redis by rewriting them from the payment requests.
+    """
+    logger = log.bind(event='deposit_counter_reconciliation', request_id=str(uuid.uuid4()))
+
+    reconciled = reconcile_deposit_counters()
+    logger.info(message=f'Reconciled the deposit counters of {reconciled} users')
+
+    return reconciled
+
+
+@shared_task()
+def link_account(link_id):
+    """
+    Completes an account link accepted by the ``linkpay/account/verify`` endpoint.
+
+    The outcome is recorded on the account link for the link status endpoint to report back.
+    """
+    logger = log.bind(event='finalize_linking', request_id=str(uuid.uuid4()), link_id=link_id)
+
+    try:
+        account_link = process_account_link(link_id)
+    except Exception as e:
+        logger.error(message=f'An unexpected error happened trying to link the account: {e}')
+        AccountLink.objects \
+            .filter(id=link_id, status=AccountLinkStatus.PENDING.name) \
+            .update(
+                status=AccountLinkStatus.FAILED.name, failure_reason=f'{e}', user_token='', modified=timezone.now()
+            )
+        return
+
+    logger.info(status=account_link.status, message='Account link processed')
+
+
+@shared_task()
+def revoke_unlinked_account_tokens():
+    """
+    Revokes the tokens of unlinked accounts on Stitch, which the ``linkpay/account/unlink`` endpoint queues up in the
+    token revocation outbox along with deleting the account.
+    """
+    logger = log.bind(event='revoke_unlinked_account_tokens', request_id=str(uuid.uuid4()))
+
+    revoked, failed = relay_token_revocations()
+    logger.info(message=f'Revoked {revoked} tokens, {failed} failed')
+
+    return revoked
+
+
+@shared_task()
+def schedule_bank_transaction_syncs():
+    """
+    Queues a sync of the transactions of every linked account that's due one, spread out over time so the workers and
+    Stitch aren't flooded when many accounts fall due at once. Only as many syncs as fit in one scheduling interval
+    are queued, the rest are left for the next run.
+
+    Returns the number of syncs queued.
+    """
+    logger = log.bind(event='schedule_bank_transaction_syncs', request_id=str(uuid.uuid4()))
+
+    account_pks = get_due_bank_transaction_syncs()
+    mark_bank_transaction_syncs_queued(account_pks)
+
+    for account_pk, countdown in zip(account_pks, get_bank_transaction_sync_countdowns(account_pks)):
+        sync_bank_transactions.apply_async((account_pk,), countdown=countdown)
+
+    logger.info(message=f'Queued {len(account_pks)} bank transaction syncs')
+
+    return len(account_pks)
+
+
+@shared_task(rate_limit=settings.BANK_TRANSACTION_SYNC_RATE_LIMIT)
+def sync_bank_transactions(account_pk):
+    """
+    Syncs the new transactions of a linked account from Stitch. Rate limited per worker by
+    ``BANK_TRANSACTION_SYNC_RATE_LIMIT``.
+    """
+    logger = log.bind(event='sync_bank_transactions', request_id=str(uuid.uuid4()), account=account_pk)
+
+    try:
+        synced = sync_account_transactions(account_pk)
+    except Exception as e:
+        logger.error(message=f'Could not sync the account\'s transactions: {e}')
+        return
+
+    if synced is None:
+        logger.info(message='Skipped as the account is already being synced')
+        return
+
+    logger.info(message=f'Synced {synced} transactions')
+
+    return synced
+
+
+@shared_task()
+def start_kyc_reverification():
+    """
+    Re-verifies every linked account against its user's KYC details, by splitting the accounts into shards that are
+    verified by the workers in parallel. Running it again before this month's run has finished resumes the run,
+    queueing only the accounts it has yet to verify.
+
+    Returns the number of shards queued.
+    """
+    return queue_kyc_reverification(*plan_kyc_reverification())
+
+
+@shared_task()
+def resume_kyc_reverification():
+    """
+    Resumes this month's run if it has stalled, either because a shard didn't finish or because some accounts couldn't
+    be looked up and have attempts left, queueing only the accounts it has yet to verify.
+
+    Returns the number of shards queued.
+    """
+    return queue_kyc_reverification(*plan_kyc_reverification(resume_only=True))
+
+
+def queue_kyc_reverification(run: Optional[KycVerificationRun], shards: List[Tuple[int, int]]) -> int:
+    if run is None:
+        return 0
+
+    logger = log.bind(event='kyc_reverification', request_id=str(uuid.uuid4()))
+
+    for first_pk, last_pk in shards:
+        reverify_kyc_shard.delay(f'{run.id}', first_pk, last_pk)
+
+    logger.info(run=f'{run.id}', message=f'Queued {len(shards)} shards of {run.total_accounts} accounts')
+
+    return len(shards)
+
+
+@shared_task()
+def reverify_kyc_shard(run_id, first_pk, last_pk):
+    run = KycVerificationRun.objects.get(id=run_id)
+
+    verified = verify_kyc_shard(run, first_pk, last_pk)
+    finish_kyc_reverification(run)
+
+    return verified
+
+
+@shared_task()
+def submit_pending_withdrawals():
+    """
+    Submits the pending withdrawals for disbursement, one batch of ``PAYOUT_BATCH_SIZE`` at a time until there are
+    none left.
+
+    Returns the number of withdrawals submitted.
+    """
+    logger = log.bind(event='submit_pending_withdrawals', request_id=str(uuid.uuid4()))
+    submitted = 0
+
+    try:
+        while batch_submitted := submit_withdrawal_batch():
+            submitted += batch_submitted
+    except Exception as e:
+        logger.error(message=f'Could not submit withdrawals: {e}')
+
+    logger.info(message=f'Submitted {submitted} withdrawals')
+
+    return submitted
+
+
+@shared_task()
+def resubmit_stalled_withdrawals():
+    """
+    Puts withdrawals whose submission never finished back for the next batch, and submits them if any were found.
+    """
+    logger = log.bind(event='resubmit_stalled_withdrawals', request_id=str(uuid.uuid4()))
+
+    released = release_stalled_withdrawals()
+    logger.info(message=f'Put back {released} stalled withdrawals')
+
+    if released:
+        submit_pending_withdrawals.delay()
+
+    return released
+
+
+@shared_task()
+def process_disbursement_webhook_event(payload, headers):
+    webhook_data = payload['data']['client']['disbursements']['node']
+    withdrawal_ref = webhook_data['externalReference']
+    payout_status = webhook_data['status']['__typename']
+
+    logger = log.bind(
+        event='disbursement_webhook_processing', request_id=str(uuid.uuid4()), withdrawal_ref=withdrawal_ref,
+        status=payout_status
+    )
+
+    try:
+        # we need to ensure the data doesn't have any spaces between values
+        parsed_payload = json.dumps(payload, separators=(',', ':'))
+        Webhook(settings.PAYOUT_WEBHOOK_SECRET_KEY).verify(parsed_payload, headers)
+    except WebhookVerificationError as e:
+        logger.error(message=f'Could not verify webhook: {e}')
+        return
+
+    if payout_status not in FINAL_DISBURSEMENT_STATUSES:
+        logger.info(message='Skipped as the disbursement has not settled yet')
+        return
+
+    failure_reason = webhook_data['status'].get('reason', '')
+
+    try:
+        buffer_disbursement_outcome(withdrawal_ref, payout_status, failure_reason)
+    except RedisError as e:
+        logger.error(message=f'Could not buffer the disbursement outcome, settling it instead: {e}')
+        settle_withdrawals({withdrawal_ref: (payout_status, failure_reason)})
+        return
+
+    logger.info(message='Disbursement outcome buffered for settlement')
+
+
+@shared_task()
+def settle_disbursement_outcomes():
+    """
+    Settles the withdrawals whose disbursement outcomes have been buffered by the disbursement webhook since the last
+    settlement, capturing or releasing their holds in bulk.
+    """
+    logger = log.bind(event='settle_disbursement_outcomes', request_id=str(uuid.uuid4()))
+
+    settled = settle_buffered_disbursement_outcomes()
+    logger.info(message=f'Settled {settled} withdrawals')
+
+    return settled
@@ -0,0 +1,108 @@
+import mock
+from django.contrib.auth import get_user_model
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from api.apps.payments.models import AccountLink, BankAccount
+from api.apps.payments.tasks import link_account
+from api.apps.payments.tests.test_deposits import create_linked_account, USER_TOKEN
+from api.utils.enums import AccountLinkStatus
+from api.utils.libs.stitch.errors import LinkPayError
+from api.utils.redis import get_redis_connection
+
+
+def linked_account_identity(full_name='Ozzy Osbourne', identification_number='12345678'):
+    return {
+        'user': {
+            'paymentAuthorization': {
+                'bankAccount': {
+                    'id': 'account-1',
+                    'bankId': 'absa',
+                    'name': 'Cheque',
+                    'accountType': 'current',
+                    'accountNumber': '1234567890',
+                    'accountHolder': {
+                        'fullName': full_name,
+                        'identifyingDocument': {'number': identification_number},
+                    },
+                },
+            },
+        },
+    }
+
+
+@mock.patch('api.apps.payments.linking.LinkPay')
+@mock.patch('api.apps.payments.views.linkpay.Authentication')
+class AccountLinkingTest(APITestCase):
+    def setUp(self):
+        get_redis_connection().flushdb()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', full_name='Ozzy Osbourne', short_name='Ozzy', password='hackobob',
+            identification_number='12345678'
+        )
+        self.client.force_authenticate(self.user)
+
+    @mock.patch('api.apps.payments.views.linkpay.link_account')
+    def link_account(self, task):
+        response = self.client.post(
+            reverse('payments:linkpay_verify_linked_account'), data={'code': 'code', 'state': 'state'}
+        )
+        self.assertEqual(status.HTTP_202_ACCEPTED, response.status_code)
+
+        task.delay.assert_called_once_with(response.data['link_id'])
+        link_account(*task.delay.call_args.args)
+
+        return self.client.get(reverse('payments:account_link_status', args=[response.data['link_id']])).data
+
+    def test_accounts_are_linked_in_the_background(self, authentication, linkpay):
+        authentication.return_value.get_user_token.return_value = USER_TOKEN
+        linkpay.return_value.get_linked_account_identity.return_value = linked_account_identity()
+
+        link_status = self.link_account()
+
+        account = BankAccount.objects.get(account_id='account-1')
+        self.assertEqual(AccountLinkStatus.LINKED.name, link_status['status'])
+        self.assertEqual('account-1', link_status['account_id'])
+        self.assertEqual(USER_TOKEN['refresh_token'], account.bankaccounttoken.refresh_token)
+        self.assertEqual('', AccountLink.objects.get().user_token)
+
+    def test_accounts_that_are_already_linked_are_not_linked_again(self, authentication, linkpay):
+        create_linked_account(self.user)
+        authentication.return_value.get_user_token.return_value = USER_TOKEN
+        linkpay.return_value.get_linked_account_identity.return_value = linked_account_identity()
+
+        link_status = self.link_account()
+
+        self.assertEqual(AccountLinkStatus.ALREADY_LINKED.name, link_status['status'])
+        self.assertEqual(1, BankAccount.objects.count())
+
+    def test_accounts_not_matching_the_users_kyc_details_are_rejected(self, authentication, linkpay):
+        authentication.return_value.get_user_token.return_value = USER_TOKEN
+        linkpay.return_value.get_linked_account_identity.return_value = linked_account_identity(full_name='Tony Iommi')
+
+        link_status = self.link_account()
+
+        self.assertEqual(AccountLinkStatus.KYC_MISMATCH.name, link_status['status'])
+        self.assertIsNotNone(link_status['error'])
+        self.assertFalse(BankAccount.objects.exists())
+
+    def test_links_fail_when_the_identity_cant_be_fetched(self, authentication, linkpay):
+        authentication.return_value.get_user_token.return_value = USER_TOKEN
+        linkpay.return_value.get_linked_account_identity.side_effect = LinkPayError('Stitch is down')
+
+        link_status = self.link_account()
+
+        self.assertEqual(AccountLinkStatus.FAILED.name, link_status['status'])
+        self.assertFalse(BankAccount.objects.exists())
+
+    def test_other_users_links_are_not_found(self, authentication, linkpay):
+        account_link = AccountLink.objects.create(
+            user=get_user_model().objects.create_user(
+                email='other@example.com', full_name='Tony Iommi', short_name='Tony', password='hackobob'
+            )
+        )
+
+        response = self.client.get(reverse('payments:account_link_status', args=[account_link.id]))
+
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
@@ -0,0 +1,113 @@
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from djmoney.money import Money
+
+from api.apps.payments.balances import get_cached_wallet_balance
+from api.apps.payments.errors import CurrencyMismatch, HoldNotActive, InsufficientBalance
+from api.apps.payments.holds import authorize_hold, capture_hold, release_hold
+from api.apps.payments.models import BalanceHold, Transaction, Wallet
+from api.utils.enums import BalanceHoldStatus
+from api.utils.redis import get_redis_connection
+
+
+def create_funded_wallet(user, amount='100.00'):
+    wallet = Wallet.objects.create(user=user)
+    wallet.deposit(Decimal(amount))
+
+    return wallet
+
+
+class BalanceHoldTest(TestCase):
+    def setUp(self):
+        get_redis_connection().flushdb()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', full_name='Ozzy Osbourne', short_name='Ozzy', password='hackobob'
+        )
+        create_funded_wallet(self.user)
+
+    def get_wallet(self):
+        return Wallet.objects.get(user=self.user)
+
+    def test_holds_reserve_the_available_balance_until_captured(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            hold = authorize_hold(self.user.id, Money('60.00', 'ZAR'))
+
+        self.assertEqual(Decimal('40.00'), self.get_wallet().available.amount)
+        self.assertEqual('40.00', get_cached_wallet_balance(self.user.id)['available'])
+
+        with self.assertRaises(InsufficientBalance):
+            authorize_hold(self.user.id, Money('50.00', 'ZAR'))
+
+        ledger_entry = capture_hold(hold.id)
+
+        wallet = self.get_wallet()
+        self.assertEqual(Decimal('40.00'), wallet.amount.amount)
+        self.assertEqual(Decimal('0.00'), wallet.reserved.amount)
+        self.assertEqual(Decimal('40.00'), ledger_entry.running_balance.amount)
+        self.assertEqual(BalanceHoldStatus.CAPTURED.name, BalanceHold.objects.get(id=hold.id).status)
+
+    def test_holds_are_only_placed_in_the_wallet_currency(self):
+        with self.assertRaises(CurrencyMismatch):
+            authorize_hold(self.user.id, Money('60.00', 'USD'))
+
+        self.assertEqual(Decimal('0.00'), self.get_wallet().reserved.amount)
+        self.assertFalse(BalanceHold.objects.exists())
+
+    def test_holds_can_only_be_settled_once(self):
+        hold = authorize_hold(self.user.id, Money('60.00', 'ZAR'))
+
+        release_hold(hold.id)
+
+        with self.assertRaises(HoldNotActive):
+            capture_hold(hold.id)
+
+        wallet = self.get_wallet()
+        self.assertEqual(Decimal('100.00'), wallet.available.amount)
+        self.assertEqual(1, Transaction.objects.filter(wallet=wallet).count())
+
+    def test_withdrawals_cant_spend_held_amounts(self):
+        authorize_hold(self.user.id, Money('60.00', 'ZAR'))
+
+        with self.assertRaises(InsufficientBalance):
+            self.get_wallet().withdraw(Money('50.00', 'ZAR'))
+
+
+class ConcurrentBalanceHoldTest(TransactionTestCase):
+    def setUp(self):
+        get_redis_connection().flushdb()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', full_name='Ozzy Osbourne', short_name='Ozzy', password='hackobob'
+        )
+        create_funded_wallet(self.user)
+
+    def test_concurrent_holds_cant_overdraw_the_wallet(self):
+        def hold(_):
+            try:
+                authorize_hold(self.user.id, Money('30.00', 'ZAR'))
+                return True
+            except InsufficientBalance:
+                return False
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            authorized = list(executor.map(hold, range(8)))
+
+        self.assertEqual(3, sum(authorized))
+        self.assertEqual(Decimal('90.00'), Wallet.objects.get(user=self.user).reserved.amount)
+
+    def test_benchmark_reports_the_throughput_of_each_strategy(self):
+        out = StringIO()
+
+        call_command('benchmark_balance_holds', operations=8, concurrency=4, io_ms=0, stdout=out)
+
+        self.assertIn('locked: ', out.getvalue())
+        self.assertIn('holds: ', out.getvalue())
+        self.assertIn('reserved: 0.00, transactions: 17', out.getvalue())
+        self.assertEqual(1, Wallet.objects.count())
@@ -0,0 +1,47 @@
+from django.contrib.auth import get_user_model
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from api.apps.payments.balances import cache_wallet_balance, get_cached_wallet_balance
+from api.apps.payments.models import Wallet
+from api.utils.redis import get_redis_connection
+
+
+class WalletBalanceCacheTest(APITestCase):
+    def setUp(self):
+        get_redis_connection().flushdb()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', full_name='Ozzy Osbourne', short_name='Ozzy', password='hackobob'
+        )
+        self.wallet = Wallet.objects.create(user=self.user)
+        self.client.force_authenticate(self.user)
+
+    def test_deposits_are_written_through_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.wallet.deposit(100)
+
+        cached_balance = get_cached_wallet_balance(self.user.id)
+
+        self.assertEqual('100.00', cached_balance['balance'])
+        self.assertEqual(1, cached_balance['version'])
+
+    def test_stale_writes_do_not_replace_later_balances(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.wallet.deposit(100)
+
+        stale_balance = {'version': 0, 'balance': '0.00', 'available': '0.00', 'currency': 'ZAR', 'last_activity': ''}
+
+        self.assertFalse(cache_wallet_balance(self.user.id, stale_balance))
+        self.assertEqual('100.00', get_cached_wallet_balance(self.user.id)['balance'])
+
+    def test_balance_is_read_through_the_cache(self):
+        with self.assertNumQueries(1):
+            first = self.client.get(reverse('payments:wallet_balance'))
+
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('payments:wallet_balance'))
+
+        self.assertEqual(status.HTTP_200_OK, first.status_code)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual('0.00', second.data['amount'])
@@ -0,0 +1,80 @@
+import mock
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from redis.lock import Lock
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from api.apps.payments.bank_balances import cache_bank_balances
+from api.apps.payments.models import BankAccountToken
+from api.apps.payments.tests.test_deposits import create_linked_account, USER_TOKEN
+from api.utils.libs.stitch.errors import LinkPayError
+from api.utils.redis import get_redis_connection
+
+ACCOUNT_BALANCE = {
+    'id': 'account-1',
+    'currentBalance': {'quantity': '1500.00', 'currency': 'ZAR'},
+    'availableBalance': {'quantity': '1200.00', 'currency': 'ZAR'},
+}
+
+
+@mock.patch('api.apps.payments.bank_balances.LinkPay')
+@mock.patch('api.apps.payments.bank_balances.BaseAPI')
+class BankBalanceTest(APITestCase):
+    def setUp(self):
+        get_redis_connection().flushdb()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', full_name='Ozzy Osbourne', short_name='Ozzy', password='hackobob'
+        )
+        self.accounts = [create_linked_account(self.user), create_linked_account(self.user, account_id='account-2')]
+        self.client.force_authenticate(self.user)
+
+    def fetch_balances(self):
+        response = self.client.get(reverse('payments:linked_account_balances'))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+        return response.data
+
+    def test_balances_are_fetched_once_and_cached(self, base_api, linkpay):
+        base_api.return_value.refresh_user_credentials.return_value = USER_TOKEN
+        linkpay.return_value.get_linked_account_balance.return_value = ACCOUNT_BALANCE
+
+        balances = self.fetch_balances()
+
+        self.assertEqual(['account-1', 'account-2'], [balance['_account_id_data'] for balance in balances])
+        self.assertEqual('1200.00', balances[0]['balance']['available_balance'])
+        self.assertEqual(2, linkpay.return_value.get_linked_account_balance.call_count)
+        self.assertEqual(
+            {USER_TOKEN['refresh_token']}, set(BankAccountToken.objects.values_list('refresh_token', flat=True))
+        )
+
+        self.assertEqual(balances, self.fetch_balances())
+        self.assertEqual(2, linkpay.return_value.get_linked_account_balance.call_count)
+
+    # fetched one at a time, so the lookups fail in order
+    @override_settings(BANK_BALANCE_CONCURRENCY=1)
+    def test_balances_that_cant_be_fetched_are_not_cached(self, base_api, linkpay):
+        base_api.return_value.refresh_user_credentials.return_value = USER_TOKEN
+        linkpay.return_value.get_linked_account_balance.side_effect = [ACCOUNT_BALANCE, LinkPayError('Stitch is down')]
+
+        balances = self.fetch_balances()
+
+        self.assertEqual([True, False], [balance['balance'] is not None for balance in balances])
+
+        linkpay.return_value.get_linked_account_balance.side_effect = None
+        linkpay.return_value.get_linked_account_balance.return_value = ACCOUNT_BALANCE
+
+        self.assertIsNotNone(self.fetch_balances()[1]['balance'])
+        self.assertEqual(3, linkpay.return_value.get_linked_account_balance.call_count)
+
+    def test_requests_waiting_on_a_fetch_use_its_balances(self, base_api, linkpay):
+        def acquire_after_concurrent_fetch(*args, **kwargs):
+            cache_bank_balances({account.id: {'available_balance': '1200.00'} for account in self.accounts})
+            return True
+
+        with mock.patch.object(Lock, 'acquire', side_effect=acquire_after_concurrent_fetch):
+            balances = self.fetch_balances()
+
+        self.assertEqual(['1200.00', '1200.00'], [balance['balance']['available_balance'] for balance in balances])
+        linkpay.return_value.get_linked_account_balance.assert_not_called()
@@ -0,0 +1,124 @@
+import mock
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from api.apps.payments.bank_transactions import bank_transaction_sync_lock_key, sync_account_transactions
+from api.apps.payments.models import BankTransaction, BankTransactionSync
+from api.apps.payments.tasks import schedule_bank_transaction_syncs
+from api.apps.payments.tests.test_deposits import create_linked_account, USER_TOKEN
+from api.utils.libs.stitch.errors import LinkPayError
+from api.utils.redis import get_redis_connection
+
+
+def transactions_page(transaction_ids, end_cursor, has_next_page=False, description='Groceries'):
+    return {
+        'pageInfo': {'hasNextPage': has_next_page, 'endCursor': end_cursor},
+        'edges': [
+            {
+                'node': {
+                    'id': transaction_id,
+                    'amount': {'quantity': '-150.00', 'currency': 'ZAR'},
+                    'runningBalance': {'quantity': '1000.00', 'currency': 'ZAR'},
+                    'reference': 'REF',
+                    'description': description,
+                    'date': '2026-10-18',
+                },
+            } for transaction_id in transaction_ids
+        ],
+    }
+
+
+@mock.patch('api.apps.payments.bank_transactions.LinkPay')
+@mock.patch('api.apps.payments.bank_transactions.BaseAPI')
+class BankTransactionSyncTest(TestCase):
+    def setUp(self):
+        get_redis_connection().flushdb()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', full_name='Ozzy Osbourne', short_name='Ozzy', password='hackobob'
+        )
+        self.account = create_linked_account(self.user)
+
+    def test_syncs_continue_from_the_last_cursor(self, base_api, linkpay):
+        base_api.return_value.refresh_user_credentials.return_value = USER_TOKEN
+        get_transactions = linkpay.return_value.get_linked_account_transactions
+        get_transactions.side_effect = [
+            transactions_page(['txn-1', 'txn-2'], 'cursor-1', has_next_page=True),
+            transactions_page(['txn-3'], 'cursor-2'),
+        ]
+
+        self.assertEqual(3, sync_account_transactions(self.account.id))
+        self.assertEqual('cursor-2', BankTransactionSync.objects.get(account=self.account).cursor)
+
+        # an updated transaction coming through again is upserted rather than duplicated
+        get_transactions.side_effect = [transactions_page(['txn-3', 'txn-4'], 'cursor-3', description='Fuel')]
+
+        self.assertEqual(2, sync_account_transactions(self.account.id))
+        self.assertEqual(mock.call(first=100, after='cursor-2'), get_transactions.call_args)
+        self.assertEqual(4, BankTransaction.objects.filter(account=self.account).count())
+        self.assertEqual('Fuel', BankTransaction.objects.get(bank_transaction_id='txn-3').description)
+
+    def test_accounts_linked_by_several_users_each_get_their_transactions(self, base_api, linkpay):
+        base_api.return_value.refresh_user_credentials.return_value = USER_TOKEN
+        linkpay.return_value.get_linked_account_transactions.side_effect = lambda **kwargs: transactions_page(
+            ['txn-1', 'txn-2'], 'cursor-1'
+        )
+        other_user = get_user_model().objects.create_user(
+            email='other@example.com', full_name='Sharon Osbourne', short_name='Sharon', password='hackobob'
+        )
+        other_account = create_linked_account(other_user)
+
+        sync_account_transactions(self.account.id)
+        sync_account_transactions(other_account.id)
+
+        self.assertEqual(2, BankTransaction.objects.filter(account=self.account).count())
+        self.assertEqual(2, BankTransaction.objects.filter(account=other_account).count())
+
+    def test_failed_syncs_keep_the_pages_already_saved(self, base_api, linkpay):
+        base_api.return_value.refresh_user_credentials.return_value = USER_TOKEN
+        linkpay.return_value.get_linked_account_transactions.side_effect = [
+            transactions_page(['txn-1'], 'cursor-1', has_next_page=True),
+            LinkPayError('Stitch is down'),
+        ]
+
+        with self.assertRaises(LinkPayError):
+            sync_account_transactions(self.account.id)
+
+        sync_state = BankTransactionSync.objects.get(account=self.account)
+        self.assertEqual('cursor-1', sync_state.cursor)
+        self.assertEqual('Stitch is down', sync_state.last_error)
+        self.assertTrue(BankTransaction.objects.filter(bank_transaction_id='txn-1').exists())
+
+    def test_accounts_already_being_synced_are_skipped(self, base_api, linkpay):
+        get_redis_connection().set(bank_transaction_sync_lock_key(self.account.id), 'token')
+
+        self.assertIsNone(sync_account_transactions(self.account.id))
+        base_api.return_value.refresh_user_credentials.assert_not_called()
+
+    def test_only_accounts_that_are_due_are_scheduled(self, base_api, linkpay):
+        synced_account = create_linked_account(self.user, account_id='account-2')
+        BankTransactionSync.objects.create(account=synced_account, synced_at=timezone.now())
+
+        with mock.patch('api.apps.payments.tasks.sync_bank_transactions.apply_async') as apply_async:
+            self.assertEqual(1, schedule_bank_transaction_syncs())
+
+        apply_async.assert_called_once_with((self.account.id,), countdown=0)
+
+        # already queued, so it isn't queued again while it's waiting to be synced
+        with mock.patch('api.apps.payments.tasks.sync_bank_transactions.apply_async') as apply_async:
+            self.assertEqual(0, schedule_bank_transaction_syncs())
+
+        apply_async.assert_not_called()
+
+    @override_settings(BANK_TRANSACTION_SYNC_CONCURRENCY=1, BANK_TRANSACTION_SYNC_WAVE_SECONDS=600)
+    def test_only_the_syncs_that_fit_in_one_interval_are_scheduled(self, base_api, linkpay):
+        other_account = create_linked_account(self.user, account_id='account-2')
+
+        with mock.patch('api.apps.payments.tasks.sync_bank_transactions.apply_async') as apply_async:
+            self.assertEqual(1, schedule_bank_transaction_syncs())
+            self.assertEqual(1, schedule_bank_transaction_syncs())
+
+        self.assertEqual(
+            [mock.call((self.account.id,), countdown=0), mock.call((other_account.id,), countdown=0)],
+            apply_async.call_args_list
+        )
@@ -0,0 +1,100 @@
+from decimal import Decimal
+
+import mock
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from django.utils import timezone
+from redis.exceptions import ConnectionError
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from api.apps.payments.limits import deposit_counters_key
+from api.apps.payments.models import PaymentRequest
+from api.apps.payments.tasks import reconcile_deposit_limit_counters
+from api.apps.payments.tests.test_deposits import create_linked_account, USER_TOKEN, PAYMENT_INITIATION
+from api.utils.enums import PaymentRequestStatus
+from api.utils.redis import get_redis_connection
+
+
+@override_settings(
+    DEPOSIT_DAILY_LIMIT=Decimal('150'), DEPOSIT_MONTHLY_LIMIT=Decimal('1000'), DEPOSIT_HOURLY_VELOCITY_LIMIT=3
+)
+@mock.patch('api.apps.payments.deposits.LinkPay')
+@mock.patch('api.apps.payments.deposits.BaseAPI')
+class DepositLimitsTest(APITestCase):
+    def setUp(self):
+        get_redis_connection().flushdb()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', full_name='Ozzy Osbourne', short_name='Ozzy', password='hackobob'
+        )
+        create_linked_account(self.user)
+        self.client.force_authenticate(self.user)
+
+    def initiate_deposit(self, amount='100.00'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                reverse('payments:initiate_deposit'),
+                data={'amount': amount, 'amount_currency': 'ZAR', 'account_id': 'account-1'}
+            )
+
+    def test_deposits_over_the_daily_limit_are_rejected(self, base_api, linkpay):
+        base_api.return_value.refresh_user_credentials.return_value = USER_TOKEN
+        linkpay.return_value.initiate_user_payment.return_value = PAYMENT_INITIATION
+
+        first = self.initiate_deposit()
+        second = self.initiate_deposit()
+
+        self.assertEqual(status.HTTP_200_OK, first.status_code)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, second.status_code)
+        self.assertEqual('daily', second.data['limit'])
+        self.assertEqual(1, linkpay.return_value.initiate_user_payment.call_count)
+        self.assertEqual(1, PaymentRequest.objects.count())
+
+    def test_failed_deposits_are_released_but_count_towards_velocity(self, base_api, linkpay):
+        base_api.return_value.refresh_user_credentials.return_value = USER_TOKEN
+        linkpay.return_value.initiate_user_payment.side_effect = Exception('Stitch is down')
+
+        statuses = [self.initiate_deposit().status_code for _ in range(4)]
+
+        self.assertEqual([status.HTTP_500_INTERNAL_SERVER_ERROR] * 3 + [status.HTTP_400_BAD_REQUEST], statuses)
+        self.assertEqual(
+            {b'amount': b'0', b'count': b'3'},
+            get_redis_connection().hgetall(deposit_counters_key(self.user.id, 'day', timezone.now()))
+        )
+
+    @mock.patch('api.apps.payments.limits.get_redis_connection')
+    def test_limits_are_checked_against_payment_requests_without_redis(self, get_connection, base_api, linkpay):
+        get_connection.return_value.register_script.return_value.side_effect = ConnectionError()
+        base_api.return_value.refresh_user_credentials.return_value = USER_TOKEN
+        linkpay.return_value.initiate_user_payment.return_value = PAYMENT_INITIATION
+
+        first = self.initiate_deposit()
+
+        # the linked account lookup and a single aggregate over the payment requests
+        with self.assertNumQueries(2):
+            second = self.initiate_deposit()
+
+        self.assertEqual(status.HTTP_200_OK, first.status_code)
+        self.assertEqual('daily', second.data['limit'])
+
+    def test_counters_are_reconciled_against_payment_requests(self, base_api, linkpay):
+        other_user = get_user_model().objects.create_user(
+            email='other@example.com', full_name='Tony Iommi', short_name='Tony', password='hackobob'
+        )
+        PaymentRequest.objects.create(user=self.user, amount=Decimal('40'), amount_currency='ZAR')
+        PaymentRequest.objects.create(
+            user=self.user, amount=Decimal('60'), amount_currency='ZAR', status=PaymentRequestStatus.FAILED.name
+        )
+
+        connection = get_redis_connection()
+        now = timezone.now()
+        connection.hset(deposit_counters_key(self.user.id, 'month', now), mapping={'amount': 999, 'count': 9})
+        connection.hset(deposit_counters_key(other_user.id, 'month', now), mapping={'amount': 500, 'count': 1})
+
+        self.assertEqual(1, reconcile_deposit_limit_counters())
+        self.assertEqual(
+            {b'amount': b'4000', b'count': b'2'},
+            connection.hgetall(deposit_counters_key(self.user.id, 'month', now))
+        )
+        self.assertFalse(connection.exists(deposit_counters_key(other_user.id, 'month', now)))
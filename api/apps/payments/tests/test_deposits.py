@@ -0,0 +1,273 @@
+import mock
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, connection
+from django.test import TransactionTestCase
+from djmoney.money import Money
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from api.apps.payments.deposits import initiate_bulk_payments
+from api.apps.payments.models import BankAccount, BankAccountToken, PaymentRequest
+from api.apps.payments.tasks import initiate_deposit
+from api.utils.enums import PaymentRequestStatus
+from api.utils.libs.stitch.errors import LinkPayError
+from api.utils.redis import get_redis_connection
+
+USER_TOKEN = {'id_token': 'id-token', 'refresh_token': 'new-refresh-token', 'access_token': 'access-token'}
+PAYMENT_INITIATION = {'userInitiatePayment': {'paymentInitiation': {'id': 'stitch-ref'}}}
+
+
+def create_linked_account(user, account_id='account-1'):
+    account = BankAccount.objects.create(
+        user=user,
+        bank_id='absa',
+        account_id=account_id,
+        name='Cheque',
+        account_name=user.full_name,
+        account_type='current',
+        account_number='1234567890',
+    )
+    BankAccountToken.objects.create(account=account, token_id='id-token', refresh_token='refresh-token')
+
+    return account
+
+
+@mock.patch('api.apps.payments.deposits.LinkPay')
+@mock.patch('api.apps.payments.deposits.BaseAPI')
+class InitiateWalletDepositIdempotencyTest(APITestCase):
+    def setUp(self):
+        get_redis_connection().flushdb()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', full_name='Ozzy Osbourne', short_name='Ozzy', password='hackobob'
+        )
+        create_linked_account(self.user)
+        self.client.force_authenticate(self.user)
+
+    def initiate_deposit(self, amount='100.00', **headers):
+        return self.client.post(
+            reverse('payments:initiate_deposit'),
+            data={'amount': amount, 'amount_currency': 'ZAR', 'account_id': 'account-1'},
+            **headers
+        )
+
+    def test_retries_with_the_same_key_replay_the_first_response(self, base_api, linkpay):
+        base_api.return_value.refresh_user_credentials.return_value = USER_TOKEN
+        linkpay.return_value.initiate_user_payment.return_value = PAYMENT_INITIATION
+
+        first = self.initiate_deposit(HTTP_IDEMPOTENCY_KEY='deposit-1')
+        retry = self.initiate_deposit(HTTP_IDEMPOTENCY_KEY='deposit-1')
+
+        self.assertEqual(status.HTTP_200_OK, first.status_code)
+        self.assertEqual(first.data, retry.data)
+        self.assertEqual('true', retry['Idempotent-Replayed'])
+        self.assertEqual(1, linkpay.return_value.initiate_user_payment.call_count)
+        self.assertEqual(1, PaymentRequest.objects.count())
+
+    def test_reusing_a_key_for_a_different_request_is_rejected(self, base_api, linkpay):
+        base_api.return_value.refresh_user_credentials.return_value = USER_TOKEN
+        linkpay.return_value.initiate_user_payment.return_value = PAYMENT_INITIATION
+
+        self.initiate_deposit(HTTP_IDEMPOTENCY_KEY='deposit-1')
+        response = self.initiate_deposit(amount='200.00', HTTP_IDEMPOTENCY_KEY='deposit-1')
+
+        self.assertEqual(status.HTTP_422_UNPROCESSABLE_ENTITY, response.status_code)
+        self.assertEqual(1, PaymentRequest.objects.count())
+
+    def test_requests_without_a_key_are_not_deduplicated(self, base_api, linkpay):
+        base_api.return_value.refresh_user_credentials.return_value = USER_TOKEN
+        linkpay.return_value.initiate_user_payment.return_value = PAYMENT_INITIATION
+
+        self.initiate_deposit()
+        self.initiate_deposit()
+
+        self.assertEqual(2, PaymentRequest.objects.count())
+
+
+@mock.patch('api.apps.payments.deposits.LinkPay')
+@mock.patch('api.apps.payments.deposits.BaseAPI')
+class AsyncWalletDepositTest(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', full_name='Ozzy Osbourne', short_name='Ozzy', password='hackobob'
+        )
+        create_linked_account(self.user)
+        self.client.force_authenticate(self.user)
+
+    @mock.patch('api.apps.payments.views.payments.initiate_deposit')
+    def accept_deposit(self, task):
+        response = self.client.post(
+            reverse('payments:initiate_deposit'),
+            data={'amount': '100.00', 'amount_currency': 'ZAR', 'account_id': 'account-1'},
+            HTTP_PREFER='respond-async'
+        )
+
+        self.assertEqual(status.HTTP_202_ACCEPTED, response.status_code)
+        task.delay.assert_called_once()
+        initiate_deposit(*task.delay.call_args.args)
+
+        return response.data['transaction_ref']
+
+    def fetch_status(self, transaction_ref):
+        return self.client.get(reverse('payments:deposit_status', kwargs={'transaction_ref': transaction_ref}))
+
+    def test_deposit_is_initiated_in_the_background(self, base_api, linkpay):
+        base_api.return_value.refresh_user_credentials.return_value = USER_TOKEN
+        linkpay.return_value.initiate_user_payment.return_value = PAYMENT_INITIATION
+
+        transaction_ref = self.accept_deposit()
+        response = self.fetch_status(transaction_ref)
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(PaymentRequestStatus.NEW.name, response.data['status'])
+        self.assertIsNone(response.data['user_interaction_url'])
+        self.assertEqual('stitch-ref', PaymentRequest.objects.get(transaction_ref=transaction_ref).stitch_ref)
+
+    def test_status_reports_when_user_interaction_is_required(self, base_api, linkpay):
+        base_api.return_value.refresh_user_credentials.return_value = USER_TOKEN
+        linkpay.return_value.initiate_user_payment.side_effect = LinkPayError(
+            detail='User interaction required',
+            code='USER_INTERACTION_REQUIRED',
+            extras={'id': 'stitch-ref', 'userInteractionUrl': 'https://secure.stitch.money/interact'}
+        )
+
+        transaction_ref = self.accept_deposit()
+        response = self.fetch_status(transaction_ref)
+
+        self.assertTrue(response.data['user_interaction_url'].startswith('https://secure.stitch.money/interact'))
+
+    def test_status_reports_failed_initiations(self, base_api, linkpay):
+        base_api.return_value.refresh_user_credentials.return_value = USER_TOKEN
+        linkpay.return_value.initiate_user_payment.side_effect = LinkPayError(detail='Insufficient funds')
+
+        transaction_ref = self.accept_deposit()
+        response = self.fetch_status(transaction_ref)
+
+        self.assertEqual(PaymentRequestStatus.FAILED.name, response.data['status'])
+
+    def test_status_is_only_visible_to_the_owner(self, base_api, linkpay):
+        base_api.return_value.refresh_user_credentials.return_value = USER_TOKEN
+        linkpay.return_value.initiate_user_payment.return_value = PAYMENT_INITIATION
+
+        transaction_ref = self.accept_deposit()
+        self.client.force_authenticate(get_user_model().objects.create_user(
+            email='other@example.com', full_name='Other User', short_name='Other', password='hackobob'
+        ))
+
+        self.assertEqual(status.HTTP_404_NOT_FOUND, self.fetch_status(transaction_ref).status_code)
+
+
+@mock.patch('api.apps.payments.deposits.LinkPay')
+@mock.patch('api.apps.payments.deposits.BaseAPI')
+class InitiateBulkWalletDepositTest(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', full_name='Ozzy Osbourne', short_name='Ozzy', password='hackobob'
+        )
+        create_linked_account(self.user, account_id='account-1')
+        create_linked_account(self.user, account_id='account-2')
+        self.client.force_authenticate(self.user)
+
+    def initiate_bulk_deposit(self, *deposits):
+        return self.client.post(
+            reverse('payments:initiate_bulk_deposit'),
+            data={
+                'deposits': [
+                    {'amount': amount, 'amount_currency': 'ZAR', 'account_id': account_id}
+                    for account_id, amount in deposits
+                ]
+            },
+            format='json'
+        )
+
+    def test_deposits_are_initiated_independently(self, base_api, linkpay):
+        def initiate_user_payment(payment_request_data):
+            if payment_request_data['input']['amount']['quantity'] == '200.00':
+                raise LinkPayError('Insufficient funds')
+
+            return PAYMENT_INITIATION
+
+        base_api.return_value.refresh_user_credentials.return_value = USER_TOKEN
+        linkpay.return_value.initiate_user_payment.side_effect = initiate_user_payment
+
+        response = self.initiate_bulk_deposit(('account-1', '100.00'), ('account-2', '200.00'))
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(['initiated', 'failed'], [deposit['status'] for deposit in response.data['deposits']])
+
+        successful, failed = [
+            PaymentRequest.objects.get(transaction_ref=deposit['transaction_ref'])
+            for deposit in response.data['deposits']
+        ]
+        self.assertEqual('stitch-ref', successful.stitch_ref)
+        self.assertEqual(PaymentRequestStatus.NEW.name, successful.status)
+        self.assertEqual(PaymentRequestStatus.FAILED.name, failed.status)
+        self.assertEqual(
+            ['new-refresh-token', 'new-refresh-token'],
+            [account_token.refresh_token for account_token in BankAccountToken.objects.all()]
+        )
+
+    def test_refreshed_tokens_are_kept_when_the_outcomes_cant_be_saved(self, base_api, linkpay):
+        base_api.return_value.refresh_user_credentials.return_value = USER_TOKEN
+        linkpay.return_value.initiate_user_payment.return_value = PAYMENT_INITIATION
+        deposits = [(account_token, Money('100.00', 'ZAR')) for account_token in BankAccountToken.objects.all()]
+
+        with mock.patch.object(PaymentRequest.objects, 'bulk_update', side_effect=DatabaseError()):
+            with self.assertRaises(DatabaseError):
+                initiate_bulk_payments(self.user, deposits)
+
+        self.assertEqual(
+            ['new-refresh-token', 'new-refresh-token'],
+            [account_token.refresh_token for account_token in BankAccountToken.objects.all()]
+        )
+        self.assertEqual(2, PaymentRequest.objects.count())
+
+    def test_unlinked_accounts_are_rejected(self, base_api, linkpay):
+        response = self.initiate_bulk_deposit(('account-1', '100.00'), ('account-3', '200.00'))
+
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual(['account-3'], response.data['accounts'])
+        self.assertFalse(PaymentRequest.objects.exists())
+        linkpay.return_value.initiate_user_payment.assert_not_called()
+
+    def test_accounts_can_only_be_used_once(self, base_api, linkpay):
+        response = self.initiate_bulk_deposit(('account-1', '100.00'), ('account-1', '200.00'))
+
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertFalse(PaymentRequest.objects.exists())
+
+
+@mock.patch('api.apps.payments.deposits.LinkPay')
+@mock.patch('api.apps.payments.deposits.BaseAPI')
+class BulkDepositOrderingTest(TransactionTestCase):
+    def setUp(self):
+        get_redis_connection().flushdb()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', full_name='Ozzy Osbourne', short_name='Ozzy', password='hackobob'
+        )
+        create_linked_account(self.user, account_id='account-1')
+        create_linked_account(self.user, account_id='account-2')
+
+    def test_payment_requests_exist_before_stitch_is_called(self, base_api, linkpay):
+        def initiate_user_payment(payment_request_data):
+            try:
+                # a webhook for the payment can arrive as soon as Stitch has it
+                if not PaymentRequest.objects.filter(
+                        transaction_ref=payment_request_data['input']['externalReference']).exists():
+                    raise LinkPayError('Unknown payment request')
+            finally:
+                # called from the deposits' thread pool, whose connections would otherwise be left open
+                connection.close()
+
+            return PAYMENT_INITIATION
+
+        base_api.return_value.refresh_user_credentials.return_value = USER_TOKEN
+        linkpay.return_value.initiate_user_payment.side_effect = initiate_user_payment
+        deposits = [(account_token, Money('100.00', 'ZAR')) for account_token in BankAccountToken.objects.all()]
+
+        outcomes = initiate_bulk_payments(self.user, deposits)
+
+        self.assertEqual([None, None], [error for _, error in outcomes])
+        self.assertEqual(
+            ['stitch-ref', 'stitch-ref'], list(PaymentRequest.objects.values_list('stitch_ref', flat=True))
+        )
@@ -0,0 +1,138 @@
+import asyncio
+import json
+
+import mock
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.apps.payments.events import payment_events_channel, serialize_payment_event
+from api.apps.payments.models import PaymentRequest, Wallet
+from api.apps.payments.settlement import settle_payment_request
+from api.apps.payments.views.events import PaymentEventsApplication
+from api.utils.enums import PaymentRequestStatus, PaymentRequestEventType, StitchLinkPayStatus
+from api.utils.redis import get_redis_connection
+from api.utils.user_cache import local_user_cache
+
+
+class PaymentEventPublishingTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', full_name='Ozzy Osbourne', short_name='Ozzy', password='hackobob'
+        )
+        Wallet.objects.create(user=self.user)
+        self.payment_request = PaymentRequest.objects.create(
+            user=self.user, payer_reference='PWPAYER', beneficiary_reference='PWBENEFICIARY', amount=100
+        )
+        self.pubsub = get_redis_connection().pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(payment_events_channel(self.user.id))
+
+    def tearDown(self):
+        self.pubsub.close()
+
+    def test_settlement_publishes_the_status_change_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            settle_payment_request(self.payment_request.transaction_ref, StitchLinkPayStatus.COMPLETED.value)
+
+        self.assertIsNone(self.pubsub.get_message(timeout=0.1))
+
+        for callback in callbacks:
+            callback()
+
+        message = json.loads(self.pubsub.get_message(timeout=1)['data'])
+
+        self.assertEqual(f'{self.payment_request.transaction_ref}', message['transaction_ref'])
+        self.assertEqual(PaymentRequestStatus.COMPLETE.name, message['status'])
+        self.assertEqual(PaymentRequestEventType.COMPLETED.name, message['event'])
+
+
+class PaymentEventsApplicationTest(TestCase):
+    def setUp(self):
+        get_redis_connection().flushdb()
+        local_user_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', full_name='Ozzy Osbourne', short_name='Ozzy', password='hackobob'
+        )
+        self.payment_request = PaymentRequest.objects.create(
+            user=self.user, payer_reference='PWPAYER', beneficiary_reference='PWBENEFICIARY', amount=100
+        )
+        self.django_application = mock.AsyncMock()
+        self.application = PaymentEventsApplication(self.django_application)
+
+    async def call(self, authorization=None, path='/payments/events', query_string=b''):
+        headers = [] if authorization is None else [(b'authorization', authorization)]
+        scope = {'type': 'http', 'path': path, 'headers': headers, 'query_string': query_string}
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        try:
+            await self.application(scope, receive, send)
+        finally:
+            if self.application.broker.reader is not None:
+                self.application.broker.reader.cancel()
+
+        return messages[0]['status'], b''.join(message.get('body', b'') for message in messages[1:])
+
+    def get_authorization(self):
+        return f'Bearer {AccessToken.for_user(self.user)}'.encode('utf-8')
+
+    def publish(self, status):
+        self.payment_request.status = status.name
+        get_redis_connection().publish(
+            payment_events_channel(self.user.id), json.dumps(serialize_payment_event(self.payment_request, None))
+        )
+
+    async def test_other_paths_are_passed_on_to_django(self):
+        await self.application({'type': 'http', 'path': '/payments/wallet/balance'}, None, None)
+
+        self.django_application.assert_awaited_once()
+
+    async def test_missing_and_malformed_credentials_are_rejected(self):
+        for authorization in (None, b'Bearer', b'Bearer too many values', b'Bearer not-a-token'):
+            status, _ = await self.call(authorization)
+
+            self.assertEqual(401, status)
+
+    async def test_long_polls_return_the_next_event(self):
+        query_string = f'transaction_ref={self.payment_request.transaction_ref}&timeout=5'.encode('utf-8')
+        long_poll = asyncio.create_task(self.call(self.get_authorization(), query_string=query_string))
+
+        while not self.application.broker.subscribed or not self.application.broker.subscribed.is_set():
+            await asyncio.sleep(0.01)
+
+        await sync_to_async(self.publish)(PaymentRequestStatus.COMPLETE)
+        status, body = await long_poll
+
+        self.assertEqual(200, status)
+        self.assertEqual(PaymentRequestStatus.COMPLETE.name, json.loads(body)['status'])
+
+    async def test_changes_made_while_the_current_status_is_read_are_not_missed(self):
+        get_current_event = self.application.get_current_event
+
+        async def get_current_event_during_a_change(user, transaction_ref):
+            current_event = await get_current_event(user, transaction_ref)
+            # the deposit completes after its status was read, but before the long-poll starts waiting
+            await sync_to_async(self.publish)(PaymentRequestStatus.COMPLETE)
+
+            return current_event
+
+        query_string = f'transaction_ref={self.payment_request.transaction_ref}&timeout=5'.encode('utf-8')
+
+        with mock.patch.object(self.application, 'get_current_event', get_current_event_during_a_change):
+            status, body = await self.call(self.get_authorization(), query_string=query_string)
+
+        self.assertEqual(200, status)
+        self.assertEqual(PaymentRequestStatus.COMPLETE.name, json.loads(body)['status'])
+
+    async def test_unknown_deposits_are_not_found(self):
+        status, _ = await self.call(
+            self.get_authorization(), query_string=b'transaction_ref=00000000-0000-0000-0000-000000000000'
+        )
+
+        self.assertEqual(404, status)
@@ -0,0 +1,129 @@
+from datetime import timedelta
+
+import mock
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from api.apps.payments.models import KycVerification, KycVerificationRun
+from api.apps.payments.tasks import resume_kyc_reverification, reverify_kyc_shard, start_kyc_reverification
+from api.apps.payments.tests.test_account_linking import linked_account_identity
+from api.apps.payments.tests.test_deposits import create_linked_account, USER_TOKEN
+from api.utils.enums import KycVerificationStatus
+from api.utils.libs.stitch.errors import LinkPayError
+
+
+@override_settings(
+    KYC_REVERIFICATION_SHARD_SIZE=1, KYC_REVERIFICATION_CONCURRENCY=1, KYC_REVERIFICATION_MAX_ATTEMPTS=2,
+    KYC_REVERIFICATION_STALLED_AFTER_SECONDS=3600
+)
+@mock.patch('api.apps.payments.kyc.LinkPay')
+@mock.patch('api.apps.payments.kyc.BaseAPI')
+class KycReverificationTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', full_name='Ozzy Osbourne', short_name='Ozzy', password='hackobob',
+            identification_number='12345678'
+        )
+        self.accounts = [create_linked_account(self.user), create_linked_account(self.user, account_id='account-2')]
+
+    @mock.patch('api.apps.payments.tasks.reverify_kyc_shard')
+    def run_kyc_reverification(self, job, task):
+        queued = job()
+
+        self.assertEqual(queued, task.delay.call_count)
+
+        for call in task.delay.call_args_list:
+            reverify_kyc_shard(*call.args)
+
+        return queued
+
+    def get_statuses(self, run):
+        return dict(KycVerification.objects.filter(run=run).values_list('account_id', 'status'))
+
+    def test_mismatches_are_flagged_across_shards(self, base_api, linkpay):
+        base_api.return_value.refresh_user_credentials.return_value = USER_TOKEN
+        linkpay.return_value.get_linked_account_identity.side_effect = [
+            linked_account_identity(), linked_account_identity(identification_number='87654321')
+        ]
+
+        self.assertEqual(2, self.run_kyc_reverification(start_kyc_reverification))
+
+        run = KycVerificationRun.objects.get()
+        self.assertEqual(
+            {
+                self.accounts[0].id: KycVerificationStatus.MATCHED.name,
+                self.accounts[1].id: KycVerificationStatus.MISMATCH.name,
+            },
+            self.get_statuses(run)
+        )
+        self.assertEqual(2, run.total_accounts)
+        self.assertIsNotNone(run.finished_at)
+
+    def test_unfinished_runs_are_resumed(self, base_api, linkpay):
+        base_api.return_value.refresh_user_credentials.return_value = USER_TOKEN
+        linkpay.return_value.get_linked_account_identity.return_value = linked_account_identity()
+        run = KycVerificationRun.objects.create(total_accounts=2)
+        KycVerification.objects.create(run=run, account=self.accounts[0], status=KycVerificationStatus.MATCHED.name)
+
+        self.assertEqual(1, self.run_kyc_reverification(start_kyc_reverification))
+
+        linkpay.return_value.get_linked_account_identity.assert_called_once()
+        self.assertEqual(1, KycVerificationRun.objects.count())
+        self.assertEqual(2, len(self.get_statuses(run)))
+
+    def test_stalled_runs_are_resumed_but_runs_in_progress_are_not(self, base_api, linkpay):
+        base_api.return_value.refresh_user_credentials.return_value = USER_TOKEN
+        linkpay.return_value.get_linked_account_identity.return_value = linked_account_identity()
+        run = KycVerificationRun.objects.create(total_accounts=2)
+        KycVerification.objects.create(run=run, account=self.accounts[0], status=KycVerificationStatus.MATCHED.name)
+
+        self.assertEqual(0, self.run_kyc_reverification(resume_kyc_reverification))
+
+        KycVerification.objects.filter(run=run).update(verified_at=timezone.now() - timedelta(hours=2))
+
+        self.assertEqual(1, self.run_kyc_reverification(resume_kyc_reverification))
+        self.assertIsNotNone(KycVerificationRun.objects.get(id=run.id).finished_at)
+
+    def test_runs_from_earlier_months_are_not_resumed(self, base_api, linkpay):
+        base_api.return_value.refresh_user_credentials.return_value = USER_TOKEN
+        linkpay.return_value.get_linked_account_identity.return_value = linked_account_identity()
+        stale_run = KycVerificationRun.objects.create(total_accounts=2)
+        KycVerificationRun.objects.filter(id=stale_run.id).update(created=timezone.now() - timedelta(days=40))
+
+        self.assertEqual(0, self.run_kyc_reverification(resume_kyc_reverification))
+        self.assertEqual(2, self.run_kyc_reverification(start_kyc_reverification))
+
+        run = KycVerificationRun.objects.exclude(id=stale_run.id).get()
+        self.assertEqual(2, len(self.get_statuses(run)))
+        self.assertIsNotNone(run.finished_at)
+        self.assertIsNone(KycVerificationRun.objects.get(id=stale_run.id).finished_at)
+
+    def test_accounts_that_cant_be_looked_up_are_retried_until_out_of_attempts(self, base_api, linkpay):
+        base_api.return_value.refresh_user_credentials.return_value = USER_TOKEN
+        linkpay.return_value.get_linked_account_identity.side_effect = LinkPayError('Stitch is down')
+        self.accounts[1].bankaccounttoken.delete()
+
+        self.run_kyc_reverification(start_kyc_reverification)
+
+        run = KycVerificationRun.objects.get()
+        self.assertEqual({KycVerificationStatus.FAILED.name}, set(self.get_statuses(run).values()))
+        self.assertIsNone(run.finished_at)
+
+        # Stitch is back by the time the stalled run is resumed
+        linkpay.return_value.get_linked_account_identity.side_effect = None
+        linkpay.return_value.get_linked_account_identity.return_value = linked_account_identity()
+        KycVerification.objects.filter(run=run).update(verified_at=timezone.now() - timedelta(hours=2))
+
+        self.assertEqual(2, self.run_kyc_reverification(resume_kyc_reverification))
+
+        run.refresh_from_db()
+        self.assertEqual(
+            {
+                self.accounts[0].id: KycVerificationStatus.MATCHED.name,
+                self.accounts[1].id: KycVerificationStatus.FAILED.name,
+            },
+            self.get_statuses(run)
+        )
+        self.assertEqual(2, KycVerification.objects.get(run=run, account=self.accounts[1]).attempts)
+        self.assertIsNotNone(run.finished_at)
@@ -0,0 +1,67 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from api.apps.payments.linked_accounts import linked_accounts_key
+from api.apps.payments.models import BankAccount
+from api.apps.payments.tests.test_deposits import create_linked_account
+from api.utils.redis import get_redis_connection
+
+
+class LinkedAccountCacheTest(APITestCase):
+    def setUp(self):
+        get_redis_connection().flushdb()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', full_name='Ozzy Osbourne', short_name='Ozzy', password='hackobob'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            create_linked_account(self.user)
+        self.client.force_authenticate(self.user)
+
+    def test_account_numbers_are_masked_and_cached_encrypted(self):
+        response = self.client.get(reverse('payments:linked_user_accounts'))
+        cached_accounts = get_redis_connection().get(linked_accounts_key(self.user.id))
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual('******7890', response.data[0]['account_number'])
+        self.assertEqual('account-1', response.data[0]['_account_id_data'])
+        self.assertNotIn('id', response.data[0])
+        self.assertNotIn(b'account-1', cached_accounts)
+        self.assertNotIn(self.user.full_name.encode('utf-8'), cached_accounts)
+
+    def test_linking_and_unlinking_invalidate_the_cache(self):
+        self.assertEqual(1, len(BankAccount.objects.get_linked_accounts(self.user.id)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_linked_account(self.user, account_id='account-2')
+
+        self.assertEqual(2, len(BankAccount.objects.get_linked_accounts(self.user.id)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            BankAccount.objects.filter(user=self.user).first().delete()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(1, len(BankAccount.objects.get_linked_accounts(self.user.id)))
+
+    def test_deposits_from_unlinked_accounts_are_rejected_from_the_cache(self):
+        BankAccount.objects.get_linked_accounts(self.user.id)
+
+        with self.assertNumQueries(0):
+            response = self.client.post(
+                reverse('payments:initiate_deposit'),
+                data={'amount': '100.00', 'amount_currency': 'ZAR', 'account_id': 'account-2'}
+            )
+
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_benchmark_reports_decryptions_per_listing(self):
+        out = StringIO()
+
+        call_command('benchmark_linked_accounts', self.user.email, listings=10, stdout=out)
+
+        self.assertIn('database: 3.000 decryptions/listing', out.getvalue())
+        self.assertIn('cache: 1.000 decryptions/listing, 0.000 queries/listing', out.getvalue())
@@ -0,0 +1,58 @@
+import mock
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from api.utils.redis import get_redis_connection
+
+PAYMENT_AUTHORIZATION = {
+    'clientPaymentAuthorizationRequestCreate': {
+        'authorizationRequestUrl': 'https://secure.stitch.money/connect/payment-authorization-request/1',
+    },
+}
+PAYER = {'full_name': 'Ozzy Osbourne', 'email': 'user@example.com'}
+
+
+@mock.patch('api.apps.payments.views.linkpay.LinkPay')
+class PaymentAuthorizationReuseTest(APITestCase):
+    def setUp(self):
+        get_redis_connection().flushdb()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', full_name='Ozzy Osbourne', short_name='Ozzy', password='hackobob'
+        )
+        self.client.force_authenticate(self.user)
+
+    def authorize(self, payer=PAYER):
+        response = self.client.post(reverse('payments:linkpay_authorize'), data=payer)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+        return response.data
+
+    def test_pending_authorizations_are_reused(self, linkpay):
+        linkpay.return_value.create_payment_authorization.return_value = PAYMENT_AUTHORIZATION
+
+        authorization = self.authorize()
+
+        self.assertEqual(authorization, self.authorize())
+        self.assertIn(f'state={authorization["state"]}', authorization['url'])
+        linkpay.return_value.create_payment_authorization.assert_called_once()
+
+    def test_authorizations_are_not_reused_for_other_payers(self, linkpay):
+        linkpay.return_value.create_payment_authorization.return_value = PAYMENT_AUTHORIZATION
+
+        authorization = self.authorize()
+
+        self.assertNotEqual(authorization, self.authorize({**PAYER, 'email': 'other@example.com'}))
+        self.assertEqual(2, linkpay.return_value.create_payment_authorization.call_count)
+
+    def test_completed_authorizations_are_not_reused(self, linkpay):
+        linkpay.return_value.create_payment_authorization.return_value = PAYMENT_AUTHORIZATION
+
+        authorization = self.authorize()
+        # as the state is dropped once it's exchanged for the user's token
+        cache.delete(authorization['state'])
+
+        self.assertNotEqual(authorization['state'], self.authorize()['state'])
+        self.assertEqual(2, linkpay.return_value.create_payment_authorization.call_count)
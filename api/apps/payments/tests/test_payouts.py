@@ -0,0 +1,152 @@
+from datetime import timedelta
+from decimal import Decimal
+
+import mock
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from api.apps.payments.models import Transaction, Wallet, Withdrawal
+from api.apps.payments.payouts import buffer_disbursement_outcome, claim_pending_withdrawals, \
+    settle_buffered_disbursement_outcomes, submit_withdrawal_batch
+from api.apps.payments.tasks import resubmit_stalled_withdrawals
+from api.apps.payments.tests.test_deposits import create_linked_account
+from api.utils.enums import StitchDisbursementStatus, WithdrawalStatus
+from api.utils.libs.stitch.errors import LinkPayError
+from api.utils.redis import get_redis_connection
+
+
+def created_disbursement(withdrawal_ref, disbursement_status=StitchDisbursementStatus.SUBMITTED.value):
+    return {
+        'id': f'disbursement-{withdrawal_ref}',
+        'externalReference': withdrawal_ref,
+        'status': {'__typename': disbursement_status},
+    }
+
+
+@mock.patch('api.apps.payments.payouts.LinkPay')
+class PayoutTest(APITestCase):
+    def setUp(self):
+        get_redis_connection().flushdb()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', full_name='Ozzy Osbourne', short_name='Ozzy', password='hackobob'
+        )
+        self.wallet = Wallet.objects.create(user=self.user)
+        self.wallet.deposit(Decimal('500.00'))
+        create_linked_account(self.user)
+        self.client.force_authenticate(self.user)
+
+    def initiate_withdrawal(self, amount='100.00', currency='ZAR'):
+        return self.client.post(
+            reverse('payments:initiate_withdrawal'),
+            data={'amount': amount, 'amount_currency': currency, 'account_id': 'account-1'}
+        )
+
+    def get_wallet(self):
+        return Wallet.objects.get(user=self.user)
+
+    def test_withdrawals_hold_the_amount_until_they_settle(self, linkpay):
+        response = self.initiate_withdrawal('200.00')
+
+        self.assertEqual(status.HTTP_202_ACCEPTED, response.status_code)
+        self.assertEqual(WithdrawalStatus.PENDING.name, response.data['status'])
+        self.assertEqual(Decimal('500.00'), self.get_wallet().amount.amount)
+        self.assertEqual(Decimal('300.00'), self.get_wallet().available.amount)
+
+        # only the available balance can be withdrawn
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.initiate_withdrawal('400.00').status_code)
+        linkpay.assert_not_called()
+
+    def test_withdrawals_in_another_currency_are_rejected(self, linkpay):
+        response = self.initiate_withdrawal('100.00', 'USD')
+
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn('amount', response.data['details'])
+        self.assertFalse(Withdrawal.objects.exists())
+        self.assertEqual(Decimal('500.00'), self.get_wallet().available.amount)
+
+    def test_pending_withdrawals_are_disbursed_in_one_call(self, linkpay):
+        withdrawal_refs = [self.initiate_withdrawal().data['withdrawal_ref'] for _ in range(3)]
+        linkpay.return_value.create_disbursements.return_value = [
+            created_disbursement(withdrawal_refs[0]),
+            created_disbursement(withdrawal_refs[1]),
+            LinkPayError('Invalid account number'),
+        ]
+
+        self.assertEqual(3, submit_withdrawal_batch())
+
+        linkpay.return_value.create_disbursements.assert_called_once()
+        self.assertEqual(
+            [WithdrawalStatus.SUBMITTED.name, WithdrawalStatus.SUBMITTED.name, WithdrawalStatus.FAILED.name],
+            [Withdrawal.objects.get(withdrawal_ref=ref).status for ref in withdrawal_refs]
+        )
+        # the rejected disbursement's hold is released
+        self.assertEqual(Decimal('300.00'), self.get_wallet().available.amount)
+        self.assertEqual(0, submit_withdrawal_batch())
+
+    def test_buffered_webhook_outcomes_are_settled_in_bulk(self, linkpay):
+        withdrawal_refs = [self.initiate_withdrawal().data['withdrawal_ref'] for _ in range(2)]
+        linkpay.return_value.create_disbursements.return_value = [created_disbursement(ref) for ref in withdrawal_refs]
+        submit_withdrawal_batch()
+
+        buffer_disbursement_outcome(withdrawal_refs[0], StitchDisbursementStatus.COMPLETED.value)
+        buffer_disbursement_outcome(withdrawal_refs[1], StitchDisbursementStatus.CANCELLED.value, 'Cancelled')
+
+        self.assertEqual(2, settle_buffered_disbursement_outcomes())
+        self.assertEqual(0, settle_buffered_disbursement_outcomes())
+
+        wallet = self.get_wallet()
+        self.assertEqual(Decimal('400.00'), wallet.amount.amount)
+        self.assertEqual(Decimal('0.00'), wallet.reserved.amount)
+        self.assertEqual(Decimal('-100.00'), Transaction.objects.filter(wallet=wallet).last().amount.amount)
+
+        response = self.client.get(reverse('payments:withdrawal_status', args=[withdrawal_refs[1]]))
+        self.assertEqual(WithdrawalStatus.FAILED.name, response.data['status'])
+        self.assertEqual('Cancelled', response.data['failure_reason'])
+
+    def test_withdrawals_are_put_back_when_the_batch_cant_be_submitted(self, linkpay):
+        withdrawal_ref = self.initiate_withdrawal().data['withdrawal_ref']
+        linkpay.return_value.create_disbursements.side_effect = LinkPayError('Stitch is down')
+
+        with self.assertRaises(LinkPayError):
+            submit_withdrawal_batch()
+
+        withdrawal = Withdrawal.objects.get(withdrawal_ref=withdrawal_ref)
+        self.assertEqual(WithdrawalStatus.PENDING.name, withdrawal.status)
+        self.assertIsNone(withdrawal.batch)
+
+    @override_settings(PAYOUT_SUBMISSION_TIMEOUT_SECONDS=900)
+    @mock.patch('api.apps.payments.tasks.submit_pending_withdrawals')
+    def test_withdrawals_left_submitted_by_a_dead_worker_are_resubmitted(self, task, linkpay):
+        withdrawal_refs = [self.initiate_withdrawal().data['withdrawal_ref']]
+        linkpay.return_value.create_disbursements.return_value = [created_disbursement(withdrawal_refs[0])]
+        submit_withdrawal_batch()
+
+        # the worker submitting this one died after claiming it
+        withdrawal_refs.append(self.initiate_withdrawal().data['withdrawal_ref'])
+        claim_pending_withdrawals(1)
+
+        self.assertEqual(0, resubmit_stalled_withdrawals())
+
+        Withdrawal.objects.update(modified=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(1, resubmit_stalled_withdrawals())
+        task.delay.assert_called_once_with()
+        self.assertEqual(
+            [WithdrawalStatus.SUBMITTED.name, WithdrawalStatus.PENDING.name],
+            [Withdrawal.objects.get(withdrawal_ref=ref).status for ref in withdrawal_refs]
+        )
+        self.assertIsNone(Withdrawal.objects.get(withdrawal_ref=withdrawal_refs[1]).batch)
+
+    @override_settings(PAYOUT_DISBURSEMENT_BACKEND='local')
+    def test_the_local_backend_completes_disbursements_on_submission(self, linkpay):
+        self.initiate_withdrawal()
+
+        self.assertEqual(1, submit_withdrawal_batch())
+
+        linkpay.assert_not_called()
+        self.assertEqual(WithdrawalStatus.COMPLETED.name, Withdrawal.objects.get().status)
+        self.assertEqual(Decimal('400.00'), self.get_wallet().amount.amount)
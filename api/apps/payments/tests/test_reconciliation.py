@@ -0,0 +1,141 @@
+from datetime import timedelta
+
+import mock
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError
+from django.test import TestCase
+from django.utils import timezone
+from gql.transport.exceptions import TransportQueryError
+
+from api.apps.payments.models import PaymentRequest, Wallet
+from api.apps.payments.settlement import settle_payment_request
+from api.apps.payments.tasks import reconcile_pending_payment_requests
+from api.utils.enums import PaymentRequestStatus, PaymentRequestEventType, StitchLinkPayStatus
+from api.utils.libs.stitch.errors import StitchClientAuthenticationError
+from api.utils.libs.stitch.linkpay.linkpay import LinkPay
+
+COMPLETED = {'__typename': StitchLinkPayStatus.COMPLETED.value}
+PENDING = {'__typename': StitchLinkPayStatus.PENDING.value}
+
+
+def create_payment_request(user, stitch_ref, age=timedelta(minutes=30)):
+    payment_request = PaymentRequest.objects.create(
+        user=user,
+        stitch_ref=stitch_ref,
+        payer_reference='PWPAYER',
+        beneficiary_reference='PWBENEFICIARY',
+        amount=100,
+    )
+    PaymentRequest.objects.filter(pk=payment_request.pk).update(created=timezone.now() - age)
+
+    return payment_request
+
+
+class ReconcilePendingPaymentRequestsTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', full_name='Ozzy Osbourne', short_name='Ozzy', password='hackobob'
+        )
+        self.wallet = Wallet.objects.create(user=self.user)
+
+    @mock.patch('api.apps.payments.tasks.LinkPay')
+    def test_settles_payments_missed_by_webhooks(self, linkpay):
+        completed = create_payment_request(self.user, 'stitch-completed')
+        pending = create_payment_request(self.user, 'stitch-pending')
+        create_payment_request(self.user, 'stitch-too-recent', age=timedelta(seconds=10))
+
+        linkpay.return_value.get_payment_initiation_statuses.return_value = {
+            'stitch-completed': {'id': 'stitch-completed', 'status': COMPLETED},
+            'stitch-pending': {'id': 'stitch-pending', 'status': PENDING},
+        }
+
+        self.assertEqual(1, reconcile_pending_payment_requests())
+
+        linkpay.return_value.get_payment_initiation_statuses.assert_called_once_with(
+            ['stitch-completed', 'stitch-pending']
+        )
+
+        completed.refresh_from_db()
+        pending.refresh_from_db()
+        self.wallet.refresh_from_db()
+
+        self.assertEqual(PaymentRequestStatus.COMPLETE.name, completed.status)
+        self.assertEqual(PaymentRequestStatus.NEW.name, pending.status)
+        self.assertEqual(100, self.wallet.amount.amount)
+        self.assertTrue(
+            completed.paymentrequestevent_set.filter(event_type=PaymentRequestEventType.RECONCILED.name).exists()
+        )
+
+    @mock.patch('api.apps.payments.tasks.LinkPay')
+    def test_already_settled_payments_are_not_credited_twice(self, linkpay):
+        create_payment_request(self.user, 'stitch-completed')
+        linkpay.return_value.get_payment_initiation_statuses.return_value = {
+            'stitch-completed': {'id': 'stitch-completed', 'status': COMPLETED},
+        }
+
+        self.assertEqual(1, reconcile_pending_payment_requests())
+        self.assertEqual(0, reconcile_pending_payment_requests())
+
+        self.wallet.refresh_from_db()
+        self.assertEqual(100, self.wallet.amount.amount)
+
+    @mock.patch('api.apps.payments.tasks.LinkPay')
+    def test_payments_settled_by_a_webhook_in_the_meantime_are_skipped(self, linkpay):
+        payment_request = create_payment_request(self.user, 'stitch-completed')
+
+        def settle_by_webhook(stitch_refs):
+            # the webhook settles the payment between the status lookup and the reconciliation
+            settle_payment_request(payment_request.transaction_ref, StitchLinkPayStatus.COMPLETED.value)
+
+            return {'stitch-completed': {'id': 'stitch-completed', 'status': COMPLETED}}
+
+        linkpay.return_value.get_payment_initiation_statuses.side_effect = settle_by_webhook
+
+        self.assertEqual(0, reconcile_pending_payment_requests())
+
+        self.wallet.refresh_from_db()
+        self.assertEqual(100, self.wallet.amount.amount)
+        self.assertFalse(
+            payment_request.paymentrequestevent_set.filter(event_type=PaymentRequestEventType.RECONCILED.name).exists()
+        )
+
+    @mock.patch('api.apps.payments.tasks.LinkPay')
+    def test_runs_stop_when_stitch_cant_authenticate_the_client(self, linkpay):
+        payment_request = create_payment_request(self.user, 'stitch-completed')
+        linkpay.side_effect = StitchClientAuthenticationError('Invalid client credentials')
+
+        self.assertEqual(0, reconcile_pending_payment_requests())
+
+        payment_request.refresh_from_db()
+        self.assertEqual(PaymentRequestStatus.NEW.name, payment_request.status)
+
+    @mock.patch('api.apps.payments.tasks.LinkPay')
+    def test_reconciled_events_are_recorded_with_the_settlement(self, linkpay):
+        payment_request = create_payment_request(self.user, 'stitch-completed')
+        linkpay.return_value.get_payment_initiation_statuses.return_value = {
+            'stitch-completed': {'id': 'stitch-completed', 'status': COMPLETED},
+        }
+
+        with mock.patch('api.apps.payments.models.PaymentRequestEvent.save', side_effect=[None, DatabaseError]):
+            with self.assertRaises(DatabaseError):
+                reconcile_pending_payment_requests()
+
+        payment_request.refresh_from_db()
+        self.wallet.refresh_from_db()
+        self.assertEqual(PaymentRequestStatus.NEW.name, payment_request.status)
+        self.assertEqual(0, self.wallet.amount.amount)
+
+
+@mock.patch('api.utils.libs.stitch.linkpay.linkpay.Client')
+class PaymentInitiationStatusesTest(TestCase):
+    def test_unresolved_ids_dont_hold_up_the_rest_of_the_batch(self, client):
+        client.return_value.execute.side_effect = TransportQueryError(
+            'Not found',
+            errors=[{'message': 'Not found', 'path': ['payment_id1']}],
+            data={'payment_id0': {'id': 'stitch-completed', 'status': COMPLETED}, 'payment_id1': None}
+        )
+
+        self.assertEqual(
+            {'stitch-completed': {'id': 'stitch-completed', 'status': COMPLETED}},
+            LinkPay(token='token').get_payment_initiation_statuses(['stitch-completed', 'stitch-unknown'])
+        )
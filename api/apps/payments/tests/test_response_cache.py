@@ -0,0 +1,78 @@
+import mock
+from django.contrib.auth import get_user_model
+from redis.exceptions import ConnectionError
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from api.apps.payments.models import PaymentRequest
+from api.apps.payments.tests.test_deposits import create_linked_account
+from api.utils.redis import get_redis_connection
+from api.utils.response_cache import data_version_key
+
+
+class VersionedResponseTest(APITestCase):
+    def setUp(self):
+        get_redis_connection().flushdb()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', full_name='Ozzy Osbourne', short_name='Ozzy', password='hackobob'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_responses_are_served_from_the_cache_until_the_data_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            create_linked_account(self.user)
+
+        with self.assertNumQueries(1):
+            first = self.client.get(reverse('payments:linked_user_accounts'))
+
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('payments:linked_user_accounts'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_linked_account(self.user, account_id='account-2')
+
+        third = self.client.get(reverse('payments:linked_user_accounts'))
+
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertNotEqual(first['ETag'], third['ETag'])
+        self.assertEqual(2, len(third.data))
+
+    def test_matching_etags_get_a_304_without_touching_the_database(self):
+        etag = self.client.get(reverse('payments:user_payment_requests'))['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('payments:user_payment_requests'), HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+        self.assertEqual(etag, response['ETag'])
+
+    def test_payment_request_changes_invalidate_cached_transactions(self):
+        etag = self.client.get(reverse('payments:user_payment_requests'))['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PaymentRequest.objects.create(user=self.user, amount='100', amount_currency='ZAR')
+
+        response = self.client.get(reverse('payments:user_payment_requests'), HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(1, len(response.data))
+
+    def test_lost_data_versions_do_not_restart_from_zero(self):
+        etag = self.client.get(reverse('payments:user_payment_requests'))['ETag']
+
+        get_redis_connection().delete(data_version_key(self.user.id))
+
+        self.assertNotEqual(etag, self.client.get(reverse('payments:user_payment_requests'))['ETag'])
+
+    @mock.patch('api.utils.response_cache.get_redis_connection')
+    def test_responses_are_served_when_the_cache_is_unavailable(self, get_connection):
+        get_connection.return_value.register_script.return_value.return_value = b'1'
+        get_connection.return_value.get.side_effect = ConnectionError()
+        get_connection.return_value.set.side_effect = ConnectionError()
+
+        response = self.client.get(reverse('payments:user_payment_requests'))
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual('"transactions-1"', response['ETag'])
@@ -0,0 +1,119 @@
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from encrypted_fields.fields import EncryptedFieldMixin
+
+from api.apps.payments.linked_accounts import cache_linked_accounts, linked_accounts_cipher, linked_accounts_key
+from api.apps.payments.management.commands.rotate_encryption_keys import Command, is_current
+from api.apps.payments.models import BankAccount, BankAccountToken
+from api.apps.payments.tests.test_deposits import create_linked_account
+from api.utils.redis import get_redis_connection
+
+CURRENT_KEY = 'a1' * 32
+RETIRED_KEY = 'b2' * 32
+
+
+def reset_field_encryption_keys():
+    # encrypted fields cache FIELD_ENCRYPTION_KEYS, which is fine until a test changes them
+    for model in (BankAccount, BankAccountToken, get_user_model()):
+        for field in model._meta.fields:
+            if isinstance(field, EncryptedFieldMixin):
+                field.__dict__.pop('keys', None)
+
+    linked_accounts_cipher.__dict__.pop('keys', None)
+
+
+def raw_value(model, field_name, pk) -> bytes:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT {model._meta.get_field(field_name).column} FROM {model._meta.db_table} WHERE '
+            f'{model._meta.pk.column} = %s',
+            [pk]
+        )
+        return bytes(cursor.fetchone()[0])
+
+
+class RotateEncryptionKeysTest(TestCase):
+    def setUp(self):
+        get_redis_connection().flushdb()
+        self.previous_key = settings.FIELD_ENCRYPTION_KEYS[0]
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', full_name='Ozzy Osbourne', short_name='Ozzy', password='hackobob',
+            identification_number='12345678'
+        )
+        self.account = create_linked_account(self.user)
+        self.checkpoint = Path(tempfile.mkdtemp()) / 'rotate.progress'
+
+        self.addCleanup(reset_field_encryption_keys)
+        override = override_settings(FIELD_ENCRYPTION_KEYS=[CURRENT_KEY, self.previous_key])
+        override.enable()
+        self.addCleanup(override.disable)
+        reset_field_encryption_keys()
+
+    def rotate(self):
+        call_command(
+            'rotate_encryption_keys', workers=1, max_db_load=1, batch_size=1, checkpoint=self.checkpoint,
+            stdout=open(os.devnull, 'w')
+        )
+
+    def test_rows_are_re_encrypted_with_the_current_key(self):
+        self.assertFalse(is_current(raw_value(BankAccount, 'account_number', self.account.pk)))
+
+        self.rotate()
+
+        self.assertTrue(is_current(raw_value(BankAccount, 'account_number', self.account.pk)))
+
+        with override_settings(FIELD_ENCRYPTION_KEYS=[CURRENT_KEY]):
+            reset_field_encryption_keys()
+            account = BankAccount.objects.get(account_id='account-1')
+
+            self.assertEqual('1234567890', account.account_number)
+            self.assertEqual('refresh-token', account.bankaccounttoken.refresh_token)
+            self.assertEqual('12345678', get_user_model().objects.get(pk=self.user.pk).identification_number)
+
+        self.assertFalse(self.checkpoint.exists())
+
+    def test_rotation_resumes_from_the_checkpoint(self):
+        self.checkpoint.write_text(json.dumps({'payments.BankAccount': {'done': True}}))
+        account_number = raw_value(BankAccount, 'account_number', self.account.pk)
+
+        self.rotate()
+
+        self.assertEqual(account_number, raw_value(BankAccount, 'account_number', self.account.pk))
+        self.assertTrue(is_current(raw_value(get_user_model(), 'identification_number', self.user.pk)))
+
+    def test_rows_changed_during_the_rotation_are_not_overwritten(self):
+        token_id = self.account.bankaccounttoken.pk
+        batch = [(token_id, raw_value(BankAccountToken, 'refresh_token', token_id))]
+
+        BankAccountToken.objects.filter(pk=token_id).update(refresh_token='new-refresh-token')
+
+        rotated = Command.write_batch(BankAccountToken, ('refresh_token',), batch, [(batch[0][0], ['refresh-token'])])
+
+        self.assertEqual(0, rotated)
+        self.assertEqual('new-refresh-token', BankAccountToken.objects.get().refresh_token)
+
+    def test_cached_linked_accounts_are_cleared(self):
+        BankAccount.objects.get_linked_accounts(self.user.id)
+
+        self.rotate()
+
+        self.assertIsNone(get_redis_connection().get(linked_accounts_key(self.user.id)))
+
+    def test_linked_accounts_cached_under_a_retired_key_are_reloaded(self):
+        with override_settings(FIELD_ENCRYPTION_KEYS=[RETIRED_KEY]):
+            reset_field_encryption_keys()
+            cache_linked_accounts(self.user.id, [{'id': 'stale'}])
+
+        reset_field_encryption_keys()
+        linked_accounts = BankAccount.objects.get_linked_accounts(self.user.id)
+
+        self.assertEqual([self.account.id], [account['id'] for account in linked_accounts])
+        self.assertIsNotNone(get_redis_connection().get(linked_accounts_key(self.user.id)))
@@ -0,0 +1,68 @@
+import time
+
+import mock
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from redis.exceptions import ConnectionError
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from api.utils.redis import get_redis_connection
+from api.utils.throttling import parse_throttle_rate
+
+THROTTLE_RATES = {'transactions': {'rate': '2/h', 'burst': 2}}
+
+
+@override_settings(THROTTLE_RATES=THROTTLE_RATES)
+class SlidingWindowRateThrottleTest(APITestCase):
+    def setUp(self):
+        get_redis_connection().flushdb()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', full_name='Ozzy Osbourne', short_name='Ozzy', password='hackobob'
+        )
+        self.client.force_authenticate(self.user)
+
+    def fetch_transactions(self):
+        return self.client.get(reverse('payments:user_payment_requests')).status_code
+
+    def test_requests_over_the_rate_and_burst_are_throttled(self):
+        statuses = [self.fetch_transactions() for _ in range(5)]
+        response = self.client.get(reverse('payments:user_payment_requests'))
+
+        self.assertEqual([status.HTTP_200_OK] * 4 + [status.HTTP_429_TOO_MANY_REQUESTS], statuses)
+        self.assertEqual(status.HTTP_429_TOO_MANY_REQUESTS, response.status_code)
+        self.assertIn('Retry-After', response)
+
+    def test_burst_is_not_available_after_a_period_at_the_rate(self):
+        # the previous window was used up to the rate
+        get_redis_connection().set(f'throttle:transactions:{self.user.pk}:{int(time.time()) // 3600 - 1}', 2)
+
+        statuses = [self.fetch_transactions() for _ in range(3)]
+
+        self.assertEqual([status.HTTP_200_OK] * 2 + [status.HTTP_429_TOO_MANY_REQUESTS], statuses)
+
+    def test_users_are_throttled_separately(self):
+        for _ in range(5):
+            self.fetch_transactions()
+
+        other_user = get_user_model().objects.create_user(
+            email='other@example.com', full_name='Tony Iommi', short_name='Tony', password='hackobob'
+        )
+        self.client.force_authenticate(other_user)
+
+        self.assertEqual(status.HTTP_200_OK, self.fetch_transactions())
+
+    @mock.patch('api.utils.throttling.get_redis_connection')
+    def test_requests_are_let_through_when_redis_is_unavailable(self, get_connection):
+        get_connection.return_value.register_script.return_value.side_effect = ConnectionError()
+
+        self.assertEqual(
+            [status.HTTP_200_OK] * 5,
+            [self.fetch_transactions() for _ in range(5)]
+        )
+
+    def test_parse_throttle_rate(self):
+        self.assertEqual((10, 60), parse_throttle_rate('10/m'))
+        self.assertEqual((5, 900), parse_throttle_rate('5/15m'))
+        self.assertEqual((3, 30), parse_throttle_rate('3/30'))
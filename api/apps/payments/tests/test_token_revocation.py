@@ -0,0 +1,71 @@
+from datetime import timedelta
+
+import mock
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from api.apps.payments.models import BankAccount, BankAccountToken, TokenRevocation
+from api.apps.payments.revocations import relay_token_revocations
+from api.apps.payments.tests.test_deposits import create_linked_account
+from api.utils.redis import get_redis_connection
+
+
+@mock.patch('api.apps.payments.revocations.Authentication')
+class TokenRevocationTest(APITestCase):
+    def setUp(self):
+        get_redis_connection().flushdb()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', full_name='Ozzy Osbourne', short_name='Ozzy', password='hackobob'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            create_linked_account(self.user)
+        self.client.force_authenticate(self.user)
+
+    @mock.patch('api.apps.payments.views.linkpay.revoke_unlinked_account_tokens')
+    def test_unlinking_queues_the_token_for_revocation(self, task, authentication):
+        authentication.return_value.revoke_token.return_value = False
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('payments:unlink_user_account'), data={'account_id': 'account-1'})
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertFalse(BankAccount.objects.exists())
+        self.assertFalse(BankAccountToken.objects.exists())
+        self.assertEqual('refresh-token', TokenRevocation.objects.get().token)
+
+        task.delay.assert_called_once_with()
+        relay_token_revocations()
+
+        authentication.return_value.revoke_token.assert_called_once_with(
+            token='refresh-token', token_type='refresh_token', session=mock.ANY
+        )
+
+    def test_revoked_tokens_are_removed_from_the_outbox(self, authentication):
+        authentication.return_value.revoke_token.return_value = True
+        TokenRevocation.objects.create(token='refresh-token')
+
+        self.assertEqual((1, 0), relay_token_revocations())
+        self.assertFalse(TokenRevocation.objects.exists())
+
+    def test_failed_revocations_are_retried_with_backoff(self, authentication):
+        authentication.return_value.revoke_token.return_value = False
+        TokenRevocation.objects.create(token='refresh-token')
+
+        self.assertEqual((0, 1), relay_token_revocations())
+
+        token_revocation = TokenRevocation.objects.get()
+        self.assertEqual(1, token_revocation.attempts)
+        self.assertGreater(token_revocation.next_attempt_at, timezone.now() + timedelta(seconds=30))
+
+        # not due yet, so it isn't attempted again
+        self.assertEqual((0, 0), relay_token_revocations())
+        self.assertEqual(1, authentication.return_value.revoke_token.call_count)
+
+    def test_revocations_stop_after_the_maximum_attempts(self, authentication):
+        TokenRevocation.objects.create(token='refresh-token', attempts=10)
+
+        self.assertEqual((0, 0), relay_token_revocations())
+        authentication.return_value.revoke_token.assert_not_called()
@@ -0,0 +1,162 @@
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TransactionTestCase
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from api.apps.payments.errors import InsufficientBalance, InvalidTransfer
+from api.apps.payments.models import Transaction, Transfer, Wallet
+from api.apps.payments.tests.test_balance_holds import create_funded_wallet
+from api.utils.redis import get_redis_connection
+
+
+def create_user(email):
+    return get_user_model().objects.create_user(
+        email=email, full_name='Ozzy Osbourne', short_name='Ozzy', password='hackobob'
+    )
+
+
+class TransferTest(APITestCase):
+    def setUp(self):
+        get_redis_connection().flushdb()
+        self.user = create_user('user@example.com')
+        self.recipients = [create_user('first@example.com'), create_user('second@example.com')]
+        create_funded_wallet(self.user)
+
+        for recipient in self.recipients:
+            Wallet.objects.create(user=recipient)
+
+        self.client.force_authenticate(self.user)
+
+    def get_balance(self, user):
+        return Wallet.objects.get(user=user).amount.amount
+
+    def test_transfers_move_the_amount_between_wallets(self):
+        response = self.client.post(
+            reverse('payments:initiate_transfer'),
+            data={'amount': '40.00', 'amount_currency': 'ZAR', 'recipient': 'first@example.com', 'reference': 'Rent'}
+        )
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(Decimal('60.00'), self.get_balance(self.user))
+        self.assertEqual(Decimal('40.00'), self.get_balance(self.recipients[0]))
+        self.assertEqual('Rent', Transfer.objects.get(transfer_ref=response.data['transfer_ref']).reference)
+        self.assertEqual(
+            [Decimal('-40.00'), Decimal('40.00')],
+            list(Transaction.objects.filter(amount__lt=100).order_by('amount').values_list('amount', flat=True))
+        )
+
+    def test_transfers_are_rejected_for_unknown_recipients_and_insufficient_balances(self):
+        unknown = self.client.post(
+            reverse('payments:initiate_transfer'),
+            data={'amount': '40.00', 'amount_currency': 'ZAR', 'recipient': 'user@example.com'}
+        )
+        insufficient = self.client.post(
+            reverse('payments:initiate_transfer'),
+            data={'amount': '400.00', 'amount_currency': 'ZAR', 'recipient': 'first@example.com'}
+        )
+
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, unknown.status_code)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, insufficient.status_code)
+        self.assertEqual(Decimal('100.00'), self.get_balance(self.user))
+        self.assertFalse(Transfer.objects.exists())
+
+    def test_transfers_in_another_currency_are_rejected(self):
+        response = self.client.post(
+            reverse('payments:initiate_transfer'),
+            data={'amount': '40.00', 'amount_currency': 'USD', 'recipient': 'first@example.com'}
+        )
+        bulk_response = self.client.post(
+            reverse('payments:initiate_bulk_transfer'),
+            data={
+                'transfers': [
+                    {'amount': '40.00', 'amount_currency': 'ZAR', 'recipient': 'first@example.com'},
+                    {'amount': '40.00', 'amount_currency': 'USD', 'recipient': 'second@example.com'},
+                ]
+            }
+        )
+
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn('amount', response.data['details'])
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, bulk_response.status_code)
+        self.assertEqual(Decimal('100.00'), self.get_balance(self.user))
+        self.assertFalse(Transfer.objects.exists())
+
+    def test_bulk_transfers_are_applied_in_order(self):
+        response = self.client.post(
+            reverse('payments:initiate_bulk_transfer'),
+            data={
+                'transfers': [
+                    {'amount': '60.00', 'amount_currency': 'ZAR', 'recipient': 'first@example.com'},
+                    {'amount': '60.00', 'amount_currency': 'ZAR', 'recipient': 'second@example.com'},
+                    {'amount': '40.00', 'amount_currency': 'ZAR', 'recipient': 'second@example.com'},
+                ]
+            }
+        )
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(
+            ['completed', 'failed', 'completed'], [transfer['status'] for transfer in response.data['transfers']]
+        )
+        self.assertEqual(Decimal('0.00'), self.get_balance(self.user))
+        self.assertEqual(Decimal('40.00'), self.get_balance(self.recipients[1]))
+
+    def test_wallet_transfers_are_atomic(self):
+        wallet = Wallet.objects.get(user=self.user)
+        recipient_wallet = Wallet.objects.get(user=self.recipients[0])
+
+        wallet.transfer(recipient_wallet, Decimal('30.00'))
+
+        self.assertEqual(Decimal('70.00'), wallet.amount.amount)
+        self.assertEqual(Decimal('30.00'), recipient_wallet.amount.amount)
+
+        with self.assertRaises(InsufficientBalance):
+            wallet.transfer(recipient_wallet, Decimal('80.00'))
+
+        self.assertEqual(Decimal('30.00'), self.get_balance(self.recipients[0]))
+
+        with self.assertRaises(InvalidTransfer):
+            wallet.transfer(wallet, Decimal('10.00'))
+
+    def test_ledger_legs_are_posted_in_the_wallet_currency(self):
+        Wallet.objects \
+            .filter(user__in=[self.user, self.recipients[0]]) \
+            .update(amount_currency='USD', reserved_currency='USD')
+
+        Wallet.objects.get(user=self.user).transfer(Wallet.objects.get(user=self.recipients[0]), Decimal('30.00'))
+
+        self.assertEqual(
+            {('USD', 'USD')},
+            set(Transaction.objects.filter(amount__lt=100).values_list('amount_currency', 'running_balance_currency'))
+        )
+
+
+class ConcurrentTransferTest(TransactionTestCase):
+    def setUp(self):
+        get_redis_connection().flushdb()
+        self.users = [create_user('first@example.com'), create_user('second@example.com')]
+
+        for user in self.users:
+            create_funded_wallet(user)
+
+    def test_opposing_transfers_dont_deadlock(self):
+        first, second = [user.id for user in self.users]
+
+        def transfer(i):
+            try:
+                # every other batch sends the other way, and lists the wallets in the opposite order
+                batch = [(first, second, Decimal('1.00'), ''), (second, first, Decimal('2.00'), '')]
+                return Wallet.objects.apply_transfers(batch if i % 2 else batch[::-1])
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            outcomes = [outcome for batch in executor.map(transfer, range(40)) for outcome in batch]
+
+        self.assertTrue(all(error is None for _, error in outcomes))
+        self.assertEqual(Decimal('200.00'), sum(wallet.amount.amount for wallet in Wallet.objects.all()))
+        self.assertEqual(Decimal('140.00'), Wallet.objects.get(user_id=first).amount.amount)
@@ -1,8 +1,14 @@
 from django.urls import re_path
 
-from api.apps.payments.views.linkpay import CreatePaymentAuthorizationView, VerifyAndLinkUserAccount, UnlinkUserAccount
-from api.apps.payments.views.payments import InitiateWalletDeposit, ProcessPaymentNotification
-from api.apps.payments.views.user import FetchUserLinkedAccounts, FetchUserTransactions
+from api.apps.payments.views.linkpay import CreatePaymentAuthorizationView, VerifyAndLinkUserAccount, \
+    UnlinkUserAccount, FetchAccountLinkStatus
+from api.apps.payments.views.payments import InitiateWalletDeposit, ProcessPaymentNotification, FetchDepositStatus, \
+    InitiateBulkWalletDeposit
+from api.apps.payments.views.payouts import InitiateWithdrawal, FetchWithdrawalStatus, \
+    ProcessDisbursementNotification
+from api.apps.payments.views.transfers import InitiateTransfer, InitiateBulkTransfer
+from api.apps.payments.views.user import FetchUserLinkedAccounts, FetchUserTransactions, FetchUserWalletBalance, \
+    FetchLinkedAccountBalances
 
 app_name = 'payments'
 
@@ -10,9 +16,21 @@ urlpatterns = [
     # custom views
     re_path(r'linkpay/authorize$', CreatePaymentAuthorizationView.as_view(), name='linkpay_authorize'),
     re_path(r'linkpay/account/verify$', VerifyAndLinkUserAccount.as_view(), name='linkpay_verify_linked_account'),
+    re_path(r'linkpay/account/link/(?P<link_id>[0-9a-f-]+)/status$', FetchAccountLinkStatus.as_view(),
+            name='account_link_status'),
     re_path(r'accounts/user/unlink$', UnlinkUserAccount.as_view(), name='unlink_user_account'),
     re_path(r'accounts/user$', FetchUserLinkedAccounts.as_view(), name='linked_user_accounts'),
+    re_path(r'accounts/user/balances$', FetchLinkedAccountBalances.as_view(), name='linked_account_balances'),
     re_path(r'deposit/initiate$', InitiateWalletDeposit.as_view(), name='initiate_deposit'),
+    re_path(r'deposit/initiate/bulk$', InitiateBulkWalletDeposit.as_view(), name='initiate_bulk_deposit'),
+    re_path(r'deposit/(?P<transaction_ref>[0-9a-f-]+)/status$', FetchDepositStatus.as_view(), name='deposit_status'),
     re_path(r'linkpay/notify$', ProcessPaymentNotification.as_view(), name='process_linkpay_webhook'),
+    re_path(r'withdrawal/initiate$', InitiateWithdrawal.as_view(), name='initiate_withdrawal'),
+    re_path(r'withdrawal/(?P<withdrawal_ref>[0-9a-f-]+)/status$', FetchWithdrawalStatus.as_view(),
+            name='withdrawal_status'),
+    re_path(r'transfer/initiate$', InitiateTransfer.as_view(), name='initiate_transfer'),
+    re_path(r'transfer/initiate/bulk$', InitiateBulkTransfer.as_view(), name='initiate_bulk_transfer'),
+    re_path(r'payouts/notify$', ProcessDisbursementNotification.as_view(), name='process_disbursement_webhook'),
     re_path(r'transactions/user$', FetchUserTransactions.as_view(), name='user_payment_requests'),
+    re_path(r'wallet/balance$', FetchUserWalletBalance.as_view(), name='wallet_balance'),
 ]
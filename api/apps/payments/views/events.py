@@ -0,0 +1,257 @@
+import asyncio
+import json
+from collections import defaultdict
+from typing import Dict, Optional, Set
+from urllib.parse import parse_qs
+
+import structlog
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from api.apps.payments.events import PAYMENT_EVENTS_CHANNEL_PREFIX, payment_events_channel, serialize_payment_event
+from api.apps.payments.models import PaymentRequest
+from api.apps.users.models import User
+from api.utils.authentication import CachedJWTAuthentication
+from api.utils.enums import PaymentRequestStatus
+
+log = structlog.get_logger('api_requests')
+
+EVENT_STREAM_CONTENT_TYPE = 'text/event-stream'
+
+
+class PaymentEventBroker(object):
+    """
+    Fans the payment events published on Redis out to the listeners connected to this process.
+
+    A single pattern subscription is shared by every listener, so idle connections cost an :class:`asyncio.Queue`
+    rather than a Redis connection each.
+    """
+    def __init__(self):
+        self.listeners: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+        self.reader: Optional[asyncio.Task] = None
+        # set once Redis has confirmed the pattern subscription, and cleared whenever it's lost
+        self.subscribed: Optional[asyncio.Event] = None
+
+    async def subscribe(self, user_id) -> asyncio.Queue:
+        """
+        Registers a listener for the user's events, and waits for up to ``PAYMENT_EVENTS_SUBSCRIBE_TIMEOUT`` seconds
+        for the subscription to be live, so that every event published after this returns reaches the listener.
+        """
+        if self.reader is None or self.reader.done():
+            # created along with the reader, so that they're bound to the same event loop
+            self.subscribed = asyncio.Event()
+            self.reader = asyncio.create_task(self.read())
+
+        queue = asyncio.Queue(maxsize=100)
+        self.listeners[payment_events_channel(user_id)].add(queue)
+
+        try:
+            await asyncio.wait_for(self.subscribed.wait(), timeout=settings.PAYMENT_EVENTS_SUBSCRIBE_TIMEOUT)
+        except asyncio.TimeoutError:
+            # served all the same, the listener gets the events published once the subscription is back
+            log.error(event='payment_events', message='Timed out waiting for the payment events subscription')
+
+        return queue
+
+    def unsubscribe(self, user_id, queue: asyncio.Queue) -> None:
+        channel = payment_events_channel(user_id)
+        self.listeners[channel].discard(queue)
+
+        if not self.listeners[channel]:
+            del self.listeners[channel]
+
+    async def read(self):
+        while True:
+            try:
+                connection = aioredis.Redis.from_url(settings.REDIS_URL)
+                pubsub = connection.pubsub()
+                await pubsub.psubscribe(f'{PAYMENT_EVENTS_CHANNEL_PREFIX}:*')
+
+                async for message in pubsub.listen():
+                    if message['type'] == 'psubscribe':
+                        self.subscribed.set()
+
+                    if message['type'] != 'pmessage':
+                        continue
+
+                    payment_event = json.loads(message['data'])
+
+                    for queue in list(self.listeners.get(message['channel'].decode('utf-8'), ())):
+                        try:
+                            queue.put_nowait(payment_event)
+                        except asyncio.QueueFull:
+                            # the listener has stopped reading, it'll catch up from the deposit status endpoint
+                            pass
+            except (RedisError, OSError) as e:
+                self.subscribed.clear()
+                log.error(event='payment_events', message=f'Lost the payment events subscription: {e}')
+                await asyncio.sleep(1)
+
+
+class PaymentEventsApplication(object):
+    """
+    ASGI application pushing a user's payment status changes to them, so that clients no longer have to poll
+    ``transactions/user`` to find out whether a deposit has finished.
+
+    Clients sending ``Accept: text/event-stream`` get a stream of server-sent events, any other request is a long-poll
+    that returns the next event, or a 204 after ``timeout`` seconds. Passing a ``transaction_ref`` limits the events
+    to that payment request, and its current status is sent first so that changes made before the client connected
+    aren't missed. Requests for any other path are passed on to the Django application.
+    """
+    path = '/payments/events'
+
+    def __init__(self, application):
+        self.application = application
+        self.broker = PaymentEventBroker()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] != self.path:
+            return await self.application(scope, receive, send)
+
+        headers = dict(scope['headers'])
+        query = {key: values[0] for key, values in parse_qs(scope['query_string'].decode('utf-8')).items()}
+
+        user = await self.authenticate(headers.get(b'authorization'))
+        if user is None:
+            return await self.send_json(send, 401, {'error': 'Authentication credentials were not provided.'})
+
+        transaction_ref = query.get('transaction_ref')
+        current_event = None
+        # subscribed before the current status is read, so that a change made in between can't be missed
+        queue = await self.broker.subscribe(user.id)
+
+        try:
+            if transaction_ref:
+                current_event = await self.get_current_event(user, transaction_ref)
+
+                if current_event is None:
+                    return await self.send_json(send, 404, {'error': 'Could not find the specified deposit.'})
+
+            if EVENT_STREAM_CONTENT_TYPE in headers.get(b'accept', b'').decode('utf-8'):
+                await self.stream(receive, send, queue, transaction_ref, current_event)
+            else:
+                await self.long_poll(send, queue, transaction_ref, current_event, query.get('timeout'))
+        finally:
+            self.broker.unsubscribe(user.id, queue)
+
+    async def authenticate(self, authorization: Optional[bytes]) -> Optional[User]:
+        if authorization is None:
+            return None
+
+        authentication = CachedJWTAuthentication()
+
+        try:
+            raw_token = authentication.get_raw_token(authorization)
+
+            if raw_token is None:
+                return None
+
+            validated_token = authentication.get_validated_token(raw_token)
+            return await sync_to_async(authentication.get_user)(validated_token)
+        except (InvalidToken, AuthenticationFailed):
+            return None
+
+    @sync_to_async
+    def get_current_event(self, user: User, transaction_ref: str) -> Optional[dict]:
+        try:
+            payment_request = PaymentRequest.objects \
+                .only('transaction_ref', 'user_id', 'status', 'user_interaction_url') \
+                .get(transaction_ref=transaction_ref, user_id=user.id)
+        except (PaymentRequest.DoesNotExist, ValidationError):
+            return None
+
+        return serialize_payment_event(payment_request, None)
+
+    async def stream(self, receive, send, queue: asyncio.Queue, transaction_ref: Optional[str],
+                     current_event: Optional[dict]):
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', EVENT_STREAM_CONTENT_TYPE.encode('utf-8')),
+                (b'cache-control', b'no-cache'),
+                # stop nginx from buffering the stream
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+
+        if current_event is not None:
+            await self.send_event(send, current_event)
+
+        disconnected = asyncio.create_task(self.wait_for_disconnect(receive))
+
+        try:
+            while True:
+                next_event = asyncio.create_task(queue.get())
+                done, _ = await asyncio.wait(
+                    {next_event, disconnected},
+                    timeout=settings.PAYMENT_EVENTS_HEARTBEAT_INTERVAL,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+
+                if next_event not in done:
+                    next_event.cancel()
+
+                    if disconnected in done:
+                        break
+
+                    # comments keep idle connections from being closed by proxies
+                    await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+                    continue
+
+                payment_event = next_event.result()
+
+                if transaction_ref is None or payment_event['transaction_ref'] == transaction_ref:
+                    await self.send_event(send, payment_event)
+        finally:
+            disconnected.cancel()
+
+    async def long_poll(self, send, queue: asyncio.Queue, transaction_ref: Optional[str],
+                        current_event: Optional[dict], timeout: Optional[str]):
+        if current_event is not None and (
+                current_event['status'] != PaymentRequestStatus.NEW.name or current_event['user_interaction_url']):
+            return await self.send_json(send, 200, current_event)
+
+        try:
+            timeout = min(float(timeout), settings.PAYMENT_EVENTS_LONG_POLL_TIMEOUT)
+        except (TypeError, ValueError):
+            timeout = settings.PAYMENT_EVENTS_LONG_POLL_TIMEOUT
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        while (remaining := deadline - loop.time()) > 0:
+            try:
+                payment_event = await asyncio.wait_for(queue.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+
+            if transaction_ref is None or payment_event['transaction_ref'] == transaction_ref:
+                return await self.send_json(send, 200, payment_event)
+
+        await send({'type': 'http.response.start', 'status': 204, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    @staticmethod
+    async def wait_for_disconnect(receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    @staticmethod
+    async def send_event(send, payment_event: dict):
+        body = f'event: payment\ndata: {json.dumps(payment_event)}\n\n'.encode('utf-8')
+        await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+
+    @staticmethod
+    async def send_json(send, status: int, data: dict):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json')],
+        })
+        await send({'type': 'http.response.body', 'body': json.dumps(data).encode('utf-8')})
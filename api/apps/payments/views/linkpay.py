@@ -2,15 +2,20 @@ import uuid
 
 import structlog
 from django.conf import settings
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.db import transaction
+from rest_framework.generics import RetrieveAPIView
 from rest_framework.response import Response
-from rest_framework.status import HTTP_400_BAD_REQUEST, HTTP_500_INTERNAL_SERVER_ERROR
+from rest_framework.status import HTTP_400_BAD_REQUEST, HTTP_500_INTERNAL_SERVER_ERROR, HTTP_202_ACCEPTED, \
+    HTTP_404_NOT_FOUND
 from rest_framework.views import APIView
 
-from api.apps.payments.models import BankAccount, BankAccountToken
+from api.apps.payments.authorizations import cache_payment_authorization, get_cached_payment_authorization
+from api.apps.payments.linking import create_account_link
+from api.apps.payments.models import AccountLink, BankAccount, TokenRevocation
 from api.apps.payments.serializers.linkpay import PaymentAuthorizationSerializer, FetchUserTokenSerializer, \
     UnlinkAccountSerializer
-from api.apps.users.models import User
+from api.apps.payments.tasks import link_account, revoke_unlinked_account_tokens
 from api.utils.libs.stitch.authentication import Authentication
 from api.utils.libs.stitch.errors import LinkPayError
 from api.utils.libs.stitch.linkpay.linkpay import LinkPay
@@ -19,52 +24,28 @@ from api.utils.permissions import IsActiveUser
 log = structlog.get_logger('api_requests')
 
 
-def fetch_linked_account_details(access_token: str) -> dict:
-    logger = log.bind(event='get_account_details', request_id=str(uuid.uuid4()))
-
-    try:
-        account_details = LinkPay(token=access_token).get_linked_account_identity()
-
-        return account_details['user']['paymentAuthorization']['bankAccount']
-    except LinkPayError as e:
-        logger.error(f'could not fetch linked account identity: {str(e)}')
-
-        return {}
-    except Exception as e:
-        logger.error(f'an unexpected error happened trying to fetch linked account identity: {str(e)}')
-
-        return {}
-
-
-def save_linked_account_details(user: User, account_details: dict, user_token: dict) -> str:
-    account_holder = account_details['accountHolder']
-
-    account = BankAccount.objects.create(
-        user_id=user.id,
-        bank_id=account_details['bankId'],
-        account_id=account_details['id'],
-        name=account_details['name'],
-        account_name=account_holder['fullName'],
-        account_type=account_details['accountType'],
-        account_number=account_details['accountNumber'],
-    )
-    BankAccountToken.objects.create(
-        account=account,
-        token_id=user_token['id_token'],
-        refresh_token=user_token['refresh_token']
-    )
-
-    return account.account_id
-
-
 class CreatePaymentAuthorizationView(APIView):
     permission_classes = (IsActiveUser,)
+    throttle_scope = 'linkpay_authorize'
 
     def post(self, request):
         serialized_data = PaymentAuthorizationSerializer(data=request.data)
         logger = log.bind(event='payment_authorization', request_id=str(uuid.uuid4()))
 
         if serialized_data.is_valid(raise_exception=True):
+            payer = {
+                'name': serialized_data.validated_data['full_name'],
+                'email': serialized_data.validated_data['email'],
+            }
+
+            # repeated attempts get the authorization that's still pending, rather than a new one created on Stitch
+            cached_authorization = get_cached_payment_authorization(request.user.id, payer)
+
+            if cached_authorization is not None:
+                logger.debug('Reusing pending payment authorization')
+
+                return Response(data=cached_authorization, content_type='application/json')
+
             payment_authorization = {
                 'input': {
                     'beneficiary': {
@@ -78,8 +59,7 @@ class CreatePaymentAuthorizationView(APIView):
                         }
                     },
                     'payer': {
-                        'name': serialized_data.validated_data['full_name'],
-                        'email': serialized_data.validated_data['email'],
+                        **payer,
                         'reference': 'TestPayerRef'
                     }
                 }
@@ -108,6 +88,7 @@ class CreatePaymentAuthorizationView(APIView):
                 base_url=payment_authorization['clientPaymentAuthorizationRequestCreate']['authorizationRequestUrl'],
                 scopes='openid transactions accounts balances accountholders offline_access paymentinitiationrequest'
             )
+            cache_payment_authorization(request.user.id, payer, authorization_url)
 
             return Response(
                 data=authorization_url,
@@ -116,6 +97,10 @@ class CreatePaymentAuthorizationView(APIView):
 
 
 class VerifyAndLinkUserAccount(APIView):
+    """
+    Exchanges the authorization code for the user's token and links the account in the background, returning a
+    ``link_id`` straight away. The outcome can then be fetched from :class:`FetchAccountLinkStatus`.
+    """
     permission_classes = (IsActiveUser,)
 
     def post(self, request):
@@ -137,41 +122,44 @@ class VerifyAndLinkUserAccount(APIView):
                     content_type='application/json'
                 )
 
-            try:
-                linked_user = request.user
-                account_details = fetch_linked_account_details(user_token_response['access_token'])
+            account_link = create_account_link(request.user, user_token_response)
+            link_account.delay(f'{account_link.id}')
 
-                if (linked_user.get_full_name() == account_details['accountHolder']['fullName']) and \
-                        linked_user.identification_number == account_details['accountHolder']['identifyingDocument']['number']:
-                    existing_linked_accounts = BankAccount.objects.filter(user_id=linked_user.id) \
-                        .values_list('account_id', flat=True)
+            logger.info(link_id=f'{account_link.id}', message='Account link accepted')
 
-                    if account_details.get('id') in existing_linked_accounts:
-                        return Response(
-                            data={'success': 'Account already linked for user'},
-                            content_type='application/json'
-                        )
+            return Response(
+                data={'link_id': f'{account_link.id}', 'status': account_link.status},
+                status=HTTP_202_ACCEPTED,
+                content_type='application/json'
+            )
 
-                    save_linked_account_details(request.user, account_details, user_token_response)
 
-                    return Response(
-                        data={'success': 'Account successfully linked'},
-                        content_type='application/json'
-                    )
+class FetchAccountLinkStatus(RetrieveAPIView):
+    permission_classes = (IsActiveUser,)
 
-                return Response(
-                    data={'error': 'Mismatch between linked account KYC details and user\'s KYC details'},
-                    status=HTTP_400_BAD_REQUEST,
-                    content_type='application/json'
-                )
-            except Exception as e:
-                logger.error(e)
+    def get(self, request, link_id, *args, **kwargs):
+        try:
+            account_link = AccountLink.objects \
+                .select_related('account') \
+                .only('id', 'status', 'failure_reason', 'modified', 'account___account_id_data') \
+                .get(id=link_id, user_id=request.user.id)
+        except (AccountLink.DoesNotExist, ValidationError):
+            return Response(
+                data={'error': 'Could not find the specified account link.'},
+                status=HTTP_404_NOT_FOUND,
+                content_type='application/json'
+            )
 
-                return Response(
-                    data={'error': f'{e}'},
-                    status=HTTP_500_INTERNAL_SERVER_ERROR,
-                    content_type='application/json'
-                )
+        return Response(
+            data={
+                'link_id': f'{account_link.id}',
+                'status': account_link.status,
+                'account_id': account_link.account._account_id_data if account_link.account else None,
+                'error': account_link.failure_reason or None,
+                'modified': account_link.modified,
+            },
+            content_type='application/json'
+        )
 
 
 class UnlinkUserAccount(APIView):
@@ -182,45 +170,46 @@ class UnlinkUserAccount(APIView):
         logger = log.bind(event='unlink_account', request_id=str(uuid.uuid4()), email=request.user.email)
 
         if serialized_data.is_valid(raise_exception=True):
-            try:
-                linked_account: BankAccount = BankAccount.objects.get(
-                    account_id=serialized_data.validated_data['account_id'],
-                    user_id=request.user.id
-                )
-            except BankAccount.DoesNotExist:
-                logger.error(message='Could not find the specified account.')
-                return Response(
-                    data={'error': 'Please ensure the specified account has been linked.'},
-                    status=HTTP_400_BAD_REQUEST,
-                    content_type='application/json'
-                )
+            # resolved from the linked accounts cache, rather than hashing the account_id to query the SearchField
+            cached_account = BankAccount.objects.find_linked_account(
+                request.user.id, serialized_data.validated_data['account_id']
+            )
 
-            try:
-                refresh_token = linked_account.bankaccounttoken.refresh_token
-            except ObjectDoesNotExist:
-                logger.error(message='Specified account does not have a refresh token saved.')
-                return Response(
-                    data={'error': 'Please ensure the specified account has been linked.'},
-                    status=HTTP_400_BAD_REQUEST,
-                    content_type='application/json'
-                )
+            with transaction.atomic():
+                try:
+                    if cached_account is None:
+                        raise BankAccount.DoesNotExist
 
-            token_revoked = Authentication().revoke_token(
-                token=refresh_token, token_type='refresh_token'
-            )
+                    linked_account: BankAccount = BankAccount.objects \
+                        .select_related('bankaccounttoken') \
+                        .get(id=cached_account['id'], user_id=request.user.id)
+                except BankAccount.DoesNotExist:
+                    logger.error(message='Could not find the specified account.')
+                    return Response(
+                        data={'error': 'Please ensure the specified account has been linked.'},
+                        status=HTTP_400_BAD_REQUEST,
+                        content_type='application/json'
+                    )
 
-            if token_revoked:
-                logger.info('Refresh token revoked successfully on Stitch')
+                try:
+                    refresh_token = linked_account.bankaccounttoken.refresh_token
+                except ObjectDoesNotExist:
+                    logger.error(message='Specified account does not have a refresh token saved.')
+                    return Response(
+                        data={'error': 'Please ensure the specified account has been linked.'},
+                        status=HTTP_400_BAD_REQUEST,
+                        content_type='application/json'
+                    )
+
+                # the token is revoked on Stitch once the account is gone, so the unlink doesn't wait on Stitch and
+                # a revocation that fails is retried rather than leaving the account linked
+                TokenRevocation.objects.create(token=refresh_token, token_type='refresh_token')
                 linked_account.delete()
-                logger.info('Account records and token successfully deleted')
+                transaction.on_commit(revoke_unlinked_account_tokens.delay)
 
-                return Response(
-                    data={'success': 'Account successfully unlinked'},
-                    content_type='application/json'
-                )
+            logger.info('Account records and token successfully deleted, refresh token queued for revocation')
 
             return Response(
-                data={'error': 'Account not unlinked'},
-                status=HTTP_400_BAD_REQUEST,
+                data={'success': 'Account successfully unlinked'},
                 content_type='application/json'
             )
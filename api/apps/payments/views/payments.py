@@ -1,23 +1,21 @@
-import json
 import uuid
-from datetime import datetime, timedelta
-
 import structlog
-from django.conf import settings
-from rest_framework.generics import CreateAPIView
+from django.core.exceptions import ValidationError
+from rest_framework.generics import CreateAPIView, RetrieveAPIView
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
-from rest_framework.status import HTTP_500_INTERNAL_SERVER_ERROR, HTTP_400_BAD_REQUEST
-
-from api.apps.payments.models import PaymentRequest, BankAccountToken, PaymentRequestEvent
-from api.apps.payments.serializers.payments import InitiateWalletDepositSerializer
-from api.apps.payments.tasks import process_linkpay_webhook_event
-from api.apps.users.models import User
-from api.utils.code_generator import generate_code
-from api.utils.enums import PaymentRequestEventType
-from api.utils.libs.stitch.base import BaseAPI
+from rest_framework.status import HTTP_500_INTERNAL_SERVER_ERROR, HTTP_400_BAD_REQUEST, HTTP_202_ACCEPTED, \
+    HTTP_404_NOT_FOUND
+
+from api.apps.payments.deposits import build_payment_request_data, create_payment_request, initiate_payment, \
+    initiate_bulk_payments
+from api.apps.payments.limits import reserve_deposits, DEPOSIT_LIMIT_ERRORS
+from api.apps.payments.models import PaymentRequest, BankAccount, BankAccountToken
+from api.apps.payments.serializers.payments import InitiateWalletDepositSerializer, \
+    InitiateBulkWalletDepositSerializer
+from api.apps.payments.tasks import process_linkpay_webhook_event, initiate_deposit
+from api.utils.idempotency import idempotent
 from api.utils.libs.stitch.errors import LinkPayError
-from api.utils.libs.stitch.linkpay.linkpay import LinkPay
 from api.utils.permissions import IsActiveUser
 
 log = structlog.get_logger('api_requests')
@@ -42,35 +40,37 @@ class ProcessPaymentNotification(CreateAPIView):
         )
 
 
-def create_payment_request(payment_request: dict, stitch_ref: str, user: User) -> PaymentRequest:
-    payment_request = PaymentRequest.objects.create(
-        user=user,
-        transaction_ref=payment_request.get('input').get('externalReference'),
-        payer_reference=payment_request.get('input').get('payerReference'),
-        beneficiary_reference=payment_request.get('input').get('beneficiaryReference'),
-        stitch_ref=stitch_ref,
-        amount=payment_request.get('input').get('amount').get('quantity'),
-        amount_currency=payment_request.get('input').get('amount').get('currency')
-    )
-
-    payment_request.paymentrequestevent_set.create(
-        event_type=PaymentRequestEventType.INITIATED.name
-    )
-
-    return payment_request
+ASYNC_PREFERENCE = 'respond-async'
 
 
 class InitiateWalletDeposit(CreateAPIView):
+    """
+    Initiates a deposit into the user's wallet from one of their linked accounts.
+
+    Clients sending a ``Prefer: respond-async`` header get a 202 with the deposit's ``transaction_ref`` as soon as the
+    payment request is created, and the payment is initiated on Stitch by a Celery task. The outcome can then be
+    fetched from :class:`FetchDepositStatus`.
+    """
     permission_classes = (IsActiveUser,)
+    throttle_scope = 'deposits'
 
+    @idempotent
     def post(self, request):
         serialized_data = InitiateWalletDepositSerializer(data=request.data)
         logger = log.bind(event='wallet_deposit_init', request_id=str(uuid.uuid4()))
 
         if serialized_data.is_valid(raise_exception=True):
+            # resolved from the linked accounts cache, rather than hashing the account_id to query the SearchField
+            linked_account = BankAccount.objects.find_linked_account(
+                request.user.id, serialized_data.validated_data['account_id']
+            )
+
             try:
-                account_token = BankAccountToken.objects.get(
-                    account__account_id=serialized_data.validated_data['account_id'],
+                if linked_account is None:
+                    raise BankAccountToken.DoesNotExist
+
+                account_token = BankAccountToken.objects.select_related('account').get(
+                    account_id=linked_account['id'],
                     account__user_id=request.user.id
                 )
             except BankAccountToken.DoesNotExist:
@@ -81,7 +81,7 @@ class InitiateWalletDeposit(CreateAPIView):
                     content_type='application/json'
                 )
 
-            if account_token.account.user != request.user:
+            if account_token.account.user_id != request.user.id:
                 logger.info(message='Initiating payment with account not owned by session user')
                 return Response(
                     data={'error': 'Please specify a valid account for the session user'},
@@ -89,97 +89,188 @@ class InitiateWalletDeposit(CreateAPIView):
                     content_type='application/json'
                 )
 
-            existing_payer_refs = PaymentRequest.objects.values_list('payer_reference', flat=True)
-            existing_ben_refs = PaymentRequest.objects.values_list('beneficiary_reference', flat=True)
-
-            # max for payerReference is 12, so remove 2 xters for the default "PW" prefix
-            payer_ref = generate_code(existing=existing_payer_refs, size=10)
-            # max for beneficiaryReference is 20, so remove 2 xters for the default "PW" prefix
-            beneficiary_ref = generate_code(existing=existing_ben_refs, size=18)
-
             validated_amount = serialized_data.validated_data['amount']
-            external_reference = uuid.uuid4()
-            expiry = datetime.utcnow() + datetime.timedelta(minutes=15)
-            payment_request_data = {
-                'input': {
-                    'amount': {
-                        'quantity': f'{validated_amount.amount}',
-                        'currency': f'{validated_amount.currency}'
-                    },
-                    'payerReference': payer_ref,
-                    'beneficiaryReference': beneficiary_ref,
-                    'externalReference': f'{external_reference}',
-                    'expireAt': expiry.isoformat(sep='T', timespec='seconds')
-                }
-            }
+            exceeded_limit = reserve_deposits(request.user.id, [validated_amount.amount])
 
-            try:
-                user_token = BaseAPI().refresh_user_credentials(account_token.refresh_token)
+            if exceeded_limit:
+                logger.info(limit=exceeded_limit, message='Deposit limit exceeded')
+                return Response(
+                    data={'error': DEPOSIT_LIMIT_ERRORS[exceeded_limit], 'limit': exceeded_limit},
+                    status=HTTP_400_BAD_REQUEST,
+                    content_type='application/json'
+                )
 
-                account_token.token_id = user_token['id_token']
-                account_token.refresh_token = user_token['refresh_token']
-                account_token.save()
+            payment_request_data = build_payment_request_data(validated_amount)
+            payment_request = create_payment_request(payment_request_data, '', request.user)
 
-                logger.debug(message='Token refreshed successfully')
+            if ASYNC_PREFERENCE in request.headers.get('Prefer', ''):
+                initiate_deposit.delay(
+                    f'{payment_request.transaction_ref}', payment_request_data, f'{account_token.id}'
+                )
 
-                payment_init = LinkPay(token=user_token['access_token']).initiate_user_payment(payment_request_data)
+                logger.info(transaction_ref=f'{payment_request.transaction_ref}', message='Deposit accepted')
 
-                stitch_ref = payment_init.get('userInitiatePayment', {}) \
-                    .get('paymentInitiation', {}) \
-                    .get('id', 'error-getting-ref')
+                return Response(
+                    data={'transaction_ref': f'{payment_request.transaction_ref}', 'status': payment_request.status},
+                    status=HTTP_202_ACCEPTED,
+                    content_type='application/json'
+                )
 
-                create_payment_request(payment_request_data, stitch_ref, request.user)
+            try:
+                initiate_payment(payment_request, payment_request_data, account_token)
+            except LinkPayError as e:
+                error_message = e.get_full_details()
+                logger.error(message=error_message)
+
+                return Response(
+                    data={'error': error_message},
+                    status=HTTP_400_BAD_REQUEST,
+                    content_type='application/json'
+                )
+            except Exception as e:
+                error_prefix = 'An unexpected error happened trying to initiate payment request'
+                logger.error(message=f'{error_prefix}: {str(e)}')
 
-                message = f'Deposit of {validated_amount} initiated successfully'
+                return Response(
+                    data={'error': error_prefix},
+                    status=HTTP_500_INTERNAL_SERVER_ERROR,
+                    content_type='application/json'
+                )
 
-                logger.info(stitch_ref=stitch_ref, message=message)
+            if payment_request.user_interaction_url:
+                logger.info(stitch_ref=payment_request.stitch_ref, message='User interaction required')
 
                 return Response(
-                    data={'success': message},
+                    data={'url': payment_request.user_interaction_url},
                     content_type='application/json'
                 )
-            except LinkPayError as e:
-                error_context = e.extras
-                error_message = e.get_full_details()
 
-                stitch_ref = error_context.get('id', '')
-                payment_request = create_payment_request(payment_request_data, stitch_ref, request.user)
+            message = f'Deposit of {validated_amount} initiated successfully'
+            logger.info(stitch_ref=payment_request.stitch_ref, message=message)
 
-                if (e.get_codes()) == 'USER_INTERACTION_REQUIRED':
-                    payment_request.paymentrequestevent_set.create(
-                        event_type=PaymentRequestEventType.USER_INTERACTION.name,
-                        event_description=e.detail
-                    )
+            return Response(
+                data={'success': message},
+                content_type='application/json'
+            )
 
-                    if error_context:
-                        redirect_uri = settings.LINKPAY_USER_INTERACTION_URI
-                        user_interaction_uri = error_context.get('userInteractionUrl')
-                        response = {
-                            'url': f'{user_interaction_uri}?redirect_uri={redirect_uri}'
-                        }
 
-                        logger.info(stitch_ref=stitch_ref, message=error_message)
+class InitiateBulkWalletDeposit(CreateAPIView):
+    """
+    Initiates deposits into the user's wallet from several of their linked accounts in one call.
 
-                        return Response(
-                            data=response,
-                            content_type='application/json'
-                        )
-                    else:
-                        logger.error(message='Could not find error message context to extract user interaction URI')
+    Every deposit gets its own payment request and the response lists the outcome of each one in the order they were
+    sent, so a failed deposit doesn't fail the rest of the batch.
+    """
+    permission_classes = (IsActiveUser,)
+    throttle_scope = 'deposits'
 
-                logger.error(message=error_message)
+    @idempotent
+    def post(self, request):
+        serialized_data = InitiateBulkWalletDepositSerializer(data=request.data)
+        logger = log.bind(event='wallet_bulk_deposit_init', request_id=str(uuid.uuid4()))
+
+        if serialized_data.is_valid(raise_exception=True):
+            deposits = serialized_data.validated_data['deposits']
 
+            # resolved from the linked accounts cache, rather than OR-ing together a hashed SearchField lookup for each
+            linked_accounts = {
+                linked_account['_account_id_data']: linked_account['id']
+                for linked_account in BankAccount.objects.get_linked_accounts(request.user.id)
+            }
+            account_ids = [
+                linked_accounts[deposit['account_id']]
+                for deposit in deposits if deposit['account_id'] in linked_accounts
+            ]
+            account_tokens = {
+                account_token.account.account_id: account_token
+                for account_token in BankAccountToken.objects
+                .select_related('account')
+                .filter(account__user_id=request.user.id, account_id__in=account_ids)
+            }
+
+            unlinked_accounts = [
+                deposit['account_id'] for deposit in deposits if deposit['account_id'] not in account_tokens
+            ]
+
+            if unlinked_accounts:
+                logger.error(message='Could not find saved refresh tokens for some of the specified accounts.')
                 return Response(
-                    data={'error': error_message},
+                    data={
+                        'error': 'Please ensure the specified accounts have been linked before using them to initiate '
+                                 'a deposit.',
+                        'accounts': unlinked_accounts
+                    },
                     status=HTTP_400_BAD_REQUEST,
                     content_type='application/json'
                 )
-            except Exception as e:
-                error_prefix = 'An unexpected error happened trying to initiate payment request'
-                logger.error(message=f'{error_prefix}: {str(e)}')
 
+            exceeded_limit = reserve_deposits(request.user.id, [deposit['amount'].amount for deposit in deposits])
+
+            if exceeded_limit:
+                logger.info(limit=exceeded_limit, message='Deposit limit exceeded')
                 return Response(
-                    data={'error': error_prefix},
-                    status=HTTP_500_INTERNAL_SERVER_ERROR,
+                    data={'error': DEPOSIT_LIMIT_ERRORS[exceeded_limit], 'limit': exceeded_limit},
+                    status=HTTP_400_BAD_REQUEST,
                     content_type='application/json'
                 )
+
+            outcomes = initiate_bulk_payments(
+                request.user,
+                [(account_tokens[deposit['account_id']], deposit['amount']) for deposit in deposits]
+            )
+
+            results = []
+
+            for deposit, (payment_request, error) in zip(deposits, outcomes):
+                result = {
+                    'account_id': deposit['account_id'],
+                    'amount': f'{deposit["amount"]}',
+                    'transaction_ref': f'{payment_request.transaction_ref}',
+                }
+
+                if error is not None:
+                    result['status'] = 'failed'
+                    result['error'] = error.get_full_details() if isinstance(error, LinkPayError) \
+                        else 'An unexpected error happened trying to initiate payment request'
+                    logger.error(transaction_ref=result['transaction_ref'], message=f'{error}')
+                elif payment_request.user_interaction_url:
+                    result['status'] = 'user_interaction_required'
+                    result['url'] = payment_request.user_interaction_url
+                else:
+                    result['status'] = 'initiated'
+
+                results.append(result)
+
+            logger.info(message=f'Bulk deposit of {len(results)} payments processed')
+
+            return Response(
+                data={'deposits': results},
+                content_type='application/json'
+            )
+
+
+class FetchDepositStatus(RetrieveAPIView):
+    permission_classes = (IsActiveUser,)
+
+    def get(self, request, transaction_ref, *args, **kwargs):
+        try:
+            payment_request = PaymentRequest.objects \
+                .only('transaction_ref', 'amount', 'amount_currency', 'status', 'user_interaction_url', 'modified') \
+                .get(transaction_ref=transaction_ref, user_id=request.user.id)
+        except (PaymentRequest.DoesNotExist, ValidationError):
+            return Response(
+                data={'error': 'Could not find the specified deposit.'},
+                status=HTTP_404_NOT_FOUND,
+                content_type='application/json'
+            )
+
+        return Response(
+            data={
+                'transaction_ref': f'{payment_request.transaction_ref}',
+                'amount': f'{payment_request.amount}',
+                'status': payment_request.status,
+                'user_interaction_url': payment_request.user_interaction_url or None,
+                'modified': payment_request.modified,
+            },
+            content_type='application/json'
+        )
@@ -0,0 +1,120 @@
+import uuid
+
+import structlog
+from django.core.exceptions import ValidationError
+from rest_framework.generics import CreateAPIView, RetrieveAPIView
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.status import HTTP_400_BAD_REQUEST, HTTP_202_ACCEPTED, HTTP_404_NOT_FOUND
+
+from api.apps.payments.errors import InsufficientBalance
+from api.apps.payments.models import BankAccount, Wallet, Withdrawal
+from api.apps.payments.payouts import has_full_batch, request_withdrawal
+from api.apps.payments.serializers.payments import InitiateWithdrawalSerializer
+from api.apps.payments.tasks import process_disbursement_webhook_event, submit_pending_withdrawals
+from api.utils.idempotency import idempotent
+from api.utils.permissions import IsActiveUser
+
+log = structlog.get_logger('api_requests')
+
+
+class ProcessDisbursementNotification(CreateAPIView):
+    permission_classes = (AllowAny,)
+
+    def post(self, request):
+        payload = request.data
+        headers = {
+            'svix-id': request.headers['svix-id'],
+            'svix-timestamp': request.headers['svix-timestamp'],
+            'svix-signature': request.headers['svix-signature'],
+        }
+
+        process_disbursement_webhook_event.delay(payload, headers)
+
+        return Response(
+            data={'success': 'Webhook received successfully'},
+            content_type='application/json'
+        )
+
+
+class InitiateWithdrawal(CreateAPIView):
+    """
+    Withdraws from the user's wallet to one of their linked accounts.
+
+    The amount is held on the wallet straight away and the withdrawal is accepted with a 202, to be paid out with the
+    next disbursement batch. The outcome can then be fetched from :class:`FetchWithdrawalStatus`.
+    """
+    permission_classes = (IsActiveUser,)
+    throttle_scope = 'withdrawals'
+
+    @idempotent
+    def post(self, request):
+        serialized_data = InitiateWithdrawalSerializer(
+            data=request.data, context={'currency': Wallet.objects.get_currency(request.user.id)}
+        )
+        logger = log.bind(event='wallet_withdrawal_init', request_id=str(uuid.uuid4()))
+
+        if serialized_data.is_valid(raise_exception=True):
+            linked_account = BankAccount.objects.find_linked_account(
+                request.user.id, serialized_data.validated_data['account_id']
+            )
+
+            if linked_account is None:
+                logger.error(message='Could not find the specified account for the session user.')
+                return Response(
+                    data={'error': 'Please ensure the specified account has been linked before withdrawing to it.'},
+                    status=HTTP_400_BAD_REQUEST,
+                    content_type='application/json'
+                )
+
+            validated_amount = serialized_data.validated_data['amount']
+            account = BankAccount.objects.get(id=linked_account['id'], user_id=request.user.id)
+
+            try:
+                withdrawal = request_withdrawal(request.user, account, validated_amount)
+            except InsufficientBalance as e:
+                logger.info(message=f'{e}')
+                return Response(
+                    data={'error': f'{e}'},
+                    status=HTTP_400_BAD_REQUEST,
+                    content_type='application/json'
+                )
+
+            # batches are otherwise submitted on PAYOUT_BATCH_INTERVAL_SECONDS
+            if has_full_batch():
+                submit_pending_withdrawals.delay()
+
+            logger.info(withdrawal_ref=f'{withdrawal.withdrawal_ref}', message='Withdrawal accepted')
+
+            return Response(
+                data={'withdrawal_ref': f'{withdrawal.withdrawal_ref}', 'status': withdrawal.status},
+                status=HTTP_202_ACCEPTED,
+                content_type='application/json'
+            )
+
+
+class FetchWithdrawalStatus(RetrieveAPIView):
+    permission_classes = (IsActiveUser,)
+
+    def get(self, request, withdrawal_ref, *args, **kwargs):
+        try:
+            withdrawal = Withdrawal.objects \
+                .only('withdrawal_ref', 'amount', 'amount_currency', 'status', 'failure_reason', 'modified') \
+                .get(withdrawal_ref=withdrawal_ref, user_id=request.user.id)
+        except (Withdrawal.DoesNotExist, ValidationError):
+            return Response(
+                data={'error': 'Could not find the specified withdrawal.'},
+                status=HTTP_404_NOT_FOUND,
+                content_type='application/json'
+            )
+
+        return Response(
+            data={
+                'withdrawal_ref': f'{withdrawal.withdrawal_ref}',
+                'amount': f'{withdrawal.amount}',
+                'status': withdrawal.status,
+                'failure_reason': withdrawal.failure_reason or None,
+                'modified': withdrawal.modified,
+            },
+            content_type='application/json'
+        )
@@ -0,0 +1,144 @@
+import uuid
+
+import structlog
+from django.contrib.auth import get_user_model
+from rest_framework.generics import CreateAPIView
+from rest_framework.response import Response
+from rest_framework.status import HTTP_400_BAD_REQUEST
+
+from api.apps.payments.models import Wallet
+from api.apps.payments.serializers.payments import InitiateTransferSerializer, InitiateBulkTransferSerializer
+from api.utils.idempotency import idempotent
+from api.utils.permissions import IsActiveUser
+
+log = structlog.get_logger('api_requests')
+
+
+def get_recipient_ids(sender, emails) -> dict:
+    # wallets can only be sent to active users other than the sender
+    return dict(
+        get_user_model().objects
+        .filter(email__in=emails, is_active=True)
+        .exclude(id=sender.id)
+        .values_list('email', 'id')
+    )
+
+
+class InitiateTransfer(CreateAPIView):
+    """
+    Transfers from the user's wallet to another user's wallet.
+    """
+    permission_classes = (IsActiveUser,)
+    throttle_scope = 'transfers'
+
+    @idempotent
+    def post(self, request):
+        serialized_data = InitiateTransferSerializer(
+            data=request.data, context={'currency': Wallet.objects.get_currency(request.user.id)}
+        )
+        logger = log.bind(event='wallet_transfer', request_id=str(uuid.uuid4()))
+
+        if serialized_data.is_valid(raise_exception=True):
+            recipient = serialized_data.validated_data['recipient']
+            recipient_id = get_recipient_ids(request.user, [recipient]).get(recipient)
+
+            if recipient_id is None:
+                logger.info(message='Transfer to an unknown recipient')
+                return Response(
+                    data={'error': 'Please specify an active user other than yourself to transfer to.'},
+                    status=HTTP_400_BAD_REQUEST,
+                    content_type='application/json'
+                )
+
+            validated_amount = serialized_data.validated_data['amount']
+            transfer, error = Wallet.objects.apply_transfers([
+                (request.user.id, recipient_id, validated_amount.amount, serialized_data.validated_data['reference'])
+            ])[0]
+
+            if error is not None:
+                logger.info(message=f'{error}')
+                return Response(
+                    data={'error': f'{error}'},
+                    status=HTTP_400_BAD_REQUEST,
+                    content_type='application/json'
+                )
+
+            logger.info(transfer_ref=f'{transfer.transfer_ref}', message='Transfer completed')
+
+            return Response(
+                data={
+                    'transfer_ref': f'{transfer.transfer_ref}',
+                    'recipient': recipient,
+                    'amount': f'{transfer.amount}',
+                },
+                content_type='application/json'
+            )
+
+
+class InitiateBulkTransfer(CreateAPIView):
+    """
+    Transfers from the user's wallet to several other users' wallets in one call.
+
+    The transfers are applied in the order they were sent, in a single transaction, and the response lists the outcome
+    of each one in the same order, so a transfer the balance runs out for doesn't fail the rest of the batch.
+    """
+    permission_classes = (IsActiveUser,)
+    throttle_scope = 'transfers'
+
+    @idempotent
+    def post(self, request):
+        serialized_data = InitiateBulkTransferSerializer(
+            data=request.data, context={'currency': Wallet.objects.get_currency(request.user.id)}
+        )
+        logger = log.bind(event='wallet_bulk_transfer', request_id=str(uuid.uuid4()))
+
+        if serialized_data.is_valid(raise_exception=True):
+            transfers = serialized_data.validated_data['transfers']
+            recipient_ids = get_recipient_ids(request.user, {transfer['recipient'] for transfer in transfers})
+
+            unknown_recipients = [
+                transfer['recipient'] for transfer in transfers if transfer['recipient'] not in recipient_ids
+            ]
+
+            if unknown_recipients:
+                logger.info(message='Bulk transfer to unknown recipients')
+                return Response(
+                    data={
+                        'error': 'Please specify active users other than yourself to transfer to.',
+                        'recipients': unknown_recipients
+                    },
+                    status=HTTP_400_BAD_REQUEST,
+                    content_type='application/json'
+                )
+
+            outcomes = Wallet.objects.apply_transfers([
+                (
+                    request.user.id, recipient_ids[transfer['recipient']], transfer['amount'].amount,
+                    transfer['reference']
+                )
+                for transfer in transfers
+            ])
+
+            results = []
+
+            for transfer_data, (transfer, error) in zip(transfers, outcomes):
+                result = {
+                    'recipient': transfer_data['recipient'],
+                    'amount': f'{transfer_data["amount"]}',
+                }
+
+                if error is not None:
+                    result['status'] = 'failed'
+                    result['error'] = f'{error}'
+                else:
+                    result['status'] = 'completed'
+                    result['transfer_ref'] = f'{transfer.transfer_ref}'
+
+                results.append(result)
+
+            logger.info(message=f'Bulk transfer of {len(results)} transfers processed')
+
+            return Response(
+                data={'transfers': results},
+                content_type='application/json'
+            )
@@ -1,27 +1,33 @@
+from djmoney.money import Money
 from rest_framework.generics import RetrieveAPIView
 from rest_framework.response import Response
 
-from api.apps.payments.models import BankAccount, PaymentRequest
+from api.apps.payments.bank_balances import get_bank_balances
+from api.apps.payments.linked_accounts import client_linked_account
+from api.apps.payments.models import BankAccount, PaymentRequest, Wallet
 from api.utils.permissions import IsActiveUser
+from api.utils.response_cache import versioned_response
 
 
 class FetchUserLinkedAccounts(RetrieveAPIView):
     permission_classes = (IsActiveUser, )
 
+    # served from the linked accounts cache, which is encrypted rather than kept in plain text in the response cache
+    @versioned_response('linked_accounts', cache_data=False)
     def get(self, request, *args, **kwargs):
-        linked_accounts = BankAccount.objects\
-            .filter(user=request.user)\
-            .values('bank_id', 'name', '_account_id_data', 'account_name', 'account_type', 'account_number', 'created')
+        linked_accounts = BankAccount.objects.get_linked_accounts(request.user.id)
 
         return Response(
-            data=list(linked_accounts),
+            data=[client_linked_account(linked_account) for linked_account in linked_accounts],
             content_type='application/json'
         )
 
 
 class FetchUserTransactions(RetrieveAPIView):
     permission_classes = (IsActiveUser, )
+    throttle_scope = 'transactions'
 
+    @versioned_response('transactions')
     def get(self, request, *args, **kwargs):
         # TODO: likely to be slow for huge records, replace with DRF serializer perhaps
         transactions = PaymentRequest.objects \
@@ -48,3 +54,34 @@ class FetchUserTransactions(RetrieveAPIView):
             data=transaction_list,
             content_type='application/json'
         )
+
+
+class FetchUserWalletBalance(RetrieveAPIView):
+    permission_classes = (IsActiveUser, )
+
+    def get(self, request, *args, **kwargs):
+        # served from the wallet balance cache, which is written through by every ledger posting
+        wallet_balance = Wallet.objects.get_balance(request.user.id)
+
+        return Response(
+            data={
+                'balance': f'{Money(wallet_balance["balance"], wallet_balance["currency"])}',
+                'amount': wallet_balance['balance'],
+                # the balance less the amounts held for withdrawals in flight
+                'available': wallet_balance['available'],
+                'currency': wallet_balance['currency'],
+                'last_activity': wallet_balance['last_activity'],
+            },
+            content_type='application/json'
+        )
+
+
+class FetchLinkedAccountBalances(RetrieveAPIView):
+    permission_classes = (IsActiveUser, )
+
+    def get(self, request, *args, **kwargs):
+        # served from the bank balance cache, concurrent requests for balances that aren't cached share one fetch
+        return Response(
+            data=get_bank_balances(request.user.id),
+            content_type='application/json'
+        )
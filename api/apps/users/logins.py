@@ -0,0 +1,91 @@
+from typing import List, Tuple
+
+import structlog
+from django.conf import settings
+from django.contrib.auth.models import update_last_login
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from redis.exceptions import RedisError
+
+from api.apps.users.models import User
+from api.utils.redis import get_redis_connection
+
+log = structlog.get_logger('api_requests')
+
+LAST_LOGIN_BUFFER_KEY = 'last_login_buffer'
+LAST_LOGIN_FLUSHING_KEY = f'{LAST_LOGIN_BUFFER_KEY}:flushing'
+
+# moves the buffered logins aside for flushing, unless a previous flush died before finishing, in which case its logins
+# are flushed first and the ones buffered since then wait for the next flush
+TAKE_BUFFERED_LOGINS_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 and redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('RENAME', KEYS[1], KEYS[2])
+end
+
+return redis.call('HGETALL', KEYS[2])
+"""
+
+
+def record_login(user: User) -> None:
+    """
+    Records the user's login time, buffering it in Redis for :func:`flush_last_logins` when ``BUFFER_LAST_LOGIN`` is
+    on so that signing in doesn't have to wait on an UPDATE of the user's row.
+    """
+    if not settings.BUFFER_LAST_LOGIN:
+        return update_last_login(None, user)
+
+    user.last_login = timezone.now()
+
+    try:
+        get_redis_connection().hset(LAST_LOGIN_BUFFER_KEY, f'{user.pk}', user.last_login.isoformat())
+    except RedisError as e:
+        log.error(event='record_login', message=f'Could not buffer last login, saving it instead: {e}')
+        update_last_login(None, user)
+
+
+def update_last_logins(last_logins: List[Tuple[str, str]]) -> int:
+    """
+    Sets the last login of every user in ``last_logins`` with a single UPDATE, skipping users who have since logged
+    in again without buffering.
+    """
+    table = connection.ops.quote_name(User._meta.db_table)
+    values = ', '.join(['(%s::uuid, %s::timestamptz)'] * len(last_logins))
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET last_login = logins.last_login '
+            f'FROM (VALUES {values}) AS logins (id, last_login) '
+            f'WHERE {table}.id = logins.id '
+            f'AND ({table}.last_login IS NULL OR {table}.last_login < logins.last_login)',
+            [value for last_login in last_logins for value in last_login]
+        )
+
+        return cursor.rowcount
+
+
+def flush_last_logins() -> int:
+    """
+    Writes the buffered last logins to the database in batches of ``LAST_LOGIN_FLUSH_BATCH_SIZE``.
+
+    Returns the number of users updated.
+    """
+    redis_connection = get_redis_connection()
+    buffered_logins: List[bytes] = redis_connection.register_script(TAKE_BUFFERED_LOGINS_SCRIPT)(
+        keys=[LAST_LOGIN_BUFFER_KEY, LAST_LOGIN_FLUSHING_KEY]
+    )
+    last_logins = [
+        (user_id.decode('utf-8'), last_login.decode('utf-8'))
+        for user_id, last_login in zip(buffered_logins[::2], buffered_logins[1::2])
+        if parse_datetime(last_login.decode('utf-8')) is not None
+    ]
+    batch_size = settings.LAST_LOGIN_FLUSH_BATCH_SIZE
+    updated = 0
+
+    # batches are safe to re-run, so if one fails the logins are left aside for the next flush to retry
+    for start in range(0, len(last_logins), batch_size):
+        updated += update_last_logins(last_logins[start:start + batch_size])
+
+    redis_connection.delete(LAST_LOGIN_FLUSHING_KEY)
+
+    return updated
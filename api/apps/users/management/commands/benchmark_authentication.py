@@ -0,0 +1,44 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.utils.authentication import CachedJWTAuthentication
+from api.utils.user_cache import invalidate_cached_user
+
+
+class Command(BaseCommand):
+    help = 'Compares the queries and time taken to authenticate requests with and without the user cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help='Email address of the user to authenticate as')
+        parser.add_argument('--requests', type=int, default=1000, help='Number of requests to authenticate')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(email=options['email'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'Could not find a user with the email address {options["email"]}')
+
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        invalidate_cached_user(user.pk)
+
+        for authentication in (JWTAuthentication(), CachedJWTAuthentication()):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+
+                for _ in range(options['requests']):
+                    authentication.authenticate(request)
+
+                elapsed = time.perf_counter() - started
+
+            self.stdout.write(
+                f'{authentication.__class__.__name__}: '
+                f'{len(queries) / options["requests"]:.3f} queries/request, '
+                f'{elapsed / options["requests"] * 1000:.3f}ms/request'
+            )
@@ -0,0 +1,49 @@
+import os
+import time
+
+from django.contrib.auth.hashers import get_hashers
+from django.core.management.base import BaseCommand
+
+PASSWORD = 'benchmark-password'
+
+
+class Command(BaseCommand):
+    help = 'Reports the signup (hash) and signin (verify) rate per core for each configured password hasher'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=2, help='Seconds to spend benchmarking each operation')
+
+    def handle(self, *args, **options):
+        cores = os.cpu_count() or 1
+        self.stdout.write(f'{cores} cores available, the first hasher is the one used for new passwords')
+
+        for hasher in get_hashers():
+            encoded = hasher.encode(PASSWORD, hasher.salt())
+
+            signups = self.measure(lambda: hasher.encode(PASSWORD, hasher.salt()), options['duration'])
+            signins = self.measure(lambda: hasher.verify(PASSWORD, encoded), options['duration'])
+
+            cost = ', '.join(
+                f'{name} {value}' for name, value in hasher.safe_summary(encoded).items()
+                if name not in ('algorithm', 'salt', 'hash')
+            )
+
+            self.stdout.write(
+                f'{hasher.algorithm} ({cost}): '
+                f'signup {signups:.1f}/s, signin {signins:.1f}/s per core, '
+                f'up to {signins * cores:.1f} signins/s across all cores'
+            )
+
+    @staticmethod
+    def measure(operation, duration: float) -> float:
+        """
+        Runs the operation repeatedly for about ``duration`` seconds, returning how many times it ran per second.
+        """
+        count = 0
+        started = time.perf_counter()
+
+        while (elapsed := time.perf_counter() - started) < duration:
+            operation()
+            count += 1
+
+        return count / elapsed
@@ -0,0 +1,142 @@
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from api.apps.payments.models import Wallet
+from api.apps.users.models import User
+from api.utils.enums import IdentificationType
+
+REQUIRED_FIELDS = ('email', 'full_name', 'short_name')
+IDENTIFICATION_TYPES = [identification_type.name for identification_type in IdentificationType]
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates users and their wallets from a CSV or NDJSON file with email, full_name, short_name, password, '
+        'identification_type and identification_number columns. Progress is checkpointed after every chunk, so the '
+        'import can be re-run to resume after a failure.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=Path, help='CSV or NDJSON (.ndjson/.jsonl) file to import')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Users created per transaction')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Processes hashing passwords, 1 hashes them in this process'
+        )
+        parser.add_argument(
+            '--checkpoint', type=Path, help='File tracking the rows already imported, defaults to <path>.progress'
+        )
+
+    def handle(self, *args, **options):
+        path: Path = options['path']
+        checkpoint: Path = options['checkpoint'] or path.with_name(f'{path.name}.progress')
+
+        if not path.exists():
+            raise CommandError(f'Could not find {path}')
+
+        processed = int(checkpoint.read_text()) if checkpoint.exists() else 0
+        if processed:
+            self.stdout.write(f'Resuming after the first {processed} rows')
+
+        created = skipped = 0
+        started = time.perf_counter()
+
+        with ExitStack() as stack:
+            if options['workers'] > 1:
+                # forked workers must not inherit the database connection, closing it there would close it here too
+                connections.close_all()
+                executor = stack.enter_context(ProcessPoolExecutor(max_workers=options['workers']))
+
+                # hashing is what limits the import, so it's spread over every worker
+                hash_passwords = lambda passwords: executor.map(
+                    make_password, passwords, chunksize=max(1, len(passwords) // (options['workers'] * 4))
+                )
+            else:
+                hash_passwords = lambda passwords: map(make_password, passwords)
+
+            rows = islice(self.read_rows(path), processed, None)
+
+            while chunk := list(islice(rows, options['chunk_size'])):
+                chunk_created = self.import_chunk(chunk, hash_passwords)
+
+                created += chunk_created
+                skipped += len(chunk) - chunk_created
+                processed += len(chunk)
+                self.save_checkpoint(checkpoint, processed)
+
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'{processed} rows processed, {created} users created, {skipped} skipped '
+                    f'({(created + skipped) / elapsed:.1f} rows/s)'
+                )
+
+        checkpoint.unlink(missing_ok=True)
+        self.stdout.write(self.style.SUCCESS(f'Created {created} users, skipped {skipped} rows'))
+
+    @staticmethod
+    def read_rows(path: Path) -> Iterator[dict]:
+        with path.open(newline='') as rows:
+            if path.suffix in ('.ndjson', '.jsonl'):
+                for line in rows:
+                    if line.strip():
+                        yield json.loads(line)
+            else:
+                yield from csv.DictReader(rows)
+
+    def import_chunk(self, chunk: List[dict], hash_passwords: Callable[[list], Iterable[str]]) -> int:
+        """
+        Creates the users in the chunk along with their wallets in a single transaction, skipping invalid rows and
+        emails that are already registered, such as the ones created before the import was interrupted.
+        """
+        rows = {}
+
+        for row in chunk:
+            if not all(row.get(field) for field in REQUIRED_FIELDS):
+                self.stderr.write(f'Skipping row missing one of {", ".join(REQUIRED_FIELDS)}: {row.get("email")}')
+                continue
+
+            if row.get('identification_type') and row['identification_type'] not in IDENTIFICATION_TYPES:
+                self.stderr.write(f'Skipping row with an unknown identification_type: {row["email"]}')
+                continue
+
+            rows.setdefault(User.objects.normalize_email(row['email']), row)
+
+        existing_emails = set(User.objects.filter(email__in=rows.keys()).values_list('email', flat=True))
+        rows = {email: row for email, row in rows.items() if email not in existing_emails}
+
+        passwords = hash_passwords([row.get('password') or None for row in rows.values()])
+
+        users = [
+            User(
+                email=email,
+                full_name=row['full_name'],
+                short_name=row['short_name'],
+                identification_type=row.get('identification_type') or '',
+                identification_number=row.get('identification_number') or '',
+                password=password,
+            )
+            for (email, row), password in zip(rows.items(), passwords)
+        ]
+
+        with transaction.atomic():
+            User.objects.bulk_create(users)
+            Wallet.objects.bulk_create([Wallet(user=user) for user in users])
+
+        return len(users)
+
+    @staticmethod
+    def save_checkpoint(checkpoint: Path, processed: int) -> None:
+        temporary = checkpoint.with_name(f'{checkpoint.name}.tmp')
+        temporary.write_text(f'{processed}')
+        temporary.replace(checkpoint)
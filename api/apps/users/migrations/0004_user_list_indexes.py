@@ -0,0 +1,37 @@
+# Generated by Django 4.1.3 on 2026-10-19 09:00
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+    # the indexes are built without locking users_user against writes, which can't be done in a transaction
+    atomic = False
+
+    dependencies = [
+        ('users', '0003_alter_user_identification_number'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='user',
+            index=models.Index(fields=['created', 'id'], name='users_user_created_id_idx'),
+        ),
+        # Django 4.1 wraps OpClass expressions in an extra pair of parentheses, which PostgreSQL rejects
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='user',
+                    index=models.Index(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('email'), name='text_pattern_ops'), name='users_email_upper_like_idx'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(
+                    sql='CREATE INDEX CONCURRENTLY "users_email_upper_like_idx" ON "users_user" (UPPER("email") text_pattern_ops)',
+                    reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS "users_email_upper_like_idx"',
+                ),
+            ],
+        ),
+    ]
@@ -1,12 +1,17 @@
 from django.contrib.auth.base_user import BaseUserManager
-from django.db import models
+from django.contrib.postgres.indexes import OpClass
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
+from django.db.models.functions import Upper
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from encrypted_fields import fields
 
 from model_utils.models import UUIDModel, TimeStampedModel
 
 from api.utils.enums import IdentificationType, enum_choices
 from api.utils.mixins.models import UserMixin
+from api.utils.user_cache import invalidate_cached_user
 
 
 class CustomUserManager(BaseUserManager):
@@ -61,6 +66,14 @@ class User(PermissionsMixin, UUIDModel, TimeStampedModel, AbstractBaseUser):
 
     objects = CustomUserManager()
 
+    class Meta:
+        indexes = [
+            # keyset pagination of the user list
+            models.Index(fields=['created', 'id'], name='users_user_created_id_idx'),
+            # email prefix searches, which Django runs as UPPER(email) LIKE UPPER('prefix%')
+            models.Index(OpClass(Upper('email'), name='text_pattern_ops'), name='users_email_upper_like_idx'),
+        ]
+
     def __str__(self) -> str:
         return f'{self.get_full_name()} {self.email}'
 
@@ -87,3 +100,11 @@ class User(PermissionsMixin, UUIDModel, TimeStampedModel, AbstractBaseUser):
             'email': self.email,
             'last_login': f'{self.last_login}',
         }
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_cache(sender, instance, **kwargs):
+    # evicted straight away and again once committed, so a request running alongside the save can't cache the old row
+    invalidate_cached_user(instance.pk)
+    transaction.on_commit(lambda: invalidate_cached_user(instance.pk))
@@ -17,8 +17,9 @@ class CreateUserSerializer(serializers.ModelSerializer[User]):
     def create(self, validated_data):
         # call create_user on user object. Without this
         # the password will be stored in plain text.
-        user = User.objects.create_user(**validated_data)
-        Wallet.objects.create(user=user)
+        with transaction.atomic():
+            user = User.objects.create_user(**validated_data)
+            Wallet.objects.create(user=user)
 
         return user
 
@@ -0,0 +1,21 @@
+import uuid
+
+import structlog
+from celery import shared_task
+
+from api.apps.users.logins import flush_last_logins
+
+log = structlog.get_logger('api_requests')
+
+
+@shared_task()
+def flush_buffered_last_logins():
+    """
+    Writes the last logins buffered in Redis by signin to the database.
+    """
+    logger = log.bind(event='flush_buffered_last_logins', request_id=str(uuid.uuid4()))
+
+    updated = flush_last_logins()
+    logger.info(message=f'Flushed the last login of {updated} users')
+
+    return updated
@@ -0,0 +1,47 @@
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.apps.users.tests.test_api import create_user
+from api.utils.user_cache import authenticated_user_key, local_user_cache
+
+
+class CachedJWTAuthenticationTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        local_user_cache.clear()
+        self.user = create_user()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_user_is_only_loaded_once(self):
+        self.client.get(reverse('auth:view-update-user'))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('auth:view-update-user'))
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(self.user.email, response.data['email'])
+
+    def test_saving_the_user_invalidates_the_cache(self):
+        self.client.get(reverse('auth:view-update-user'))
+
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.client.get(reverse('auth:view-update-user'))
+
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+    def test_only_the_fields_needed_to_authenticate_are_cached(self):
+        self.user.identification_number = '12345678'
+        self.user.save()
+        self.client.get(reverse('auth:view-update-user'))
+
+        cached_user = cache.get(authenticated_user_key(self.user.pk))
+
+        self.assertEqual(self.user.email, cached_user['email'])
+        self.assertNotIn('password', cached_user)
+        self.assertNotIn('identification_number', cached_user)
+        self.assertNotIn('12345678', f'{cached_user}')
@@ -0,0 +1,40 @@
+from django.contrib.auth import authenticate
+from django.test import TestCase, override_settings
+
+from api.apps.users.tests.test_api import PASSWORD, create_user
+
+PBKDF2_HASHER = 'api.utils.hashers.PBKDF2PasswordHasher'
+SCRYPT_HASHER = 'api.utils.hashers.ScryptPasswordHasher'
+
+
+@override_settings(
+    PASSWORD_HASHERS=[PBKDF2_HASHER, SCRYPT_HASHER],
+    PASSWORD_HASH_PBKDF2_ITERATIONS=1000,
+    PASSWORD_HASH_SCRYPT_WORK_FACTOR=2 ** 10
+)
+class PasswordHasherPolicyTest(TestCase):
+    def setUp(self):
+        self.user = create_user()
+
+    def authenticate(self):
+        self.assertIsNotNone(authenticate(email=self.user.email, password=PASSWORD))
+        self.user.refresh_from_db()
+
+    def test_passwords_are_rehashed_when_the_cost_is_lowered(self):
+        with override_settings(PASSWORD_HASH_PBKDF2_ITERATIONS=500):
+            self.authenticate()
+
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$500$'))
+
+    def test_passwords_are_rehashed_with_the_preferred_hasher(self):
+        with override_settings(PASSWORD_HASHERS=[SCRYPT_HASHER, PBKDF2_HASHER]):
+            self.authenticate()
+
+        self.assertTrue(self.user.password.startswith('scrypt$1024$'))
+
+    def test_passwords_are_kept_when_the_policy_is_unchanged(self):
+        password = self.user.password
+
+        self.authenticate()
+
+        self.assertEqual(password, self.user.password)
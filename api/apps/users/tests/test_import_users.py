@@ -0,0 +1,55 @@
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from api.apps.payments.models import Wallet
+from api.apps.users.models import User
+
+USERS_CSV = '''email,full_name,short_name,password,identification_type,identification_number
+first@example.com,First User,First,first-password,ID,8001015009087
+second@Example.com,Second User,Second,second-password,PASSPORT,A1234567
+,Missing Email,Missing,password,,
+third@example.com,Third User,Third,,,
+'''
+
+
+class ImportUsersCommandTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        self.path = Path(directory.name, 'users.csv')
+        self.path.write_text(USERS_CSV)
+
+    def import_users(self, **options):
+        call_command(
+            'import_users', self.path, chunk_size=2, workers=1, stdout=StringIO(), stderr=StringIO(), **options
+        )
+
+    def test_users_are_created_with_wallets(self):
+        self.import_users()
+
+        user = User.objects.get(email='second@example.com')
+
+        self.assertEqual(3, User.objects.count())
+        self.assertEqual(3, Wallet.objects.count())
+        self.assertTrue(user.check_password('second-password'))
+        self.assertEqual('A1234567', user.identification_number)
+        self.assertFalse(User.objects.get(email='third@example.com').has_usable_password())
+        self.assertFalse(Path(f'{self.path}.progress').exists())
+
+    def test_import_resumes_from_the_checkpoint(self):
+        Path(f'{self.path}.progress').write_text('2')
+
+        self.import_users()
+
+        self.assertEqual(['third@example.com'], list(User.objects.values_list('email', flat=True)))
+
+    def test_users_that_already_exist_are_skipped(self):
+        self.import_users()
+        self.import_users()
+
+        self.assertEqual(3, User.objects.count())
@@ -0,0 +1,58 @@
+from datetime import timedelta
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from api.apps.users.logins import LAST_LOGIN_BUFFER_KEY, record_login, flush_last_logins
+from api.apps.users.tests.test_api import create_user
+from api.utils.redis import get_redis_connection
+
+
+class LastLoginBufferingTest(TestCase):
+    def setUp(self):
+        get_redis_connection().flushdb()
+        self.user = create_user()
+
+    def test_logins_are_buffered_instead_of_saved(self):
+        with self.assertNumQueries(0):
+            record_login(self.user)
+
+        self.user.refresh_from_db()
+
+        self.assertIsNone(self.user.last_login)
+        self.assertTrue(get_redis_connection().hexists(LAST_LOGIN_BUFFER_KEY, f'{self.user.pk}'))
+
+    @override_settings(BUFFER_LAST_LOGIN=False)
+    def test_logins_are_saved_when_buffering_is_off(self):
+        record_login(self.user)
+        self.user.refresh_from_db()
+
+        self.assertIsNotNone(self.user.last_login)
+
+    @skipUnless(connection.vendor == 'postgresql', 'UPDATE ... FROM (VALUES ...) needs PostgreSQL')
+    def test_buffered_logins_are_flushed_in_one_update(self):
+        other_user = create_user(email_address='other@example.com')
+        record_login(self.user)
+        record_login(other_user)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(2, flush_last_logins())
+
+        self.user.refresh_from_db()
+
+        self.assertIsNotNone(self.user.last_login)
+        self.assertFalse(get_redis_connection().exists(LAST_LOGIN_BUFFER_KEY))
+
+    @skipUnless(connection.vendor == 'postgresql', 'UPDATE ... FROM (VALUES ...) needs PostgreSQL')
+    def test_later_logins_are_not_overwritten(self):
+        record_login(self.user)
+        later_login = timezone.now() + timedelta(minutes=1)
+        self.user.last_login = later_login
+        self.user.save()
+
+        self.assertEqual(0, flush_last_logins())
+
+        self.user.refresh_from_db()
+        self.assertEqual(later_login, self.user.last_login)
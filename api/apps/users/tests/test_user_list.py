@@ -0,0 +1,66 @@
+import json
+from base64 import urlsafe_b64encode
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from api.apps.users.tests.test_api import PASSWORD, create_user
+
+
+class UserListPaginationTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        admin = get_user_model().objects.create_superuser(
+            email='admin@example.com', password=PASSWORD, full_name='Admin', short_name='Admin'
+        )
+        self.users = [create_user(email_address=f'user{index}@example.com') for index in range(5)]
+        self.client.force_authenticate(admin)
+
+    def list_users(self, url=None, **params):
+        response = self.client.get(url or reverse('auth:list-users'), data=params)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+        return response.data
+
+    def test_pages_follow_creation_order(self):
+        first_page = self.list_users(page_size=2)
+        second_page = self.list_users(first_page['next'])
+        last_page = self.list_users(second_page['next'])
+
+        emails = [user['email'] for page in (first_page, second_page, last_page) for user in page['results']]
+
+        self.assertEqual([user.email for user in self.users], emails)
+        self.assertIsNone(first_page['previous'])
+        self.assertIsNone(last_page['next'])
+
+    def test_previous_link_returns_the_previous_page(self):
+        first_page = self.list_users(page_size=2)
+        second_page = self.list_users(first_page['next'])
+        previous_page = self.list_users(second_page['previous'])
+
+        self.assertEqual(first_page['results'], previous_page['results'])
+        self.assertIsNone(previous_page['previous'])
+
+    def test_counts_are_only_exact_on_request(self):
+        self.assertFalse(self.list_users()['count_is_exact'])
+
+        page = self.list_users(exact_count='true')
+
+        self.assertTrue(page['count_is_exact'])
+        self.assertEqual(5, page['count'])
+
+    def test_users_can_be_searched_by_email_prefix(self):
+        page = self.list_users(email='USER3')
+
+        self.assertEqual(['user3@example.com'], [user['email'] for user in page['results']])
+
+    def test_invalid_cursors_are_rejected(self):
+        invalid_pk = urlsafe_b64encode(json.dumps(['2024-01-01T00:00:00+00:00', 'nope', False]).encode('ascii'))
+
+        for cursor in ('not-a-cursor', invalid_pk.decode('ascii')):
+            response = self.client.get(reverse('auth:list-users'), data={'cursor': cursor})
+
+            self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
@@ -1,15 +1,17 @@
 from django.contrib.auth import authenticate, get_user_model
-from django.contrib.auth.models import update_last_login
 from rest_framework.generics import ListAPIView, RetrieveUpdateAPIView, CreateAPIView
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.status import HTTP_400_BAD_REQUEST, HTTP_200_OK
 from rest_framework.views import APIView
+from djmoney.money import Money
 from rest_framework_simplejwt.tokens import RefreshToken
 
 from api.apps.payments.models import Wallet
+from api.apps.users.logins import record_login
 from api.apps.users.models import User
 from api.apps.users.serializers import CreateUserSerializer, UserSerializer, UserUpdateSerializer
+from api.utils.pagination import KeysetPagination
 from api.utils.permissions import IsActiveAdminUser, IsNotAuthenticated, IsActiveUser
 
 
@@ -23,12 +25,12 @@ class UserLoginView(APIView):
 
         if user and user.is_active:
             refresh = RefreshToken.for_user(user)
-            wallet = Wallet.objects.get(user=user)
+            wallet_balance = Wallet.objects.get_balance(user.id)
             response = {
                 'user': user.json(),
                 'wallet': {
-                    'balance': f'{wallet.amount}',
-                    'last_activity': f'{wallet.modified}'
+                    'balance': f'{Money(wallet_balance["balance"], wallet_balance["currency"])}',
+                    'last_activity': wallet_balance['last_activity']
                 },
                 'tokens': {
                     'refresh': f'{refresh}',
@@ -36,7 +38,7 @@ class UserLoginView(APIView):
                 },
             }
 
-            update_last_login(None, user)
+            record_login(user)
             return Response(data=response, content_type='application/json')
 
         error = 'Your user account has been deactivated.' if user else 'Invalid Credentials'
@@ -52,14 +54,20 @@ class UserCreateView(CreateAPIView):
 class UserListView(ListAPIView):
     permission_classes = (IsActiveAdminUser,)
     serializer_class = UserSerializer
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         filter_kwargs = {}
         only_active = self.request.query_params.get('onlyActive', 'False')
+        email = self.request.query_params.get('email')
 
         if only_active.title() == 'True':
             filter_kwargs['is_active'] = True
 
+        if email:
+            # case-insensitive prefix search, backed by the index on UPPER(email)
+            filter_kwargs['email__istartswith'] = email
+
         return User.objects.exclude(id=self.request.user.id).filter(**filter_kwargs)
 
 
@@ -0,0 +1,16 @@
+"""
+ASGI config for epayment-wallet project.
+It exposes the ASGI callable as a module-level variable named ``application``, serving the payment events stream
+natively and passing every other request on to Django.
+For more information on this file, see
+https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/uvicorn/
+"""
+import os
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "api.config")
+os.environ.setdefault("DJANGO_CONFIGURATION", "Production")
+
+from configurations.asgi import get_asgi_application  # noqa
+from api.apps.payments.views.events import PaymentEventsApplication  # noqa
+
+application = PaymentEventsApplication(get_asgi_application())
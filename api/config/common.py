@@ -1,9 +1,11 @@
 import os
 from datetime import timedelta
+from decimal import Decimal
 from os.path import join
 from distutils.util import strtobool
 import dj_database_url
 import structlog
+from celery.schedules import crontab
 from configurations import Configuration
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -105,6 +107,18 @@ class Common(Configuration):
         },
     ]
 
+    # Password hashing
+    # new passwords are hashed with PASSWORD_HASHER, and stored hashes made by a different hasher or with a different
+    # cost are rehashed with it on the user's next successful login
+    PASSWORD_HASHER = os.getenv('PASSWORD_HASHER', 'api.utils.hashers.PBKDF2PasswordHasher')
+    PASSWORD_HASH_PBKDF2_ITERATIONS = int(os.getenv('PASSWORD_HASH_PBKDF2_ITERATIONS', 390000))
+    PASSWORD_HASH_SCRYPT_WORK_FACTOR = int(os.getenv('PASSWORD_HASH_SCRYPT_WORK_FACTOR', 2 ** 14))
+    PASSWORD_HASHERS = [PASSWORD_HASHER] + list(filter(PASSWORD_HASHER.__ne__, [
+        'api.utils.hashers.PBKDF2PasswordHasher',
+        'api.utils.hashers.ScryptPasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    ]))
+
     # Password Validation
     # https://docs.djangoproject.com/en/2.0/topics/auth/passwords/#module-django.contrib.auth.password_validation
     AUTH_PASSWORD_VALIDATORS = [
@@ -203,40 +217,139 @@ class Common(Configuration):
         ],
         'DEFAULT_AUTHENTICATION_CLASSES': (
             'rest_framework.authentication.SessionAuthentication',
-            'rest_framework_simplejwt.authentication.JWTAuthentication',
+            'api.utils.authentication.CachedJWTAuthentication',
         ),
         'DEFAULT_THROTTLE_CLASSES': [
             'rest_framework.throttling.AnonRateThrottle',
+            'api.utils.throttling.SlidingWindowRateThrottle',
         ],
         'TEST_REQUEST_DEFAULT_FORMAT': 'json',
         'EXCEPTION_HANDLER': 'api.utils.exceptions.drf.core_exception_handler',
         'NON_FIELD_ERRORS_KEY': 'error',
     }
 
+    # Throttling
+    # sliding-window limits for each view's throttle_scope, with a burst allowance on top of the rate for clients that
+    # have been under it
+    THROTTLE_RATES = {
+        'deposits': {
+            'rate': os.getenv('THROTTLE_DEPOSITS_RATE', '10/m'),
+            'burst': int(os.getenv('THROTTLE_DEPOSITS_BURST', 5)),
+        },
+        'linkpay_authorize': {
+            'rate': os.getenv('THROTTLE_LINKPAY_AUTHORIZE_RATE', '10/m'),
+            'burst': int(os.getenv('THROTTLE_LINKPAY_AUTHORIZE_BURST', 5)),
+        },
+        'transactions': {
+            'rate': os.getenv('THROTTLE_TRANSACTIONS_RATE', '60/m'),
+            'burst': int(os.getenv('THROTTLE_TRANSACTIONS_BURST', 30)),
+        },
+        'withdrawals': {
+            'rate': os.getenv('THROTTLE_WITHDRAWALS_RATE', '10/m'),
+            'burst': int(os.getenv('THROTTLE_WITHDRAWALS_BURST', 5)),
+        },
+        'transfers': {
+            'rate': os.getenv('THROTTLE_TRANSFERS_RATE', '60/m'),
+            'burst': int(os.getenv('THROTTLE_TRANSFERS_BURST', 30)),
+        },
+    }
+
     # Simple JWT
     SIMPLE_JWT = {
         'ACCESS_TOKEN_LIFETIME': timedelta(hours=1),
         'REFRESH_TOKEN_LIFETIME': timedelta(seconds=31557600),
     }
 
+    # Authenticated user cache
+    # saves evict users from Redis straight away, entries in each process' LRU can outlive them by the local TTL
+    AUTH_USER_CACHE_TTL = int(os.getenv('AUTH_USER_CACHE_TTL', 300))
+    AUTH_USER_LOCAL_CACHE_TTL = int(os.getenv('AUTH_USER_LOCAL_CACHE_TTL', 5))
+    AUTH_USER_LOCAL_CACHE_SIZE = int(os.getenv('AUTH_USER_LOCAL_CACHE_SIZE', 1024))
+
+    # Last login buffering
+    # signin buffers last logins in Redis, which are flushed to the database every LAST_LOGIN_FLUSH_INTERVAL_SECONDS,
+    # so that's how stale last_login can get
+    BUFFER_LAST_LOGIN = strtobool(os.getenv('BUFFER_LAST_LOGIN', 'True'))
+    LAST_LOGIN_FLUSH_BATCH_SIZE = int(os.getenv('LAST_LOGIN_FLUSH_BATCH_SIZE', 1000))
+
+    # Keyset pagination
+    # list counts are estimated by the query planner, except below the threshold where they're counted and cached
+    PAGINATION_ESTIMATED_COUNT_THRESHOLD = int(os.getenv('PAGINATION_ESTIMATED_COUNT_THRESHOLD', 10000))
+    PAGINATION_COUNT_CACHE_TTL = int(os.getenv('PAGINATION_COUNT_CACHE_TTL', 60))
+
     # Redis Settings
+    REDIS_URL = os.environ['REDIS_URL']
     CACHES = {
         'default': {
             'BACKEND': 'django.core.cache.backends.redis.RedisCache',
-            'LOCATION': os.environ['REDIS_URL'],
+            'LOCATION': REDIS_URL,
         }
     }
 
+    # Idempotency-Key handling
+    # responses are replayed for retries within the TTL, and concurrent duplicates wait up to the lock timeout
+    IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', 86400))
+    IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv('IDEMPOTENCY_LOCK_TIMEOUT', 60))
+
+    # Wallet balance cache
+    # written through after every ledger posting, the TTL only bounds how long a failed write leaves a stale balance
+    WALLET_BALANCE_CACHE_TTL = int(os.getenv('WALLET_BALANCE_CACHE_TTL', 3600))
+
     # Django Searchable Encrypted Fields
     # https://pypi.org/project/django-searchable-encrypted-fields/
+    # values are encrypted with the first key and decrypted with whichever key works, so previous keys are kept until
+    # the rotate_encryption_keys command has re-encrypted everything with the current one
     FIELD_ENCRYPTION_KEYS = [
-        os.environ['FIELD_ENCRYPTION_KEY']
+        os.environ['FIELD_ENCRYPTION_KEY'],
+        *filter(None, os.getenv('FIELD_ENCRYPTION_PREVIOUS_KEYS', '').split(',')),
     ]
 
     # Celery config
-    CELERY_BROKER_URL = os.environ['REDIS_URL']
-    CELERY_RESULT_BACKEND = os.environ['REDIS_URL']
+    CELERY_BROKER_URL = REDIS_URL
+    CELERY_RESULT_BACKEND = REDIS_URL
     CELERY_IMPORTS = ('api.apps.payments.tasks',)
+    CELERY_BEAT_SCHEDULE = {
+        'reconcile-pending-payment-requests': {
+            'task': 'api.apps.payments.tasks.reconcile_pending_payment_requests',
+            'schedule': timedelta(minutes=int(os.getenv('STITCH_RECONCILIATION_INTERVAL_MINUTES', 5))),
+        },
+        'flush-buffered-last-logins': {
+            'task': 'api.apps.users.tasks.flush_buffered_last_logins',
+            'schedule': timedelta(seconds=int(os.getenv('LAST_LOGIN_FLUSH_INTERVAL_SECONDS', 60))),
+        },
+        'reconcile-deposit-counters': {
+            'task': 'api.apps.payments.tasks.reconcile_deposit_limit_counters',
+            'schedule': crontab(minute=30, hour=int(os.getenv('DEPOSIT_COUNTER_RECONCILIATION_HOUR', 2))),
+        },
+        'schedule-bank-transaction-syncs': {
+            'task': 'api.apps.payments.tasks.schedule_bank_transaction_syncs',
+            'schedule': timedelta(minutes=int(os.getenv('BANK_TRANSACTION_SCHEDULE_INTERVAL_MINUTES', 15))),
+        },
+        'start-kyc-reverification': {
+            'task': 'api.apps.payments.tasks.start_kyc_reverification',
+            'schedule': crontab(minute=0, hour=int(os.getenv('KYC_REVERIFICATION_HOUR', 3)), day_of_month=1),
+        },
+        'resume-kyc-reverification': {
+            'task': 'api.apps.payments.tasks.resume_kyc_reverification',
+            'schedule': timedelta(seconds=int(os.getenv('KYC_REVERIFICATION_RESUME_INTERVAL_SECONDS', 3600))),
+        },
+        'revoke-unlinked-account-tokens': {
+            'task': 'api.apps.payments.tasks.revoke_unlinked_account_tokens',
+            'schedule': timedelta(seconds=int(os.getenv('TOKEN_REVOCATION_RELAY_INTERVAL_SECONDS', 60))),
+        },
+        'submit-pending-withdrawals': {
+            'task': 'api.apps.payments.tasks.submit_pending_withdrawals',
+            'schedule': timedelta(seconds=int(os.getenv('PAYOUT_BATCH_INTERVAL_SECONDS', 60))),
+        },
+        'resubmit-stalled-withdrawals': {
+            'task': 'api.apps.payments.tasks.resubmit_stalled_withdrawals',
+            'schedule': timedelta(seconds=int(os.getenv('PAYOUT_SUBMISSION_TIMEOUT_SECONDS', 900))),
+        },
+        'settle-disbursement-outcomes': {
+            'task': 'api.apps.payments.tasks.settle_disbursement_outcomes',
+            'schedule': timedelta(seconds=int(os.getenv('PAYOUT_SETTLEMENT_INTERVAL_SECONDS', 30))),
+        },
+    }
 
     # Sentry Config
     SENTRY_DSN = os.getenv('SENTRY_DSN', None)
@@ -259,7 +372,100 @@ class Common(Configuration):
         'accountType': os.environ['STITCH_BENEFICIARY_ACCOUNT_TYPE'],
         'beneficiaryType': os.environ['STITCH_BENEFICIARY_TYPE'],
     }
+    # the PKCE state of an authorization URL is kept for LINKPAY_AUTHORIZATION_STATE_TTL seconds, and the URL is handed
+    # out again for repeated authorizations for PAYMENT_AUTHORIZATION_REUSE_TTL seconds, which should be shorter so
+    # that a reused URL can still be completed
+    LINKPAY_AUTHORIZATION_STATE_TTL = int(os.getenv('LINKPAY_AUTHORIZATION_STATE_TTL', 1800))
+    PAYMENT_AUTHORIZATION_REUSE_TTL = int(os.getenv('PAYMENT_AUTHORIZATION_REUSE_TTL', 1500))
+
+    # Reconciliation Config
+    # payment requests still pending after the grace period are looked up on Stitch in batches of aliased node queries
+    STITCH_RECONCILIATION_BATCH_SIZE = int(os.getenv('STITCH_RECONCILIATION_BATCH_SIZE', 25))
+    STITCH_RECONCILIATION_GRACE_PERIOD = timedelta(minutes=int(os.getenv('STITCH_RECONCILIATION_GRACE_MINUTES', 5)))
+    STITCH_RECONCILIATION_WINDOW = timedelta(hours=int(os.getenv('STITCH_RECONCILIATION_WINDOW_HOURS', 24)))
+
+    # Payment Events Config
+    # served by api.asgi, where idle connections cost a queue each rather than a worker
+    PAYMENT_EVENTS_HEARTBEAT_INTERVAL = int(os.getenv('PAYMENT_EVENTS_HEARTBEAT_INTERVAL', 15))
+    PAYMENT_EVENTS_LONG_POLL_TIMEOUT = int(os.getenv('PAYMENT_EVENTS_LONG_POLL_TIMEOUT', 30))
+    PAYMENT_EVENTS_SUBSCRIBE_TIMEOUT = int(os.getenv('PAYMENT_EVENTS_SUBSCRIBE_TIMEOUT', 5))
+
+    # Bulk Deposit Config
+    # each deposit needs its own Stitch round-trips, which are run concurrently up to the concurrency limit
+    BULK_DEPOSIT_MAX_ITEMS = int(os.getenv('BULK_DEPOSIT_MAX_ITEMS', 10))
+    BULK_DEPOSIT_CONCURRENCY = int(os.getenv('BULK_DEPOSIT_CONCURRENCY', 5))
+
+    # Bulk Transfer Config
+    # every transfer in a bulk transfer is applied in one transaction, with each wallet involved locked once
+    BULK_TRANSFER_MAX_ITEMS = int(os.getenv('BULK_TRANSFER_MAX_ITEMS', 500))
+
+    # Response Cache Config
+    # cached responses are keyed by the user's data version, so this only bounds how long superseded ones are kept
+    RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 3600))
+
+    # Linked Account Cache Config
+    # cached linked accounts are encrypted and invalidated on link and unlink, the TTL bounds how long a missed
+    # invalidation can go unnoticed
+    LINKED_ACCOUNT_CACHE_TTL = int(os.getenv('LINKED_ACCOUNT_CACHE_TTL', 300))
+
+    # Bank Balance Config
+    # balances of linked accounts are cached per account, and fetched from Stitch under a per-user lock so that
+    # concurrent requests share a single fetch
+    BANK_BALANCE_CACHE_TTL = int(os.getenv('BANK_BALANCE_CACHE_TTL', 300))
+    BANK_BALANCE_CONCURRENCY = int(os.getenv('BANK_BALANCE_CONCURRENCY', 5))
+    BANK_BALANCE_LOCK_TIMEOUT = int(os.getenv('BANK_BALANCE_LOCK_TIMEOUT', 30))
+
+    # Bank Transaction Sync Config
+    # linked accounts are synced once every BANK_TRANSACTION_SYNC_INTERVAL_MINUTES, each sync fetching only the pages
+    # after the cursor the last one stopped at. Due syncs are queued in waves of BANK_TRANSACTION_SYNC_CONCURRENCY
+    # accounts, BANK_TRANSACTION_SYNC_WAVE_SECONDS apart, and each worker runs them at BANK_TRANSACTION_SYNC_RATE_LIMIT
+    BANK_TRANSACTION_SYNC_INTERVAL = timedelta(minutes=int(os.getenv('BANK_TRANSACTION_SYNC_INTERVAL_MINUTES', 360)))
+    BANK_TRANSACTION_SYNC_PAGE_SIZE = int(os.getenv('BANK_TRANSACTION_SYNC_PAGE_SIZE', 100))
+    BANK_TRANSACTION_SYNC_MAX_PAGES = int(os.getenv('BANK_TRANSACTION_SYNC_MAX_PAGES', 20))
+    BANK_TRANSACTION_SYNC_CONCURRENCY = int(os.getenv('BANK_TRANSACTION_SYNC_CONCURRENCY', 10))
+    BANK_TRANSACTION_SYNC_WAVE_SECONDS = int(os.getenv('BANK_TRANSACTION_SYNC_WAVE_SECONDS', 30))
+    BANK_TRANSACTION_SYNC_RATE_LIMIT = os.getenv('BANK_TRANSACTION_SYNC_RATE_LIMIT', '30/m')
+    BANK_TRANSACTION_SYNC_LOCK_TIMEOUT = int(os.getenv('BANK_TRANSACTION_SYNC_LOCK_TIMEOUT', 600))
+
+    # KYC Re-verification Config
+    # linked accounts are re-verified against their users' KYC details monthly, in shards of
+    # KYC_REVERIFICATION_SHARD_SIZE accounts spread across the workers
+    KYC_REVERIFICATION_SHARD_SIZE = int(os.getenv('KYC_REVERIFICATION_SHARD_SIZE', 200))
+    KYC_REVERIFICATION_CONCURRENCY = int(os.getenv('KYC_REVERIFICATION_CONCURRENCY', 10))
+    # accounts that can't be looked up are retried up to KYC_REVERIFICATION_MAX_ATTEMPTS times, when a run that hasn't
+    # verified an account in KYC_REVERIFICATION_STALLED_AFTER_SECONDS is resumed
+    KYC_REVERIFICATION_MAX_ATTEMPTS = int(os.getenv('KYC_REVERIFICATION_MAX_ATTEMPTS', 3))
+    KYC_REVERIFICATION_STALLED_AFTER_SECONDS = int(os.getenv('KYC_REVERIFICATION_STALLED_AFTER_SECONDS', 3600))
+
+    # Deposit Limit Config
+    # totals of the deposits that haven't failed in the current day and month, and the number of deposits attempted in
+    # the current hour, are kept in Redis and reconciled against the payment requests every night
+    DEPOSIT_DAILY_LIMIT = Decimal(os.getenv('DEPOSIT_DAILY_LIMIT', '50000'))
+    DEPOSIT_MONTHLY_LIMIT = Decimal(os.getenv('DEPOSIT_MONTHLY_LIMIT', '200000'))
+    DEPOSIT_HOURLY_VELOCITY_LIMIT = int(os.getenv('DEPOSIT_HOURLY_VELOCITY_LIMIT', 10))
+
+    # Token Revocation Config
+    # tokens of unlinked accounts are queued in an outbox and revoked on Stitch in batches, failed revocations are
+    # retried with exponential backoff starting at TOKEN_REVOCATION_RETRY_DELAY seconds
+    TOKEN_REVOCATION_BATCH_SIZE = int(os.getenv('TOKEN_REVOCATION_BATCH_SIZE', 100))
+    TOKEN_REVOCATION_CONCURRENCY = int(os.getenv('TOKEN_REVOCATION_CONCURRENCY', 8))
+    TOKEN_REVOCATION_HTTP_RETRIES = int(os.getenv('TOKEN_REVOCATION_HTTP_RETRIES', 2))
+    TOKEN_REVOCATION_LEASE_SECONDS = int(os.getenv('TOKEN_REVOCATION_LEASE_SECONDS', 300))
+    TOKEN_REVOCATION_RETRY_DELAY = int(os.getenv('TOKEN_REVOCATION_RETRY_DELAY', 60))
+    TOKEN_REVOCATION_MAX_ATTEMPTS = int(os.getenv('TOKEN_REVOCATION_MAX_ATTEMPTS', 10))
+
+    # Payout Config
+    # withdrawals hold their amount on the wallet and are disbursed in batches of up to PAYOUT_BATCH_SIZE, submitted
+    # every PAYOUT_BATCH_INTERVAL_SECONDS or as soon as that many are pending. PAYOUT_DISBURSEMENT_BACKEND is either
+    # stitch, or local to complete disbursements straight away without calling out. Disbursement webhooks are buffered
+    # in Redis and settled PAYOUT_SETTLEMENT_BATCH_SIZE at a time every PAYOUT_SETTLEMENT_INTERVAL_SECONDS. Withdrawals
+    # still submitted without a stitch_ref after PAYOUT_SUBMISSION_TIMEOUT_SECONDS are put back for the next batch
+    PAYOUT_BATCH_SIZE = int(os.getenv('PAYOUT_BATCH_SIZE', 100))
+    PAYOUT_DISBURSEMENT_BACKEND = os.getenv('PAYOUT_DISBURSEMENT_BACKEND', 'stitch')
+    PAYOUT_SETTLEMENT_BATCH_SIZE = int(os.getenv('PAYOUT_SETTLEMENT_BATCH_SIZE', 500))
+    PAYOUT_SUBMISSION_TIMEOUT_SECONDS = int(os.getenv('PAYOUT_SUBMISSION_TIMEOUT_SECONDS', 900))
 
     # Webhook Config
     LINKPAY_WEBHOOK_SECRET_KEY = os.getenv('LINKPAY_WEBHOOK_SECRET_KEY')
+    PAYOUT_WEBHOOK_SECRET_KEY = os.getenv('PAYOUT_WEBHOOK_SECRET_KEY')
     REFUND_WEBHOOK_SECRET_KEY = os.getenv('REFUND_WEBHOOK_SECRET_KEY')
@@ -12,6 +12,33 @@ class PaymentRequestStatus(enum.Enum):
     FAILED = 'failed'
 
 
+class AccountLinkStatus(enum.Enum):
+    PENDING = 'pending'
+    LINKED = 'linked'
+    ALREADY_LINKED = 'already linked'
+    KYC_MISMATCH = 'kyc mismatch'
+    FAILED = 'failed'
+
+
+class KycVerificationStatus(enum.Enum):
+    MATCHED = 'matched'
+    MISMATCH = 'mismatch'
+    FAILED = 'failed'
+
+
+class BalanceHoldStatus(enum.Enum):
+    ACTIVE = 'active'
+    CAPTURED = 'captured'
+    RELEASED = 'released'
+
+
+class WithdrawalStatus(enum.Enum):
+    PENDING = 'pending'
+    SUBMITTED = 'submitted'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+
+
 class IdentificationType(enum.Enum):
     PASSPORT = 'Passport Number'
     ID = 'Identification Number'
@@ -25,9 +52,19 @@ class PaymentRequestEventType(enum.Enum):
     USER_INTERACTION = 'User Interaction Required'
     CONFIRMED = 'Payment Confirmed'
     WEBHOOK_PROCESSING = 'Webhook Processing'
+    RECONCILED = 'Payment Reconciled'
 
 
 class StitchLinkPayStatus(enum.Enum):
     COMPLETED = 'PaymentInitiationCompleted'
     FAILED = 'PaymentInitiationFailed'
     EXPIRED = 'PaymentInitiationExpired'
+    PENDING = 'PaymentInitiationPending'
+
+
+class StitchDisbursementStatus(enum.Enum):
+    PENDING = 'DisbursementPending'
+    SUBMITTED = 'DisbursementSubmitted'
+    COMPLETED = 'DisbursementCompleted'
+    ERROR = 'DisbursementError'
+    CANCELLED = 'DisbursementCancelled'
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """
+    PBKDF2 with its iteration count taken from ``PASSWORD_HASH_PBKDF2_ITERATIONS``.
+
+    Stored hashes with any other iteration count are rehashed on the user's next successful login, whether the cost
+    was raised or lowered.
+    """
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_PBKDF2_ITERATIONS
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    """
+    Scrypt with its work factor taken from ``PASSWORD_HASH_SCRYPT_WORK_FACTOR``.
+
+    Stored hashes with any other work factor are rehashed on the user's next successful login.
+    """
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_HASH_SCRYPT_WORK_FACTOR
+
+    @property
+    def maxmem(self):
+        # scrypt needs 128 * n * r bytes, which is over OpenSSL's default limit for work factors above 2 ** 14
+        return 256 * self.work_factor * self.block_size
@@ -0,0 +1,111 @@
+import hashlib
+import json
+from functools import wraps
+
+from django.conf import settings
+from redis.exceptions import LockError
+from rest_framework.response import Response
+from rest_framework.status import HTTP_400_BAD_REQUEST, HTTP_409_CONFLICT, HTTP_422_UNPROCESSABLE_ENTITY
+from rest_framework.utils.encoders import JSONEncoder
+
+from api.utils.redis import get_redis_connection
+
+IDEMPOTENCY_KEY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+
+def fingerprint_request(request) -> str:
+    return hashlib.sha256(json.dumps(request.data, sort_keys=True, cls=JSONEncoder).encode('utf-8')).hexdigest()
+
+
+def idempotent(handler):
+    """
+    Makes an authenticated view handler honour the ``Idempotency-Key`` header.
+
+    The first request for a user+key takes a Redis lock and stores its final response for ``IDEMPOTENCY_KEY_TTL``
+    seconds, so retries get the stored response without repeating the work. Concurrent duplicates wait on the lock
+    instead of running the handler again. Requests without the header are handled as usual.
+    """
+    @wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        idempotency_key = request.headers.get(IDEMPOTENCY_KEY_HEADER)
+
+        if not idempotency_key:
+            return handler(view, request, *args, **kwargs)
+
+        if len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return Response(
+                data={'error': f'{IDEMPOTENCY_KEY_HEADER} should be at most {IDEMPOTENCY_KEY_MAX_LENGTH} characters'},
+                status=HTTP_400_BAD_REQUEST,
+                content_type='application/json'
+            )
+
+        connection = get_redis_connection()
+        cache_key = f'idempotency:{view.__class__.__name__}:{request.user.id}:{idempotency_key}'
+        fingerprint = fingerprint_request(request)
+
+        def replay(stored_response: bytes) -> Response:
+            stored_response = json.loads(stored_response)
+
+            if stored_response['fingerprint'] != fingerprint:
+                return Response(
+                    data={'error': f'{IDEMPOTENCY_KEY_HEADER} has already been used with a different request'},
+                    status=HTTP_422_UNPROCESSABLE_ENTITY,
+                    content_type='application/json'
+                )
+
+            response = Response(
+                data=stored_response['data'],
+                status=stored_response['status'],
+                content_type='application/json'
+            )
+            response['Idempotent-Replayed'] = 'true'
+
+            return response
+
+        stored_response = connection.get(cache_key)
+        if stored_response is not None:
+            return replay(stored_response)
+
+        lock = connection.lock(
+            f'{cache_key}:lock',
+            timeout=settings.IDEMPOTENCY_LOCK_TIMEOUT,
+            blocking_timeout=settings.IDEMPOTENCY_LOCK_TIMEOUT
+        )
+
+        if not lock.acquire():
+            return Response(
+                data={'error': f'A request with this {IDEMPOTENCY_KEY_HEADER} is still being processed'},
+                status=HTTP_409_CONFLICT,
+                content_type='application/json'
+            )
+
+        try:
+            # a concurrent duplicate might have finished while we were waiting on the lock
+            stored_response = connection.get(cache_key)
+            if stored_response is not None:
+                return replay(stored_response)
+
+            response = handler(view, request, *args, **kwargs)
+
+            # server errors are not final, so the client is free to retry those with the same key
+            if response.status_code < 500:
+                connection.set(
+                    cache_key,
+                    json.dumps({
+                        'fingerprint': fingerprint,
+                        'status': response.status_code,
+                        'data': response.data
+                    }, cls=JSONEncoder),
+                    ex=settings.IDEMPOTENCY_KEY_TTL
+                )
+
+            return response
+        finally:
+            try:
+                lock.release()
+            except LockError:
+                # the lock expired while the handler was running, so there is nothing left to release
+                pass
+
+    return wrapper
@@ -1,4 +1,4 @@
-from typing import Literal, Dict
+from typing import Literal, Dict, Optional
 from urllib.parse import urlencode, quote
 import uuid
 
@@ -19,6 +19,14 @@ class Authentication(BaseAPI):
         logger = log.bind(event='fetch_user_token', request_id=str(uuid.uuid4()))
 
         previous_state = cache.get(state)
+
+        if previous_state is None:
+            logger.error('could not obtain user token: unknown or expired state')
+
+            return {
+                'error': 'The authorization has expired, please try again'
+            }
+
         code_verifier = previous_state['code_verifier']
 
         raw_data = {
@@ -39,6 +47,8 @@ class Authentication(BaseAPI):
                 'POST', self.token_endpoint, headers=self.default_headers, data=payload
             )
             response.raise_for_status()
+            # the state can only be exchanged once, which also stops its authorization URL from being reused
+            cache.delete(state)
 
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -61,14 +71,16 @@ class Authentication(BaseAPI):
             'code_verifier': code_verifier
         }
 
-        cache.set(state, session_data, 1800)
+        cache.set(f'{state}', session_data, settings.LINKPAY_AUTHORIZATION_STATE_TTL)
 
         return {
             'url': f'{base_url}?client_id={client_id}&scope={scopes}&response_type=code&redirect_uri={redirect_uri}'
-                   f'&nonce={nonce}&state={state}&code_challenge={code_challenge}&code_challenge_method=S256'
+                   f'&nonce={nonce}&state={state}&code_challenge={code_challenge}&code_challenge_method=S256',
+            'state': f'{state}',
         }
 
-    def revoke_token(self, token: str, token_type: Literal['refresh_token', 'access_token']) -> bool:
+    def revoke_token(self, token: str, token_type: Literal['refresh_token', 'access_token'],
+                     session: Optional[requests.Session] = None) -> bool:
         logger = log.bind(event='revoke_token', request_id=str(uuid.uuid4()))
 
         request_body = {
@@ -81,7 +93,8 @@ class Authentication(BaseAPI):
         payload = urlencode(request_body)
 
         try:
-            response = requests.request(
+            # a session reuses its pooled connections across revocations
+            response = (session or requests).request(
                 'POST', self.token_revoke_endpoint, headers=self.default_headers, data=payload
             )
             response.raise_for_status()
@@ -8,7 +8,7 @@ from django.core.cache import cache
 from gql import gql
 from graphql import DocumentNode
 
-from api.utils.libs.stitch.errors import StitchConfigurationIncomplete
+from api.utils.libs.stitch.errors import StitchConfigurationIncomplete, StitchClientAuthenticationError
 
 GRAPHQL_ENDPOINT = os.environ.get('STITCH_API_ENDPOINT', 'https://api.stitch.money/graphql')
 CLIENT_TOKEN_ENDPOINT = os.environ.get('STITCH_CLIENT_TOKEN_ENDPOINT', 'https://secure.stitch.money/connect/token')
@@ -64,7 +64,8 @@ class BaseAPI(object):
             return gql(f.read())
 
     def get_client_token(self, scope: str) -> str:
-        cache_key = f'{self.client_id}_access_token'
+        # tokens are only good for the scope they were requested with
+        cache_key = f'{self.client_id}_{scope}_access_token'
         access_token = cache.get(cache_key)
 
         if access_token:
@@ -109,6 +110,6 @@ class BaseAPI(object):
             logger.debug('User token refreshed')
         except requests.exceptions.RequestException as err:
             logger.error(f'Error refreshing user credentials {err}')
-            raise SystemExit(err)
+            raise StitchClientAuthenticationError(err)
 
         return response.json()
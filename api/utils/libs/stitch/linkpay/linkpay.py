@@ -1,10 +1,10 @@
 import asyncio
 import uuid
 from pathlib import Path
-from typing import Dict, Union, Any
+from typing import Dict, Union, Any, List, Optional
 
 import structlog
-from gql import Client
+from gql import Client, gql
 from gql.transport.exceptions import TransportQueryError
 from gql.transport.requests import RequestsHTTPTransport
 from graphql import ExecutionResult
@@ -16,11 +16,11 @@ log = structlog.get_logger('graphql_requests')
 
 
 class LinkPay(BaseAPI):
-    def __init__(self, token=None):
+    def __init__(self, token=None, scope='client_paymentauthorizationrequest'):
         super().__init__()
 
         if token is None:
-            token = self.get_client_token('client_paymentauthorizationrequest')
+            token = self.get_client_token(scope)
 
         transport = RequestsHTTPTransport(
             url=GRAPHQL_ENDPOINT,
@@ -64,6 +64,150 @@ class LinkPay(BaseAPI):
 
             raise err
 
+    def get_linked_account_balance(self) -> Dict[str, Any]:
+        """
+        Fetches the current and available balance of the linked account, which needs the ``balances`` scope granted
+        during linking.
+        """
+        logger = log.bind(event='get_account_balance', request_id=str(uuid.uuid4()))
+        query_path = Path(__file__).parent.joinpath('graphql/get_account_balance.graphql')
+        graphql_query = self.load_qraphql_query(query_path)
+
+        try:
+            response = self.client.execute(graphql_query)
+            logger.debug(message='Linked account balance successfully retrieved')
+        except TransportQueryError as err:
+            logger.info(message=err.errors[0]['message'])
+            raise LinkPayError(err.errors[0]['message'])
+        except asyncio.exceptions.TimeoutError as err:
+            logger.error(message=err)
+
+            raise err
+
+        return response['user']['paymentAuthorization']['bankAccount']
+
+    def get_linked_account_transactions(self, first: int, after: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Fetches a page of up to ``first`` of the linked account's transactions after the ``after`` cursor, which needs
+        the ``transactions`` scope granted during linking.
+
+        Returns the transactions connection, with the ``pageInfo`` to fetch the next page with.
+        """
+        logger = log.bind(event='get_account_transactions', request_id=str(uuid.uuid4()))
+        query_path = Path(__file__).parent.joinpath('graphql/get_account_transactions.graphql')
+        graphql_query = self.load_qraphql_query(query_path)
+
+        try:
+            response = self.client.execute(graphql_query, variable_values={'first': first, 'after': after})
+            logger.debug(message='Linked account transactions successfully retrieved')
+        except TransportQueryError as err:
+            logger.info(message=err.errors[0]['message'])
+            raise LinkPayError(err.errors[0]['message'])
+        except asyncio.exceptions.TimeoutError as err:
+            logger.error(message=err)
+
+            raise err
+
+        return response['user']['paymentAuthorization']['bankAccount']['transactions']
+
+    def get_payment_initiation_statuses(self, payment_initiation_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Fetches the status of several payment initiations in a single request by aliasing one ``node(id:)`` lookup
+        per payment initiation into the same GraphQL document.
+
+        Returns the payment initiations keyed by their Stitch ID, skipping any IDs Stitch could not resolve so that
+        one bad ID doesn't hold up the rest of the batch.
+        """
+        logger = log.bind(event='get_payment_initiation_statuses', request_id=str(uuid.uuid4()))
+        fragment_path = Path(__file__).parent.joinpath('graphql/payment_initiation_status.graphql')
+
+        with open(fragment_path) as f:
+            fragment = f.read()
+
+        variables = {f'id{i}': payment_initiation_id for i, payment_initiation_id in enumerate(payment_initiation_ids)}
+        variable_definitions = ', '.join(f'${name}: ID!' for name in variables)
+        lookups = ' '.join(f'payment_{name}: node(id: ${name}) {{ ...PaymentInitiationStatus }}' for name in variables)
+        graphql_query = gql(f'query GetPaymentInitiationStatuses({variable_definitions}) {{ {lookups} }} {fragment}')
+
+        try:
+            response = self.client.execute(graphql_query, variable_values=variables)
+            logger.debug(message=f'Fetched statuses for {len(payment_initiation_ids)} payment initiations')
+        except TransportQueryError as err:
+            # the IDs that could be resolved still come back alongside the errors for the ones that couldn't
+            if not err.data:
+                logger.error(message=err.errors[0]['message'])
+                raise LinkPayError(err.errors[0]['message'])
+
+            response = err.data
+            unresolved = [variables[error['path'][0][len('payment_'):]] for error in err.errors if error.get('path')]
+            logger.info(
+                message=f'Could not resolve {len(unresolved)} of {len(payment_initiation_ids)} payment initiations',
+                unresolved=unresolved
+            )
+        except asyncio.exceptions.TimeoutError as err:
+            logger.error(message=err)
+
+            raise err
+
+        return {
+            payment_initiation['id']: payment_initiation
+            for payment_initiation in response.values() if payment_initiation
+        }
+
+    def create_disbursements(self, disbursements: List[Dict]) -> List[Union[Dict[str, Any], LinkPayError]]:
+        """
+        Creates several disbursements in a single request by aliasing one ``clientDisbursementCreate`` mutation per
+        disbursement into the same GraphQL document, which needs a client token with the ``client_disbursement`` scope.
+
+        Each disbursement's ``nonce`` makes creating it again a no-op, so a batch that failed part of the way through
+        is safe to resubmit. Returns the created disbursements in the order they were given, with a
+        :mod:`LinkPayError` in place of any that Stitch rejected.
+        """
+        logger = log.bind(event='create_disbursements', request_id=str(uuid.uuid4()))
+        fragment_path = Path(__file__).parent.joinpath('graphql/create_disbursement.graphql')
+
+        with open(fragment_path) as f:
+            fragment = f.read()
+
+        variables = {f'input{i}': disbursement for i, disbursement in enumerate(disbursements)}
+        variable_definitions = ', '.join(f'${name}: ClientDisbursementCreateInput!' for name in variables)
+        mutations = ' '.join(
+            f'disbursement_{name}: clientDisbursementCreate(input: ${name}) {{ ...CreatedDisbursement }}'
+            for name in variables
+        )
+        graphql_query = gql(f'mutation CreateDisbursements({variable_definitions}) {{ {mutations} }} {fragment}')
+        errors = {}
+
+        try:
+            response = self.client.execute(graphql_query, variable_values=variables)
+            logger.debug(message=f'Created {len(disbursements)} disbursements')
+        except TransportQueryError as err:
+            # the disbursements that weren't rejected are still created, and come back alongside the errors
+            if not err.data:
+                logger.error(message=err.errors[0]['message'])
+                raise LinkPayError(err.errors[0]['message'])
+
+            response = err.data
+            errors = {error['path'][0]: error['message'] for error in err.errors if error.get('path')}
+            logger.info(message=f'Stitch rejected {len(errors)} of {len(disbursements)} disbursements')
+        except asyncio.exceptions.TimeoutError as err:
+            logger.error(message=err)
+
+            raise err
+
+        created = []
+
+        for name in variables:
+            alias = f'disbursement_{name}'
+            payload = response.get(alias)
+
+            if payload is None:
+                created.append(LinkPayError(errors.get(alias, 'The disbursement was not created')))
+            else:
+                created.append(payload['disbursement'])
+
+        return created
+
     def initiate_user_payment(self, payment_request: Dict) -> Union[Dict[str, Any], ExecutionResult]:
         logger = log.bind(event='initiate_payment', request_id=str(uuid.uuid4()))
         query_path = Path(__file__).parent.joinpath('graphql/initiate_payment.graphql')
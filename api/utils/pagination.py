@@ -0,0 +1,151 @@
+import hashlib
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.dateparse import parse_datetime
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+PAGINATION_COUNT_KEY_PREFIX = 'pagination_count'
+
+
+def estimate_count(queryset: QuerySet) -> int:
+    """
+    Returns the number of rows in the queryset without counting them where possible.
+
+    On PostgreSQL this is the planner's row estimate, which comes from ``reltuples`` and the table statistics. Small
+    estimates are the least reliable ones and cheap to count exactly, so below ``PAGINATION_ESTIMATED_COUNT_THRESHOLD``
+    (and on other databases) the exact count is used instead, cached for ``PAGINATION_COUNT_CACHE_TTL`` seconds.
+    """
+    queryset = queryset.order_by()
+    connection = connections[queryset.db]
+
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.query.sql_with_params()
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            estimate = cursor.fetchone()[0][0]['Plan']['Plan Rows']
+
+        if estimate >= settings.PAGINATION_ESTIMATED_COUNT_THRESHOLD:
+            return estimate
+
+    cache_key = f'{PAGINATION_COUNT_KEY_PREFIX}:{hashlib.sha256(str(queryset.query).encode("utf-8")).hexdigest()}'
+    count = cache.get(cache_key)
+
+    if count is None:
+        count = queryset.count()
+        cache.set(cache_key, count, timeout=settings.PAGINATION_COUNT_CACHE_TTL)
+
+    return count
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination ordered by ``(created, id)``, which pages by filtering on the last row seen rather than with an
+    ``OFFSET``, so deep pages are as fast as the first one when backed by an index on those columns.
+
+    The ``count`` is estimated by :func:`estimate_count` unless the client asks for ``exact_count=true``.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    exact_count_query_param = 'exact_count'
+    invalid_cursor_message = _('Invalid cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request, queryset)
+
+        self.count_is_exact = request.query_params.get(self.exact_count_query_param, 'False').title() == 'True'
+        self.count = queryset.count() if self.count_is_exact else estimate_count(queryset)
+
+        if position is not None:
+            created, pk = position
+
+            if reverse:
+                queryset = queryset.filter(Q(created__lt=created) | Q(created=created, pk__lt=pk))
+            else:
+                queryset = queryset.filter(Q(created__gt=created) | Q(created=created, pk__gt=pk))
+
+        queryset = queryset.order_by('-created', '-pk') if reverse else queryset.order_by('created', 'pk')
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+
+        if reverse:
+            results.reverse()
+
+        # pages reached going backwards always have a next page, the one the client came from
+        has_next, has_previous = (True, has_more) if reverse else (has_more, position is not None)
+
+        self.next_position = self.get_position(results[-1]) if results and has_next else None
+        self.previous_position = self.get_position(results[0]) if results and has_previous else None
+
+        return results
+
+    def get_page_size(self, request) -> int:
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param], strict=True, cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    @staticmethod
+    def get_position(instance) -> Tuple[str, str]:
+        return instance.created.isoformat(), f'{instance.pk}'
+
+    def decode_cursor(self, request, queryset: QuerySet) -> Tuple[Optional[tuple], bool]:
+        encoded = request.query_params.get(self.cursor_query_param)
+
+        if encoded is None:
+            return None, False
+
+        try:
+            created, pk, reverse = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            created = parse_datetime(created)
+            pk = queryset.model._meta.pk.to_python(pk)
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if created is None:
+            raise NotFound(self.invalid_cursor_message)
+
+        return (created, pk), bool(reverse)
+
+    def encode_cursor(self, position: Optional[Tuple[str, str]], reverse: bool) -> Optional[str]:
+        if position is None:
+            return None
+
+        encoded = urlsafe_b64encode(json.dumps([*position, reverse]).encode('ascii')).decode('ascii')
+
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self) -> Optional[str]:
+        return self.encode_cursor(self.next_position, False)
+
+    def get_previous_link(self) -> Optional[str]:
+        return self.encode_cursor(self.previous_position, True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('count_is_exact', self.count_is_exact),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
@@ -0,0 +1,17 @@
+import redis
+from django.conf import settings
+
+_connection = None
+
+
+def get_redis_connection() -> redis.Redis:
+    """
+    Returns a Redis client shared by the process for the features the Django cache API doesn't cover, such as locks,
+    atomic counters and Lua scripts.
+    """
+    global _connection
+
+    if _connection is None:
+        _connection = redis.Redis.from_url(settings.REDIS_URL)
+
+    return _connection
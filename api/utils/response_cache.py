@@ -0,0 +1,128 @@
+import json
+import time
+from functools import wraps
+from typing import Optional
+
+import structlog
+from django.conf import settings
+from django.db import transaction
+from django.utils.http import parse_etags
+from redis.exceptions import RedisError
+from rest_framework.response import Response
+from rest_framework.status import HTTP_200_OK, HTTP_304_NOT_MODIFIED
+from rest_framework.utils.encoders import JSONEncoder
+
+from api.utils.redis import get_redis_connection
+
+log = structlog.get_logger('api_requests')
+
+DATA_VERSION_KEY_PREFIX = 'data_version'
+RESPONSE_CACHE_KEY_PREFIX = 'response_cache'
+
+# returns the user's data version, incrementing it first if ARGV[1] is 1. A counter that has been lost starts over from
+# the current time in microseconds (ARGV[2]) rather than from 0, so that it can't repeat a version that responses were
+# cached under. The time is passed in, as Redis before 5 rejects writes in a script after a call to TIME
+DATA_VERSION_SCRIPT = """
+local version = redis.call('GET', KEYS[1])
+
+if not version then
+    version = ARGV[2]
+    redis.call('SET', KEYS[1], version)
+elseif ARGV[1] == '1' then
+    version = redis.call('INCR', KEYS[1])
+end
+
+return version
+"""
+
+
+def data_version_key(user_id) -> str:
+    return f'{DATA_VERSION_KEY_PREFIX}:{user_id}'
+
+
+def get_data_version(user_id, increment: bool = False) -> int:
+    return int(get_redis_connection().register_script(DATA_VERSION_SCRIPT)(
+        keys=[data_version_key(user_id)], args=[int(increment), time.time_ns() // 1000]
+    ))
+
+
+def bump_data_version(user_id) -> None:
+    """
+    Invalidates the user's cached responses once the current transaction commits, by moving their data version on.
+    """
+    def bump():
+        try:
+            get_data_version(user_id, increment=True)
+        except RedisError as e:
+            # the cached responses are served until they expire, so keep RESPONSE_CACHE_TTL short
+            log.error(event='bump_data_version', message=f'Could not bump data version: {e}')
+
+    transaction.on_commit(bump)
+
+
+def get_cached_response(connection, cache_key: str) -> Optional[bytes]:
+    try:
+        return connection.get(cache_key)
+    except RedisError as e:
+        log.error(event='versioned_response', message=f'Could not read cached response: {e}')
+        return None
+
+
+def cache_response(connection, cache_key: str, data) -> None:
+    try:
+        connection.set(cache_key, json.dumps(data, cls=JSONEncoder), ex=settings.RESPONSE_CACHE_TTL)
+    except RedisError as e:
+        log.error(event='versioned_response', message=f'Could not cache response: {e}')
+
+
+def versioned_response(scope: str, cache_data: bool = True):
+    """
+    Caches the responses of an authenticated view handler in Redis under the user's data version, which is bumped
+    whenever any of their data changes, so a cached response is never served once it's stale.
+
+    Responses carry an ``ETag`` of the data version, and requests whose ``If-None-Match`` matches it get a
+    304 Not Modified. Neither cached responses nor 304s touch the database.
+
+    Handlers whose responses shouldn't be stored in plain text can set ``cache_data`` to ``False`` to only get the
+    ``ETag`` handling.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            connection = get_redis_connection()
+
+            try:
+                # the version is read before the data so that data cached under it is never older than the version
+                version = get_data_version(request.user.id)
+            except RedisError as e:
+                log.error(event='versioned_response', message=f'Could not get data version: {e}')
+                return handler(view, request, *args, **kwargs)
+
+            etag = f'"{scope}-{version}"'
+
+            if etag in parse_etags(request.headers.get('If-None-Match', '')):
+                response = Response(status=HTTP_304_NOT_MODIFIED)
+            else:
+                cache_key = f'{RESPONSE_CACHE_KEY_PREFIX}:{scope}:{request.user.id}:{version}'
+                cached_data = get_cached_response(connection, cache_key) if cache_data else None
+
+                if cached_data is not None:
+                    response = Response(data=json.loads(cached_data), content_type='application/json')
+                else:
+                    response = handler(view, request, *args, **kwargs)
+
+                    if response.status_code != HTTP_200_OK:
+                        return response
+
+                    if cache_data:
+                        cache_response(connection, cache_key, response.data)
+
+            response['ETag'] = etag
+            # clients must revalidate with If-None-Match, which is cheap, rather than reuse a response that's stale
+            response['Cache-Control'] = 'private, no-cache'
+
+            return response
+
+        return wrapper
+
+    return decorator
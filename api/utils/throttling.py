@@ -0,0 +1,109 @@
+import time
+from typing import Optional, Tuple
+
+import structlog
+from django.conf import settings
+from redis.exceptions import RedisError
+from rest_framework.throttling import BaseThrottle
+
+from api.utils.redis import get_redis_connection
+
+log = structlog.get_logger('api_requests')
+
+THROTTLE_KEY_PREFIX = 'throttle'
+THROTTLE_PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Counts requests in fixed windows of a period each and weighs the oldest window by how much of it still overlaps the
+# sliding window, which approximates a sliding log without storing every request:
+# - over the last period, requests are allowed up to the limit plus the burst allowance
+# - over the last two periods, requests are capped at twice the limit, so the burst is only available to clients that
+#   have been under the limit and the sustained rate can't go over it
+# The current time is passed in, as Redis before 5 rejects writes in a script after a call to TIME
+SLIDING_WINDOW_SCRIPT = """
+local period = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+
+local window = math.floor(now / period)
+local overlap = 1 - (now - window * period) / period
+
+local current_key = KEYS[1] .. ':' .. window
+local current = tonumber(redis.call('GET', current_key) or '0')
+local previous = tonumber(redis.call('GET', KEYS[1] .. ':' .. (window - 1)) or '0')
+local oldest = tonumber(redis.call('GET', KEYS[1] .. ':' .. (window - 2)) or '0')
+
+local last_period = previous * overlap + current
+local last_two_periods = oldest * overlap + previous + current
+
+if last_period + 1 > limit + burst or last_two_periods + 1 > 2 * limit then
+    return {0, tostring((window + 1) * period - now)}
+end
+
+redis.call('INCR', current_key)
+redis.call('EXPIRE', current_key, period * 3)
+
+return {1, '0'}
+"""
+
+
+def parse_throttle_rate(rate: str) -> Tuple[int, int]:
+    """
+    Parses a ``<requests>/<period>`` rate, where the period is a number of seconds or one of s, m, h or d, optionally
+    prefixed by a multiplier (e.g. ``5/15m``).
+    """
+    requests, period = rate.split('/')
+    multiplier, unit = (period[:-1] or '1', period[-1]) if period[-1] in THROTTLE_PERIODS else (period, 's')
+
+    return int(requests), int(multiplier) * THROTTLE_PERIODS[unit]
+
+
+class SlidingWindowRateThrottle(BaseThrottle):
+    """
+    Throttles views by their ``throttle_scope``, per user or per IP address for anonymous requests, with the rates in
+    ``THROTTLE_RATES``. A view can override its scope's rate with ``throttle_rate`` and ``throttle_burst``.
+
+    Each check is a single atomic Lua script, see ``SLIDING_WINDOW_SCRIPT``. Requests are let through if Redis is
+    unavailable, rather than taking the API down with it.
+    """
+    def __init__(self):
+        self.retry_after: Optional[float] = None
+
+    def get_limits(self, view) -> Optional[Tuple[int, int, int]]:
+        scope = getattr(view, 'throttle_scope', None)
+        scope_limits = settings.THROTTLE_RATES.get(scope, {})
+        rate = getattr(view, 'throttle_rate', None) or scope_limits.get('rate')
+
+        if rate is None:
+            return None
+
+        limit, period = parse_throttle_rate(rate)
+        burst = getattr(view, 'throttle_burst', None)
+
+        return limit, period, scope_limits.get('burst', 0) if burst is None else burst
+
+    def allow_request(self, request, view):
+        limits = self.get_limits(view)
+
+        if limits is None:
+            return True
+
+        limit, period, burst = limits
+        scope = getattr(view, 'throttle_scope', None) or view.__class__.__name__
+        ident = request.user.pk if request.user and request.user.is_authenticated else self.get_ident(request)
+        key = f'{THROTTLE_KEY_PREFIX}:{scope}:{ident}'
+
+        try:
+            allowed, retry_after = get_redis_connection().register_script(SLIDING_WINDOW_SCRIPT)(
+                keys=[key], args=[period, limit, burst, time.time()]
+            )
+        except RedisError as e:
+            log.error(event='throttle', message=f'Could not check the throttle, letting the request through: {e}')
+            return True
+
+        self.retry_after = float(retry_after)
+
+        return bool(allowed)
+
+    def wait(self):
+        return self.retry_after
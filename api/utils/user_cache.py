@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import structlog
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from redis.exceptions import RedisError
+
+log = structlog.get_logger('api_requests')
+
+AUTHENTICATED_USER_KEY_PREFIX = 'authenticated_user'
+# only what authenticating and authorizing a request needs, so that the password hash and encrypted fields such as the
+# identification number never end up in Redis
+CACHED_USER_FIELDS = ('id', 'email', 'full_name', 'short_name', 'is_active', 'is_staff', 'is_superuser', 'last_login')
+
+
+class LocalUserCache(object):
+    """
+    A small thread-safe LRU of cached users kept in front of Redis by each process.
+
+    Other processes can't evict its entries when a user is saved, so they expire after ``AUTH_USER_LOCAL_CACHE_TTL``
+    seconds, which bounds how long a deactivated user can keep using an access token.
+    """
+    def __init__(self, max_size: int, ttl: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.users = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id: str):
+        with self.lock:
+            cached_user = self.users.get(user_id)
+
+            if cached_user is None:
+                return None
+
+            user, expiry = cached_user
+
+            if expiry < time.monotonic():
+                del self.users[user_id]
+                return None
+
+            self.users.move_to_end(user_id)
+
+            return user
+
+    def set(self, user_id: str, user: dict) -> None:
+        with self.lock:
+            self.users[user_id] = (user, time.monotonic() + self.ttl)
+            self.users.move_to_end(user_id)
+
+            while len(self.users) > self.max_size:
+                self.users.popitem(last=False)
+
+    def delete(self, user_id: str) -> None:
+        with self.lock:
+            self.users.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.users.clear()
+
+
+local_user_cache = LocalUserCache(settings.AUTH_USER_LOCAL_CACHE_SIZE, settings.AUTH_USER_LOCAL_CACHE_TTL)
+
+
+def authenticated_user_key(user_id) -> str:
+    return f'{AUTHENTICATED_USER_KEY_PREFIX}:{user_id}'
+
+
+def get_cached_user(user_id):
+    """
+    Returns the cached user, checking the process' LRU before Redis, or ``None`` if they aren't cached.
+
+    A new ``User`` is built from the cached fields for every request, so that changes made to the user while handling
+    one request don't leak into the next. The fields that aren't cached are deferred, and loaded from the database if
+    they're accessed.
+    """
+    user_id = f'{user_id}'
+    cached_user = local_user_cache.get(user_id)
+
+    if cached_user is None:
+        try:
+            cached_user = cache.get(authenticated_user_key(user_id))
+        except RedisError as e:
+            log.error(event='get_cached_user', message=f'Could not read cached user: {e}')
+            return None
+
+        if cached_user is None:
+            return None
+
+        local_user_cache.set(user_id, cached_user)
+
+    user_model = get_user_model()
+    # from_db expects the loaded fields in the order the model declares them
+    field_names = [field.attname for field in user_model._meta.concrete_fields if field.attname in cached_user]
+
+    return user_model.from_db(DEFAULT_DB_ALIAS, field_names, [cached_user[field] for field in field_names])
+
+
+def cache_user(user) -> None:
+    user_id = f'{user.pk}'
+    cached_user = {field: getattr(user, field) for field in CACHED_USER_FIELDS}
+    local_user_cache.set(user_id, cached_user)
+
+    try:
+        cache.set(authenticated_user_key(user_id), cached_user, timeout=settings.AUTH_USER_CACHE_TTL)
+    except RedisError as e:
+        log.error(event='cache_user', message=f'Could not cache user: {e}')
+
+
+def invalidate_cached_user(user_id) -> Optional[bool]:
+    user_id = f'{user_id}'
+    local_user_cache.delete(user_id)
+
+    try:
+        return cache.delete(authenticated_user_key(user_id))
+    except RedisError as e:
+        # the cached user expires after AUTH_USER_CACHE_TTL seconds, so keep that short
+        log.error(event='invalidate_cached_user', message=f'Could not invalidate cached user: {e}')
+        return None